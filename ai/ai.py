@@ -1,31 +1,129 @@
-from typing import Iterable
+import asyncio
+import time
+from typing import Any, Iterable, Iterator, Optional
 import openai
 from openai.types.chat.chat_completion import Choice
-from returns.result import safe
+from openai.types.chat.chat_completion_message import FunctionCall
+from openai.types.chat.chat_completion_message_tool_call import (
+    ChatCompletionMessageToolCall as ToolCall,
+    Function as ToolFunction,
+)
+from returns.result import Failure, Result, Success, safe
 from returns.maybe import maybe
 
-from ai.functions import Function, FunctionResult
+from ai.functions import Function, speculating, tool_message
 from exceptions import RequestLimitError
-from ai.context import Message, System, Assistant, ContextLoader
+from ai.context import Message, System, Assistant, User, ContextLoader
+from ai.response_cache import ResponseCache
 from ai.tasks import *
 from settings import Setting
-from utils import Stream
+from utils import SentenceSplitter, Stream
+import tracing
 
 
 class AI:
-    def __init__(self, context_loader: ContextLoader):
+    def __init__(
+        self,
+        context_loader: ContextLoader,
+        response_cache: Optional[ResponseCache] = None,
+        cache_scope: str = "",
+    ):
         self.context_loader = context_loader
+        self.response_cache = response_cache
+        # 컨텍스트가 다른 장치끼리 캐시된 응답을 나눠 쓰지 않도록 구분
+        self.cache_scope = cache_scope
+
+    @staticmethod
+    def prompt_of(messages: list[Message]) -> str:
+        return str(messages[-1].get("content") or "") if messages else ""
+
+    def cached(self, messages: list[Message]) -> Optional[str]:
+        if not self.response_cache:
+            return None
+        return self.response_cache.get(self.prompt_of(messages), self.cache_scope)
+
+    def remember(
+        self, messages: list[Message], response: str, function_calls: list[str]
+    ):
+        # 추측 요청은 최종 전사와 다를 수 있으므로 캐시하지 않음
+        if speculating.get():
+            return
+        # now() 처럼 캐시할 수 없는 함수의 결과가 들어간 응답은 캐시하지 않음
+        if self.response_cache and response and Function.all_cacheable(function_calls):
+            # cache_ttl 함수의 결과가 들어간 응답은 그 ttl까지만 씀
+            self.response_cache.put(
+                self.prompt_of(messages),
+                response,
+                Function.min_cache_ttl(function_calls),
+                self.cache_scope,
+            )
+
+    def stats(self) -> dict[str, Any]:
+        """로그로 남길 응답 캐시 통계"""
+        return self.response_cache.stats() if self.response_cache else {}
 
     def runner(self, messages: Iterable[Message]) -> str: ...
 
+    async def arunner(self, messages: Iterable[Message]) -> str:
+        return await asyncio.to_thread(self.runner, messages)
+
+    def streamer(self, messages: Iterable[Message]) -> Iterator[str]:
+        yield self.runner(messages)
+
     @safe
     def run(self, message: str):
         executor = self.context_loader.run(self.runner)
         return executor(message)
 
+    def stream(self, message: str) -> Iterator[str]:
+        """응답을 완성된 문장 단위로 생성합니다. 컨텍스트는 응답이 끝난 뒤 저장됩니다."""
+        executor = self.context_loader.stream(self.streamer)
+        return executor(message)
+
+    async def arun(self, message: str) -> Result[str, Exception]:
+        executor = self.context_loader.arun(self.arunner)
+        try:
+            return Success(await executor(message))
+        except Exception as e:
+            return Failure(e)
+
     @classmethod
-    def ChatGPT(cls) -> "AI":
-        return ChatGPT(ContextLoader.JsonLoader())
+    def ChatGPT(
+        cls,
+        context_loader: ContextLoader | None = None,
+        response_cache: Optional[ResponseCache] = None,
+        cache_scope: str = "",
+    ) -> "AI":
+        return ChatGPT(
+            context_loader or ContextLoader.JsonLoader(), response_cache, cache_scope
+        )
+
+
+def tool_options(messages: Iterable[Message]) -> dict:
+    """요청에 붙일 도구 목록. FUNCTION_FILTER가 켜져 있으면 마지막 사용자 발화와 관련된 함수만 보냄"""
+    prompt = None
+    if Setting.FUNCTION_FILTER:
+        users = [m for m in messages if m["role"] == "user"]
+        prompt = str(users[-1].get("content") or "") if users else ""
+    tools = Function.get_tools(prompt)
+    return dict(tools=tools, tool_choice="auto") if tools else {}
+
+
+def run_tool_calls(calls: list[ToolCall]) -> list[Message]:
+    """한 턴의 도구 호출을 동시에 실행하고 assistant 메시지와 결과 메시지들을 만듭니다."""
+    names = [call.function.name for call in calls]
+    with tracing.span("chat_tools", functions=names):
+        results = Function.call_many(
+            [
+                FunctionCall(name=c.function.name, arguments=c.function.arguments)
+                for c in calls
+            ]
+        )
+    assist_message = Assistant(tool_calls=[call.model_dump() for call in calls])
+    return [
+        assist_message,
+        *(tool_message(call.id, result) for call, result in zip(calls, results)),
+    ]
 
 
 # 챗지피티 리커시브 리스폰스 클래스를 만들어서 runner분리
@@ -38,41 +136,194 @@ class ChatGPTResponseSession:
         self.client = openai_loader()
         self.request_limit = request_limit
         self.request_count = 0
+        self.function_calls: list[str] = []
 
     @maybe
-    def function_call(self, choice: Choice, messages: Iterable[Message]):
-        if choice.finish_reason != "function_call":
-            return
-        if choice.message.function_call == None:
+    def tool_call(self, choice: Choice, messages: Iterable[Message]):
+        if not choice.message.tool_calls:
             return
-        call = choice.message.function_call
-        result = Function.function_call(call)
-        assist_message = Assistant(function_call=call.model_dump())
-        result_message = result.map(FunctionResult.to_message).unwrap()
-        return self.recursive_response([*messages, assist_message, result_message])
+        calls = choice.message.tool_calls
+        self.function_calls.extend(call.function.name for call in calls)
+        return self.recursive_response([*messages, *run_tool_calls(calls)])
 
     def recursive_response(self, messages: Iterable[Message]) -> str:
         if self.request_limit < self.request_count:
             raise RequestLimitError
+        with tracing.span("chat_request", depth=self.request_count):
+            response = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                **tool_options(messages),
+            )
+        choice = response.choices[0]
+        content = (choice.message.content or "").strip()
+        self.request_count += 1
+        return self.tool_call(choice, messages).value_or(content)
+
+    def run(self, messages: Iterable[Message]) -> str:
+        total_context: list[Message] = [
+            System(content="You are a helpful assistant"),
+        ]
+        total_context.extend(messages)
+        return self.recursive_response(total_context)
+
+    def stream_response(self, messages: Iterable[Message]) -> Iterator[str]:
+        if self.request_limit < self.request_count:
+            raise RequestLimitError
+        started = time.monotonic()
         response = self.client.chat.completions.create(
             model=self.model_name,
             messages=messages,
-            function_call="auto",
-            functions=list(map(lambda x: x.dict(), Function.get_functions())),
+            **tool_options(messages),
+            stream=True,
         )
+        depth = self.request_count
+        self.request_count += 1
+        splitter = SentenceSplitter()
+        # 도구 호출은 index별로 id, 이름, 인자가 조각으로 나뉘어 오므로 누적
+        parts: dict[int, dict[str, str]] = {}
+        first = True
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            if first:
+                first = False
+                tracing.add("chat_first_token", started, time.monotonic(), depth=depth)
+            delta = chunk.choices[0].delta
+            for tool_call in delta.tool_calls or []:
+                part = parts.setdefault(
+                    tool_call.index, dict(id="", name="", arguments="")
+                )
+                part["id"] += tool_call.id or ""
+                if tool_call.function:
+                    part["name"] += tool_call.function.name or ""
+                    part["arguments"] += tool_call.function.arguments or ""
+            if delta.content:
+                yield from splitter.feed(delta.content)
+        yield from splitter.flush()
+        tracing.add("chat_request", started, time.monotonic(), depth=depth)
+        calls = [
+            ToolCall(
+                id=part["id"],
+                type="function",
+                function=ToolFunction(
+                    name=part["name"], arguments=part["arguments"] or "{}"
+                ),
+            )
+            for _, part in sorted(parts.items())
+            if part["name"]
+        ]
+        if not calls:
+            return
+        self.function_calls.extend(call.function.name for call in calls)
+        yield from self.stream_response([*messages, *run_tool_calls(calls)])
+
+    def stream(self, messages: Iterable[Message]) -> Iterator[str]:
+        total_context: list[Message] = [
+            System(content="You are a helpful assistant"),
+        ]
+        total_context.extend(messages)
+        return self.stream_response(total_context)
+
+
+class AsyncChatGPTResponseSession:
+    """ChatGPTResponseSession의 asyncio 버전"""
+
+    model_name = Setting.CHAT_GPT_MODEL_NAME
+
+    def __init__(self, request_limit: int = 3):
+        from client_loaders import async_openai_loader
+
+        self.client = async_openai_loader(asyncio.get_running_loop())
+        self.request_limit = request_limit
+        self.request_count = 0
+        self.function_calls: list[str] = []
+
+    async def tool_call(
+        self, choice: Choice, messages: Iterable[Message]
+    ) -> Optional[str]:
+        if not choice.message.tool_calls:
+            return None
+        calls = choice.message.tool_calls
+        self.function_calls.extend(call.function.name for call in calls)
+        results = await asyncio.to_thread(run_tool_calls, calls)
+        return await self.recursive_response([*messages, *results])
+
+    async def recursive_response(self, messages: Iterable[Message]) -> str:
+        if self.request_limit < self.request_count:
+            raise RequestLimitError
+        with tracing.span("chat_request", depth=self.request_count):
+            response = await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                **tool_options(messages),
+            )
         choice = response.choices[0]
         content = (choice.message.content or "").strip()
         self.request_count += 1
-        return self.function_call(choice, messages).value_or(content)
+        result = await self.tool_call(choice, messages)
+        return content if result is None else result
 
-    def run(self, messages: Iterable[Message]) -> str:
+    async def run(self, messages: Iterable[Message]) -> str:
         total_context: list[Message] = [
             System(content="You are a helpful assistant"),
         ]
         total_context.extend(messages)
-        return self.recursive_response(total_context)
+        return await self.recursive_response(total_context)
+
+
+def summarize_conversation(summary: str, messages: list[Message]) -> str:
+    """예산 밖으로 밀려난 메시지를 기존 요약에 이어 붙여 요약을 갱신합니다."""
+    from client_loaders import openai_loader
+
+    transcript = "\n".join(
+        f"{message['role']}: {message.get('content') or ''}" for message in messages
+    )
+    response = openai_loader().chat.completions.create(
+        model=Setting.CHAT_GPT_MODEL_NAME,
+        messages=[
+            System(
+                content="Update the running summary of a conversation with the new "
+                "messages. Keep it brief and write it in the conversation's language."
+            ),
+            User(
+                content=f"Summary so far:\n{summary or '(none)'}\n\n"
+                f"New messages:\n{transcript}"
+            ),
+        ],
+    )
+    return (response.choices[0].message.content or summary).strip()
 
 
 class ChatGPT(AI):
     def runner(self, messages: Iterable[Message]) -> str:
-        return ChatGPTResponseSession(Setting.CHAT_LIMIT_PER_SESSION).run(messages)
+        messages = list(messages)
+        if (cached := self.cached(messages)) is not None:
+            return cached
+        session = ChatGPTResponseSession(Setting.CHAT_LIMIT_PER_SESSION)
+        response = session.run(messages)
+        self.remember(messages, response, session.function_calls)
+        return response
+
+    def streamer(self, messages: Iterable[Message]) -> Iterator[str]:
+        messages = list(messages)
+        if (cached := self.cached(messages)) is not None:
+            splitter = SentenceSplitter()
+            yield from splitter.feed(cached)
+            yield from splitter.flush()
+            return
+        session = ChatGPTResponseSession(Setting.CHAT_LIMIT_PER_SESSION)
+        sentences = []
+        for sentence in session.stream(messages):
+            sentences.append(sentence)
+            yield sentence
+        self.remember(messages, " ".join(sentences), session.function_calls)
+
+    async def arunner(self, messages: Iterable[Message]) -> str:
+        messages = list(messages)
+        if (cached := self.cached(messages)) is not None:
+            return cached
+        session = AsyncChatGPTResponseSession(Setting.CHAT_LIMIT_PER_SESSION)
+        response = await session.run(messages)
+        self.remember(messages, response, session.function_calls)
+        return response
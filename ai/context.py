@@ -1,22 +1,31 @@
-from collections import deque
+from bisect import bisect_left
+from collections import OrderedDict, deque
 from functools import partial
 import json
-from typing import Any, Callable, Iterable, Union
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Iterable, Iterator, Union
 from openai.types.chat import (
     ChatCompletionSystemMessageParam as _System,
     ChatCompletionAssistantMessageParam as _Assistant,
     ChatCompletionUserMessageParam as _User,
     ChatCompletionFunctionMessageParam as _FunctionM,
+    ChatCompletionToolMessageParam as _ToolM,
     ChatCompletionMessage,
 )
 from returns.maybe import Maybe, maybe
+from returns.pipeline import is_successful
 from returns.result import safe, attempt, Success, Result
 
 User = partial(_User, role="user")
 System = partial(_System, role="system")
 Assistant = partial(_Assistant, role="assistant")
 FunctionM = partial(_FunctionM, role="function")
-Message = Union[_User, _System, _Assistant, _FunctionM]
+ToolM = partial(_ToolM, role="tool")
+Message = Union[_User, _System, _Assistant, _FunctionM, _ToolM]
+
+logger = logging.getLogger("Secretary")
 
 
 class ContextLoader:
@@ -26,26 +35,80 @@ class ContextLoader:
     def if_load_failed(self) -> list[Message]: ...
     def save_context(self, message: Message): ...
 
+    def save_contexts(self, messages: Iterable[Message]):
+        for message in messages:
+            self.save_context(message)
+
     def get_context(self) -> list[Message]:
         return self.load_context().lash(self.__class__.if_load_failed).unwrap()
 
+    def prepare(self, prompt: str) -> list[Message]:
+        """저장하지 않고 prompt를 붙인 요청 메시지만 만듭니다."""
+        # 로더가 내부 저장소를 그대로 돌려줘도 요청용 메시지가 섞이지 않도록 복사
+        context = list(self.get_context())
+        context.append(User(content=prompt))
+        return context
+
+    def commit(self, prompt: str, response: str):
+        self.save_contexts([User(content=prompt), Assistant(content=response)])
+
     def run(self, func: Callable[[list[Message]], str]):
         def inner(prompt: str) -> str:
-            user_message = User(content=prompt)
-            context = self.get_context()
-            context.append(user_message)
             # AI 응답 생성
-            result = func(context)
+            result = func(self.prepare(prompt))
             # 응답 저장
-            self.save_context(user_message)
-            self.save_context(Assistant(content=result))
+            self.commit(prompt, result)
             return result
 
         return inner
 
+    def arun(self, func: Callable[[list[Message]], Awaitable[str]]):
+        async def inner(prompt: str) -> str:
+            # AI 응답 생성
+            result = await func(self.prepare(prompt))
+            # 응답 저장
+            self.commit(prompt, result)
+            return result
+
+        return inner
+
+    def stream(self, func: Callable[[list[Message]], Iterator[str]]):
+        def inner(prompt: str) -> Iterator[str]:
+            sentences = []
+            # AI 응답을 문장 단위로 전달
+            for sentence in func(self.prepare(prompt)):
+                sentences.append(sentence)
+                yield sentence
+            # 응답이 끝까지 생성된 경우에만 저장
+            self.commit(prompt, " ".join(sentences))
+
+        return inner
+
+    @classmethod
+    def JsonLoader(cls, file_name: str = "context.json"):
+        return JsonContextLoader(file_name)
+
+    @classmethod
+    def JsonlLoader(
+        cls,
+        file_name: str = "context.jsonl",
+        legacy_file_name: str | None = None,
+        limit: int = 10,
+    ):
+        return JsonlContextLoader(
+            file_name, limit=limit, legacy_file_name=legacy_file_name
+        )
+
     @classmethod
-    def JsonLoader(cls):
-        return JsonContextLoader("context.json")
+    def BudgetedLoader(
+        cls,
+        store: "ContextLoader",
+        budget: int,
+        summarizer: "Summarizer",
+        counter: "TokenCounter",
+        summary_file: str | None = None,
+    ):
+        return BudgetedContextLoader(store, budget, summarizer, counter, summary_file)
 
     @classmethod
     def InmemoryLoader(cls):
@@ -79,6 +142,357 @@ class JsonContextLoader(ContextLoader):
             json.dump(data, f, indent=2)
 
 
+class JsonlContextLoader(ContextLoader):
+    """
+    메시지를 한 줄씩 덧붙이기만 하는 JSONL 로그.
+    각 줄의 시작 위치를 인덱스로 들고 있어서 저장은 O(1), 최근 limit개 읽기는 O(limit)입니다.
+    줄 수가 compact_threshold를 넘으면 최근 keep줄만 남기도록 백그라운드에서 압축합니다.
+    읽을 수 없는 줄은 건너뛰므로 한 줄이 깨져도 나머지 기록은 남습니다.
+    """
+
+    def __init__(
+        self,
+        file_name: str,
+        limit: int = 10,
+        compact_threshold: int = 1000,
+        keep: int = 200,
+        legacy_file_name: str | None = None,
+    ):
+        self.file_name = file_name
+        self.limit = limit
+        self.compact_threshold = compact_threshold
+        self.keep = max(keep, limit)
+        self.lock = threading.Lock()
+        self.offsets: list[int] = []
+        self.end = 0
+        self.compactor: threading.Thread | None = None
+        if legacy_file_name and not os.path.exists(file_name):
+            self.migrate(legacy_file_name)
+        self.build_index()
+
+    def migrate(self, legacy_file_name: str):
+        # 기존 context.json이 있으면 최근 keep개를 옮겨 옴
+        if not os.path.exists(legacy_file_name):
+            return
+        try:
+            with open(legacy_file_name, "r", encoding="utf-8") as f:
+                data: list[Any] = json.load(f)
+            if not isinstance(data, list):
+                raise ValueError(f"expected a list, got {type(data).__name__}")
+        except (ValueError, OSError) as e:
+            # 깨진 기록은 옆으로 치워 두고 빈 기록으로 시작
+            logger.warning(f"{legacy_file_name}: not migrating broken context: {e!r}")
+            try:
+                os.replace(legacy_file_name, legacy_file_name + ".broken")
+            except OSError:
+                pass
+            return
+        self.write_atomic(b"".join(map(self.encode, data[-self.keep :])))
+
+    @staticmethod
+    def encode(message: Message) -> bytes:
+        return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def build_index(self):
+        if not os.path.exists(self.file_name):
+            open(self.file_name, "wb").close()
+        offsets, position = [], 0
+        with open(self.file_name, "rb+") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # 쓰는 도중 종료되어 잘린 마지막 줄은 버림
+                    f.truncate(position)
+                    break
+                offsets.append(position)
+                position += len(line)
+        self.offsets, self.end = offsets, position
+
+    def write_atomic(self, data: bytes):
+        temp = self.file_name + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.file_name)
+
+    @attempt
+    def load_context(self) -> list[Message]:
+        with self.lock:
+            offsets = self.offsets[-self.limit :]
+            if not offsets:
+                return []
+            with open(self.file_name, "rb") as f:
+                f.seek(offsets[0])
+                data = f.read(self.end - offsets[0])
+        messages = []
+        for line in data.splitlines():
+            try:
+                messages.append(json.loads(line))
+            except ValueError as e:
+                logger.warning(f"{self.file_name}: skipping broken line: {e!r}")
+        return messages
+
+    @attempt
+    def if_load_failed(self) -> list[Message]:
+        # 파일이 지워졌거나 바뀌었으면 기록을 지우지 않고 인덱스만 다시 만듦
+        with self.lock:
+            self.build_index()
+        return []
+
+    def save_context(self, message: Message):
+        self.save_contexts([message])
+
+    def save_contexts(self, messages: Iterable[Message]):
+        lines = list(map(self.encode, messages))
+        with self.lock:
+            # 한 번의 write로 덧붙이므로 한 턴의 메시지가 함께 기록됨
+            with open(self.file_name, "ab") as f:
+                f.write(b"".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            for line in lines:
+                self.offsets.append(self.end)
+                self.end += len(line)
+            if len(self.offsets) > self.compact_threshold and not self.compactor:
+                self.compactor = threading.Thread(target=self.compact, daemon=True)
+                self.compactor.start()
+
+    def compact(self):
+        with self.lock:
+            start, end = self.offsets[-self.keep], self.end
+        # 복사는 잠금 밖에서 하고, 그동안 덧붙은 줄만 잠금 안에서 옮긴 뒤 바꿔치기
+        temp = self.file_name + ".tmp"
+        with open(self.file_name, "rb") as source, open(temp, "wb") as f:
+            source.seek(start)
+            f.write(source.read(end - start))
+        with self.lock:
+            with open(self.file_name, "rb") as source, open(temp, "ab") as f:
+                source.seek(end)
+                f.write(source.read(self.end - end))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.file_name)
+            first = bisect_left(self.offsets, start)
+            self.offsets = [offset - start for offset in self.offsets[first:]]
+            self.end -= start
+            self.compactor = None
+
+
+Summarizer = Callable[[str, list[Message]], str]
+
+
+class TokenCounter:
+    """
+    메시지별 토큰 수를 세고 내용 기준으로 최근 max_entries개까지 캐시합니다.
+    tiktoken이 없으면 글자 수로 근사합니다. (한국어는 대략 글자당 1토큰)
+    """
+
+    MESSAGE_OVERHEAD = 4
+
+    def __init__(self, model_name: str, max_entries: int = 1024):
+        self.cache = OrderedDict[str, int]()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        try:
+            import tiktoken
+
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            self.encoding = None
+
+    def count_text(self, text: str) -> int:
+        if self.encoding is None:
+            return len(text)
+        return len(self.encoding.encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """뒤쪽 max_tokens 토큰만 남깁니다."""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is None:
+            return text[-max_tokens:]
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[-max_tokens:])
+
+    def count(self, message: Message) -> int:
+        key = json.dumps(message, ensure_ascii=False, sort_keys=True)
+        with self.lock:
+            if (cached := self.cache.get(key)) is not None:
+                self.cache.move_to_end(key)
+                return cached
+        cached = self.MESSAGE_OVERHEAD + self.count_text(key)
+        with self.lock:
+            self.cache[key] = cached
+            if len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return cached
+
+
+class BudgetedContextLoader(ContextLoader):
+    """
+    최근 대화를 토큰 예산 안에서 최대한 채우고, 예산 밖으로 밀려난 대화는
+    이전 요약에 이어 붙여 요약을 갱신합니다. 요약은 백그라운드에서 돌며
+    새로 밀려난 메시지만 summarizer에 넘기므로 매번 전체를 다시 요약하지 않습니다.
+    요약 파일에는 지금까지 저장한 메시지 수(saved)와 요약에 포함된 메시지 수(summarized)를
+    함께 기록해서, 다시 시작해도 이미 요약한 메시지는 다시 요약하지 않습니다.
+    요약은 예산의 1/4까지만 쓰고, 예산이 모자라도 마지막 대화 한 쌍은 남깁니다.
+    """
+
+    def __init__(
+        self,
+        store: ContextLoader,
+        budget: int,
+        summarizer: Summarizer,
+        counter: TokenCounter,
+        summary_file: str | None = None,
+    ):
+        self.store = store
+        self.budget = budget
+        self.summary_budget = budget // 4
+        self.summarizer = summarizer
+        self.counter = counter
+        self.summary_file = summary_file
+        self.lock = threading.Lock()
+        self.file_lock = threading.Lock()
+        # 아직 요약에 포함되지 않은 메시지
+        self.history: list[Message] | None = None
+        self.pending: list[Message] = []
+        self.summarizing = False
+        self.summary = ""
+        # 처음부터 센 메시지 번호 기준. saved가 None이면 이전 형식의 요약 파일
+        self.saved: int | None = None
+        self.summarized = 0
+        self.load_summary()
+
+    def load_summary(self):
+        if not self.summary_file or not os.path.exists(self.summary_file):
+            self.saved = 0
+            return
+        try:
+            with open(self.summary_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError(f"expected an object, got {type(data).__name__}")
+        except (ValueError, OSError) as e:
+            # 요약이 없는 것으로 보고 불러온 메시지를 모두 요약 전으로 다룸
+            logger.warning(f"{self.summary_file}: ignoring broken summary: {e!r}")
+            return
+        self.summary = self.cap(data.get("summary", ""))
+        self.saved = data.get("saved")
+        self.summarized = data.get("summarized", 0)
+
+    def cap(self, summary: str) -> str:
+        return self.counter.truncate(summary, self.summary_budget)
+
+    def unsummarized(self, messages: list[Message]) -> list[Message]:
+        """저장소의 최근 메시지 중 요약에 포함되지 않은 것만 남깁니다."""
+        if self.saved is None:
+            # 이전 형식이면 불러온 메시지를 모두 요약 전으로 봄
+            self.saved, self.summarized = len(messages), 0
+            return messages
+        first = self.saved - len(messages)
+        return messages[max(0, self.summarized - first) :]
+
+    def summary_message(self) -> list[Message]:
+        if not self.summary:
+            return []
+        return [System(content=f"Summary of the earlier conversation: {self.summary}")]
+
+    @attempt
+    def load_context(self) -> list[Message]:
+        with self.lock:
+            if self.history is None:
+                self.history = self.unsummarized(list(self.store.get_context()))
+            summary = self.summary_message()
+            budget = self.budget - sum(map(self.counter.count, summary))
+            # 최신 메시지부터 예산이 허락하는 만큼 채움
+            start, used = len(self.history), 0
+            for message in reversed(self.history):
+                used += self.counter.count(message)
+                if used > budget:
+                    break
+                start -= 1
+            # 예산을 넘더라도 마지막 사용자 메시지부터는 남김
+            last = self.last_exchange(self.history)
+            start = min(start, last)
+            evicted, self.history = self.history[:start], self.history[start:]
+            context = summary + self.history
+        if evicted:
+            self.fold(evicted)
+        return context
+
+    @staticmethod
+    def last_exchange(messages: list[Message]) -> int:
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i]["role"] == "user":
+                return i
+        return max(0, len(messages) - 2)
+
+    @attempt
+    def if_load_failed(self) -> list[Message]:
+        with self.lock:
+            self.history = []
+        return []
+
+    def save_context(self, message: Message):
+        self.save_contexts([message])
+
+    def save_contexts(self, messages: Iterable[Message]):
+        messages = list(messages)
+        self.store.save_contexts(messages)
+        with self.lock:
+            if self.history is not None:
+                self.history.extend(messages)
+            if self.saved is not None:
+                self.saved += len(messages)
+        self.save_summary()
+
+    def fold(self, messages: list[Message]):
+        with self.lock:
+            self.pending.extend(messages)
+            if self.summarizing:
+                return
+            self.summarizing = True
+        threading.Thread(target=self.summarize_pending, daemon=True).start()
+
+    def summarize_pending(self):
+        while True:
+            with self.lock:
+                messages, self.pending = self.pending, []
+                if not messages:
+                    self.summarizing = False
+                    return
+                summary = self.summary
+            result = safe(self.summarizer)(summary, messages)
+            with self.lock:
+                if not is_successful(result):
+                    # 실패하면 버리지 않고 다음 fold에서 다시 요약
+                    self.pending = messages + self.pending
+                    self.summarizing = False
+                    return
+                self.summary = self.cap(result.unwrap())
+                self.summarized += len(messages)
+            self.save_summary()
+
+    def save_summary(self):
+        if not self.summary_file:
+            return
+        with self.file_lock:
+            with self.lock:
+                data = dict(
+                    summary=self.summary, saved=self.saved, summarized=self.summarized
+                )
+            temp = self.summary_file + ".tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp, self.summary_file)
+
+
 class InmemoryContextLoader(ContextLoader):
     def __init__(self, max_len: int):
         self.context = deque([], maxlen=max_len)
@@ -1,41 +1,110 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextvars import ContextVar
+from enum import Enum
 import inspect
 import json
+import threading
+import time
+import types
 from returns.maybe import Maybe, maybe
-from typing import Callable, Generic, ParamSpec, TypeVar, Union
+from typing import (
+    Any,
+    Callable,
+    Generic,
+    Iterable,
+    Literal,
+    Optional,
+    ParamSpec,
+    TypeVar,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+    is_typeddict,
+)
 from openai.types.chat.completion_create_params import Function as FunctionDict
 from openai.types.chat.chat_completion_message import FunctionCall
-from openai.types.chat import ChatCompletionFunctionMessageParam as FunctionM
+from openai.types.chat import (
+    ChatCompletionFunctionMessageParam as FunctionM,
+    ChatCompletionToolMessageParam as ToolM,
+    ChatCompletionToolParam as ToolDict,
+)
+
+from exceptions import SpeculationAborted
 
 T = TypeVar("T")
 P = ParamSpec("P")
 
+# 추측 요청 중에는 결과를 버려도 되는(캐시 가능한) 함수만 실행함
+speculating = ContextVar("speculating", default=False)
+
+
+def literal_type(values: Iterable[Any]) -> dict:
+    kinds = {type(value) for value in values}
+    if len(kinds) != 1:
+        return {}
+    return annotation_schema(kinds.pop())
+
+
+def annotation_schema(annotation: Any) -> dict:
+    """타입 어노테이션을 JSON Schema로 바꿉니다. 모르는 타입은 문자열로 처리합니다."""
+    origin, args = get_origin(annotation), get_args(annotation)
+    if annotation is bool:
+        return {"type": "boolean"}
+    if annotation is int:
+        return {"type": "integer"}
+    if annotation is float:
+        return {"type": "number"}
+    if annotation is str:
+        return {"type": "string"}
+    if inspect.isclass(annotation) and issubclass(annotation, Enum):
+        values = [member.value for member in annotation]
+        return {**literal_type(values), "enum": values}
+    if is_typeddict(annotation):
+        hints = get_type_hints(annotation)
+        return {
+            "type": "object",
+            "properties": {
+                key: annotation_schema(value) for key, value in hints.items()
+            },
+            "required": [key for key in hints if key in annotation.__required_keys__],
+        }
+    if origin is Literal:
+        return {**literal_type(args), "enum": list(args)}
+    if origin in (Union, types.UnionType):
+        options = [arg for arg in args if arg is not type(None)]
+        # Optional[X]는 X로 취급하고 필수 여부는 기본값으로 판단
+        if len(options) == 1:
+            return annotation_schema(options[0])
+        return {"anyOf": [annotation_schema(arg) for arg in options]}
+    if annotation in (list, tuple, set) or origin in (list, tuple, set):
+        schema: dict = {"type": "array"}
+        if args and args[0] is not Ellipsis:
+            schema.update(items=annotation_schema(args[0]))
+        return schema
+    if annotation is dict or origin is dict:
+        return {"type": "object"}
+    return {"type": "string"}  # 기본값: 문자열로 처리
+
 
 def generate_parameters_from_function(func: Callable[P, T], **descriptions: str):
     """
     함수의 매개변수를 기반으로 OpenAI functions의 parameters를 자동 생성합니다.
     """
     signature = inspect.signature(func)
+    try:
+        hints = get_type_hints(func)
+    except Exception:
+        hints = {}
     properties = {}
     required = []
 
     for name, param in signature.parameters.items():
-        param_type = param.annotation
-        param_default = param.default
-
-        # 기본 데이터 타입 처리
-        if param_type == str:
-            param_schema = {"type": "string"}
-        elif param_type == int:
-            param_schema = {"type": "integer"}
-        elif param_type == float:
-            param_schema = {"type": "number"}
-        elif param_type == bool:
-            param_schema = {"type": "boolean"}
-        else:
-            param_schema = {"type": "string"}  # 기본값: 문자열로 처리
+        param_schema = annotation_schema(hints.get(name, param.annotation))
 
         # 매개변수 기본값이 없으면 필수(required)에 추가
-        if param_default == inspect.Parameter.empty:
+        if param.default == inspect.Parameter.empty:
             required.append(name)
         if description := descriptions.get(name, None):
             param_schema.update(description=description)
@@ -48,12 +117,46 @@ def generate_parameters_from_function(func: Callable[P, T], **descriptions: str)
 
 class Function(Generic[P, T]):
     functions: "dict[str, Function]" = dict()
+    # (함수 이름, 인자 JSON) -> (만료 시각, 결과), 최근 max_memo_entries개까지
+    memo = OrderedDict[tuple[str, str], tuple[float, Any]]()
+    memo_lock = threading.Lock()
+    max_memo_entries = 1024
+    max_workers = 8
+    default_timeout = 10.0
+    executor: Optional[ThreadPoolExecutor] = None
+    # 함수가 등록될 때마다 올라가며, 컴파일된 도구 스키마를 무효화함
+    version = 0
+    compiled: "tuple[int, tuple[tuple[Function, ToolDict], ...]]" = (-1, ())
 
-    def __init__(self, function: Callable[P, T], **descriptions: str):
+    def __init__(
+        self,
+        function: Callable[P, T],
+        pure: bool = False,
+        cache_ttl: Optional[float] = None,
+        timeout: Optional[float] = None,
+        keywords: Iterable[str] = (),
+        **descriptions: str,
+    ):
         self.name = function.__name__
         self.function = function
         self.parameters = generate_parameters_from_function(function, **descriptions)
+        # pure: 인자가 같으면 결과가 항상 같음, cache_ttl: 그 시간 동안은 같은 결과를 써도 됨
+        self.pure = pure
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout or self.default_timeout
+        # 프롬프트에 이 중 하나가 있을 때만 보냄. 비어 있으면 항상 보냄
+        self.keywords = tuple(map(self.compact, keywords))
+        try:
+            hints = get_type_hints(function)
+        except Exception:
+            hints = {}
+        self.enums = {
+            name: hint
+            for name, hint in hints.items()
+            if inspect.isclass(hint) and issubclass(hint, Enum)
+        }
         self.functions[self.name] = self
+        Function.version += 1
 
     def __call__(self, *args: P.args, **kwargs: P.kwargs):
         return self.function(*args, **kwargs)
@@ -64,26 +167,144 @@ class Function(Generic[P, T]):
     def __repr__(self) -> str:
         return self.__str__()
 
+    @property
+    def cacheable(self) -> bool:
+        return self.pure or self.cache_ttl is not None
+
     @classmethod
-    def register(cls, **descriptions: str):
+    def register(
+        cls,
+        pure: bool = False,
+        cache_ttl: Optional[float] = None,
+        timeout: Optional[float] = None,
+        keywords: Iterable[str] = (),
+        **descriptions: str,
+    ):
         def function_wrapper(function: Callable[P, T]):
-            return cls(function, **descriptions)
+            return cls(function, pure, cache_ttl, timeout, keywords, **descriptions)
 
         return function_wrapper
 
+    @classmethod
+    def all_cacheable(cls, names: Iterable[str]) -> bool:
+        """호출된 함수가 모두 캐시 가능한지. 모르는 함수가 있으면 False"""
+        return all(
+            name in cls.functions and cls.functions[name].cacheable for name in names
+        )
+
+    @classmethod
+    def min_cache_ttl(cls, names: Iterable[str]) -> Optional[float]:
+        """호출된 cache_ttl 함수 중 가장 짧은 ttl. 모두 pure이면 None"""
+        ttls = [
+            cls.functions[name].cache_ttl
+            for name in names
+            if name in cls.functions and not cls.functions[name].pure
+        ]
+        return min((ttl for ttl in ttls if ttl is not None), default=None)
+
+    def coerce(self, args: dict) -> dict:
+        # Enum 매개변수는 값으로 넘어오므로 멤버로 바꿈
+        return {
+            name: self.enums[name](value) if name in self.enums else value
+            for name, value in args.items()
+        }
+
+    def memoized(self, args: dict) -> T:
+        if not self.cacheable:
+            return self(**self.coerce(args))
+        key = (self.name, json.dumps(args, sort_keys=True, ensure_ascii=False))
+        with self.memo_lock:
+            if (cached := self.memo.get(key)) is not None:
+                if cached[0] > time.monotonic():
+                    self.memo.move_to_end(key)
+                    return cached[1]
+                del self.memo[key]
+        result = self(**self.coerce(args))
+        expires_at = float("inf") if self.pure else time.monotonic() + self.cache_ttl
+        with self.memo_lock:
+            self.memo[key] = (expires_at, result)
+            self.memo.move_to_end(key)
+            if len(self.memo) > self.max_memo_entries:
+                self.memo.popitem(last=False)
+        return result
+
     @classmethod
     def function_call(cls, call: FunctionCall):
         name = call.name
 
-        args: dict = json.loads(call.arguments)
+        args: dict = json.loads(call.arguments or "{}")
         print(f"function {name} called with {args}")
         function = Maybe.from_optional(cls.functions.get(name, None))
-        return function.map(lambda x: FunctionResult(x, x(**args)))
+        return function.map(lambda x: FunctionResult(x, x.memoized(args)))
+
+    @classmethod
+    def call_many(cls, calls: list[FunctionCall]) -> list[str]:
+        """
+        한 턴에 요청된 함수들을 스레드 풀에서 동시에 실행하고 결과를 요청 순서대로 돌려줍니다.
+        함수별 timeout을 넘기거나 실패한 호출은 오류 문자열을 결과로 씁니다.
+        (시간이 초과된 스레드 자체는 멈출 수 없어 끝날 때까지 풀에 남습니다.)
+        """
+        if speculating.get() and not cls.all_cacheable(call.name for call in calls):
+            raise SpeculationAborted
+        if cls.executor is None:
+            cls.executor = ThreadPoolExecutor(
+                cls.max_workers, thread_name_prefix="function"
+            )
+        started = time.monotonic()
+        futures = [cls.executor.submit(cls.function_call, call) for call in calls]
+        contents = []
+        for call, future in zip(calls, futures):
+            function = cls.functions.get(call.name)
+            timeout = function.timeout if function else cls.default_timeout
+            try:
+                # 제출 시점부터 함수별 제한 시간을 셈
+                remaining = max(0.0, started + timeout - time.monotonic())
+                result = future.result(timeout=remaining)
+                contents.append(
+                    result.map(lambda x: str(x.result)).value_or(
+                        f"error: unknown function {call.name}"
+                    )
+                )
+            except FutureTimeout:
+                contents.append(f"error: {call.name} timed out after {timeout}s")
+            except Exception as e:
+                contents.append(f"error: {e!r}")
+        return contents
 
     @classmethod
     def get_functions(cls):
         return list(cls.functions.values())
 
+    @classmethod
+    def compile(cls) -> "tuple[tuple[Function, ToolDict], ...]":
+        """등록된 함수들의 도구 스키마를 한 번만 만들고, 새 함수가 등록되면 다시 만듭니다."""
+        version, tools = cls.compiled
+        if version != Function.version:
+            version = Function.version
+            tools = tuple(
+                (x, ToolDict(type="function", function=x.dict()))
+                for x in list(cls.functions.values())
+            )
+            Function.compiled = (version, tools)
+        return tools
+
+    @staticmethod
+    def compact(text: str) -> str:
+        """띄어쓰기 차이("몇 시"/"몇시")를 무시하도록 공백을 지우고 소문자로 바꿉니다."""
+        return "".join(text.lower().split())
+
+    def relevant(self, prompt: str) -> bool:
+        return not self.keywords or any(keyword in prompt for keyword in self.keywords)
+
+    @classmethod
+    def get_tools(cls, prompt: Optional[str] = None) -> list[ToolDict]:
+        """prompt가 주어지면 키워드가 맞는 함수만 골라 보내는 토큰을 줄입니다."""
+        tools = cls.compile()
+        if prompt is None:
+            return [tool for _, tool in tools]
+        prompt = cls.compact(prompt)
+        return [tool for function, tool in tools if function.relevant(prompt)]
+
     def dict(self):
         return FunctionDict(
             name=self.function.__name__,
@@ -92,11 +313,14 @@ class Function(Generic[P, T]):
         )
 
 
-def function_register(**descriptions: str):
-    def function_wrapper(function: Callable[P, T]):
-        return Function(function, **descriptions)
-
-    return function_wrapper
+def function_register(
+    pure: bool = False,
+    cache_ttl: Optional[float] = None,
+    timeout: Optional[float] = None,
+    keywords: Iterable[str] = (),
+    **descriptions: str,
+):
+    return Function.register(pure, cache_ttl, timeout, keywords, **descriptions)
 
 
 class FunctionResult(Generic[P, T]):
@@ -108,3 +332,7 @@ class FunctionResult(Generic[P, T]):
         return FunctionM(
             role="function", name=self.function.name, content=str(self.result)
         )
+
+
+def tool_message(tool_call_id: str, content: str):
+    return ToolM(role="tool", tool_call_id=tool_call_id, content=content)
@@ -0,0 +1,181 @@
+from collections import OrderedDict
+import hashlib
+import re
+import threading
+import time
+import zlib
+from typing import Callable, NamedTuple, Optional
+import numpy as np
+
+Embedder = Callable[[str], np.ndarray]
+
+
+def normalize_prompt(prompt: str) -> str:
+    """대소문자, 문장 부호, 공백 차이를 무시하도록 정규화합니다."""
+    return " ".join(re.sub(r"[^\w\s]", " ", prompt.lower()).split())
+
+
+class HashingEmbedder:
+    """
+    단어와 글자 n-gram을 해시해 고정 차원 벡터로 만드는 가벼운 로컬 임베딩.
+    한국어처럼 띄어쓰기와 조사가 흔들리는 문장도 글자 n-gram으로 비슷하게 잡힙니다.
+    조사/문장 부호만 다른 문장은 0.65~0.9, 단어 하나가 다른 문장은 0.6 안팎이 나오므로
+    기준은 그 사이로 잡습니다.
+    """
+
+    threshold = 0.65
+
+    def __init__(self, dim: int = 1024, ngrams: tuple[int, ...] = (2, 3)):
+        self.dim = dim
+        self.ngrams = ngrams
+
+    def features(self, text: str) -> list[str]:
+        words = text.split()
+        compact = text.replace(" ", "")
+        grams = [
+            compact[i : i + n] for n in self.ngrams for i in range(len(compact) - n + 1)
+        ]
+        return words + grams
+
+    def __call__(self, text: str) -> np.ndarray:
+        features = self.features(normalize_prompt(text))
+        indices = [zlib.crc32(f.encode("utf-8")) % self.dim for f in features]
+        vector = np.bincount(indices, minlength=self.dim).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SentenceTransformerEmbedder:
+    threshold = 0.92
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def __call__(self, text: str) -> np.ndarray:
+        return self.model.encode(
+            normalize_prompt(text), normalize_embeddings=True
+        ).astype(np.float32)
+
+
+class CacheEntry(NamedTuple):
+    response: str
+    expires_at: float
+    slot: int
+
+
+class ResponseCache:
+    """
+    ChatGPT 응답 캐시. 정규화한 프롬프트 해시가 같으면 바로,
+    아니면 임베딩 코사인 유사도가 threshold 이상인 가장 가까운 항목을 돌려줍니다.
+    threshold를 주지 않으면 임베딩마다 맞춰 둔 embedder.threshold를 씁니다.
+    항목은 scope(장치)별로 나뉘어 같은 scope 안에서만 찾습니다.
+    항목은 ttl 초 뒤 만료되고 max_entries를 넘으면 가장 오래 안 쓴 것부터 지웁니다.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        dim: int,
+        threshold: Optional[float] = None,
+        ttl: float = 3600,
+        max_entries: int = 256,
+    ):
+        self.embedder = embedder
+        self.threshold = (
+            getattr(embedder, "threshold", 0.92) if threshold is None else threshold
+        )
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict[str, CacheEntry]()
+        # 벡터 인덱스: 슬롯마다 한 행, 빈 슬롯은 0 벡터
+        self.vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self.slot_keys: list[Optional[str]] = [None] * max_entries
+        self.slot_scopes: list[Optional[str]] = [None] * max_entries
+        self.free_slots = list(range(max_entries))
+        self.lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prompt: str, scope: str = "") -> str:
+        text = f"{scope}\0{normalize_prompt(prompt)}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def remove(self, key: str):
+        entry = self.entries.pop(key)
+        self.vectors[entry.slot] = 0
+        self.slot_keys[entry.slot] = None
+        self.slot_scopes[entry.slot] = None
+        self.free_slots.append(entry.slot)
+
+    def valid(self, key: str) -> Optional[CacheEntry]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def get(self, prompt: str, scope: str = "") -> Optional[str]:
+        key = self.key(prompt, scope)
+        with self.lock:
+            if entry := self.valid(key):
+                self.exact_hits += 1
+                return entry.response
+            if not self.entries:
+                self.misses += 1
+                return None
+        vector = self.embedder(prompt)
+        with self.lock:
+            scores = self.vectors @ vector
+            scores[[s != scope for s in self.slot_scopes]] = -1
+            slot = int(np.argmax(scores))
+            found = self.slot_keys[slot]
+            if (
+                found
+                and scores[slot] >= self.threshold
+                and (entry := self.valid(found))
+            ):
+                self.semantic_hits += 1
+                return entry.response
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        prompt: str,
+        response: str,
+        ttl: Optional[float] = None,
+        scope: str = "",
+    ):
+        """ttl이 주어지면 캐시의 ttl보다 짧을 때 그 값으로 만료시킵니다."""
+        ttl = self.ttl if ttl is None else min(self.ttl, ttl)
+        key = self.key(prompt, scope)
+        vector = self.embedder(prompt)
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            if not self.free_slots:
+                self.remove(next(iter(self.entries)))
+            slot = self.free_slots.pop()
+            self.vectors[slot] = vector
+            self.slot_keys[slot] = key
+            self.slot_scopes[slot] = scope
+            self.entries[key] = CacheEntry(response, time.monotonic() + ttl, slot)
+
+    def stats(self) -> dict[str, float]:
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return dict(
+            exact_hits=self.exact_hits,
+            semantic_hits=self.semantic_hits,
+            misses=self.misses,
+            hit_rate=hits / total if total else 0.0,
+            entries=len(self.entries),
+        )
@@ -0,0 +1,155 @@
+import asyncio
+from concurrent.futures import CancelledError, Future
+from difflib import SequenceMatcher
+from functools import cache
+import logging
+import threading
+import time
+from typing import Optional
+from returns.result import safe
+
+from ai.ai import AI
+from ai.functions import speculating
+from ai.response_cache import normalize_prompt
+from recorder.audio_recorder import AudioStream
+from utils import is_ai_call
+
+logger = logging.getLogger("Secretary")
+
+
+@cache
+def speculation_loop() -> asyncio.AbstractEventLoop:
+    """
+    취소하면 진행 중인 HTTP 요청까지 끊기도록 비동기 클라이언트를 별도 루프에서 돌립니다.
+    모든 세션이 이 루프 하나를 같이 씁니다.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="speculation", daemon=True).start()
+    return loop
+
+
+class Speculation:
+    def __init__(self, prompt: str, future: Future[str]):
+        self.prompt = prompt
+        self.future = future
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        future.add_done_callback(self.done)
+
+    def done(self, _):
+        self.finished = time.perf_counter()
+
+
+class SpeculativeAI:
+    """
+    스트리밍 STT의 부분 전사가 stability번 연속 같으면 발화가 끝나기 전에 AI 요청을 먼저 보냅니다.
+    최종 프롬프트가 충분히 비슷하면 그 응답을 쓰고, 아니면 취소하고 다시 요청합니다.
+    컨텍스트에는 최종 프롬프트와 응답만 저장됩니다.
+    """
+
+    def __init__(self, ai: AI, stability: int = 2, similarity: float = 0.9):
+        self.ai = ai
+        self.stability = stability
+        self.similarity = similarity
+        self.lock = threading.Lock()
+        self.speculation: Optional[Speculation] = None
+        self.hypothesis = ""
+        self.repeats = 0
+        self.last_final = ""
+        self.turns = 0
+        self.started = 0
+        self.hits = 0
+        self.saved = 0.0
+        self.loop = speculation_loop()
+
+    def same(self, a: str, b: str) -> bool:
+        a, b = normalize_prompt(a), normalize_prompt(b)
+        return a == b or SequenceMatcher(None, a, b).ratio() >= self.similarity
+
+    def listener(self, stream: AudioStream):
+        def on_partial(source: AudioStream, text: str):
+            if source is stream:
+                self.on_partial(text)
+
+        return on_partial
+
+    def on_partial(self, text: str):
+        normalized = normalize_prompt(text)
+        with self.lock:
+            if normalized == self.hypothesis:
+                self.repeats += 1
+            else:
+                self.hypothesis, self.repeats = normalized, 1
+            if self.repeats != self.stability:
+                return
+        prompt = is_ai_call(text).value_or("").strip()
+        if not prompt:
+            return
+        with self.lock:
+            # 방금 끝난 발화의 늦게 도착한 부분 전사는 무시
+            if self.last_final and self.same(self.last_final, prompt):
+                return
+            current = self.speculation
+            if current and self.same(current.prompt, prompt):
+                return
+            if current:
+                current.future.cancel()
+            self.speculation = self.start(prompt)
+            self.started += 1
+
+    def start(self, prompt: str) -> Speculation:
+        messages = self.ai.context_loader.prepare(prompt)
+        return Speculation(
+            prompt,
+            asyncio.run_coroutine_threadsafe(self.speculate(messages), self.loop),
+        )
+
+    async def speculate(self, messages) -> str:
+        speculating.set(True)
+        return await self.ai.arunner(messages)
+
+    def take(self, prompt: str) -> Optional[str]:
+        with self.lock:
+            current, self.speculation = self.speculation, None
+            self.hypothesis, self.repeats = "", 0
+            self.last_final = prompt
+            self.turns += 1
+        if not current:
+            return None
+        if not self.same(current.prompt, prompt):
+            current.future.cancel()
+            return None
+        waited = time.perf_counter()
+        try:
+            response = current.future.result()
+        except (CancelledError, Exception) as e:
+            logger.info(f"speculation failed: {e!r}")
+            return None
+        self.hits += 1
+        # 최종 전사가 나오기 전에 이미 진행된 만큼 응답 대기 시간이 줄어듦
+        self.saved += min(waited, current.finished or waited) - current.started
+        return response
+
+    @safe
+    def run(self, prompt: str) -> str:
+        try:
+            response = self.take(prompt)
+            if response is None:
+                return self.ai.run(prompt).unwrap()
+            self.ai.context_loader.commit(prompt, response)
+            return response
+        finally:
+            # 턴이 끝난 뒤에는 같은 질문을 다시 해도 추측 요청을 보냄
+            with self.lock:
+                if self.last_final == prompt:
+                    self.last_final = ""
+
+    def stats(self) -> dict[str, float]:
+        return dict(
+            turns=self.turns,
+            started=self.started,
+            hits=self.hits,
+            hit_rate=self.hits / self.turns if self.turns else 0.0,
+            saved=self.saved,
+            mean_saved=self.saved / self.hits if self.hits else 0.0,
+        )
@@ -4,6 +4,19 @@ from ai.functions import function_register
 
 
 @function_register(
+    keywords=(
+        "실행",
+        "열어",
+        "켜줘",
+        "켜주",
+        "켜봐",
+        "켜라",
+        "프로그램",
+        "메모장",
+        "계산기",
+        "open",
+        "launch",
+    ),
     application_name="Window Application Name (notepad.exe, calculator.exe )",
 )
 def open_window_application(application_name: str) -> bool:
@@ -15,7 +28,9 @@ def open_window_application(application_name: str) -> bool:
         return False
 
 
-@function_register()
+@function_register(
+    keywords=("시간", "시각", "몇 시", "날짜", "며칠", "오늘", "time", "date")
+)
 def now():
     "현재 시각을 알려줍니다"
     return str(datetime.now())
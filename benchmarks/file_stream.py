@@ -0,0 +1,56 @@
+import time
+import numpy as np
+import pyaudio
+
+from exceptions import StreamClosedError
+from recorder.audio_recorder import AudioStream
+from recorder.vad import AudioFrames, read_wav
+
+
+class FileAudioStream(AudioStream):
+    """
+    마이크 대신 wav 파일을 읽는 AudioStream.
+    speed가 0이면 기다리지 않고 최대한 빨리, 1이면 실시간 속도로 읽습니다.
+    """
+
+    def __init__(self, p: pyaudio.PyAudio, file_name: str, speed: float = 0.0):
+        samples, rate = read_wav(file_name)
+        if rate != self.RATE:
+            raise ValueError(f"{file_name}: expected {self.RATE}Hz, got {rate}Hz")
+        # 마지막 발화도 끝나도록 종료 판정에 필요한 만큼 무음을 붙임
+        tail = np.zeros((self.STAND_BY_FRAMES + 1) * self.CHUNK, dtype=np.int16)
+        self.samples = np.concatenate([samples, tail])
+        self.file_name = file_name
+        self.position = 0
+        self.speed = speed
+        self.started = time.perf_counter()
+        super().__init__(p, -1)
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.RATE
+
+    def open(self, device_index: int):
+        return None
+
+    def read(self, size: int = AudioStream.CHUNK) -> np.ndarray:
+        if self.position >= len(self.samples):
+            raise StreamClosedError
+        chunk = self.samples[self.position : self.position + size]
+        self.position += size
+        if self.speed:
+            due = self.started + self.position / self.RATE / self.speed
+            time.sleep(max(0.0, due - time.perf_counter()))
+        if len(chunk) < size:
+            chunk = np.concatenate([chunk, np.zeros(size - len(chunk), np.int16)])
+        return chunk
+
+    def read_frames(self) -> AudioFrames:
+        if len(self.pending):
+            return super().read_frames()
+        # 실시간이 아니면 콜백 모드처럼 여러 프레임을 한 블록으로 넘김
+        frames = 1 if self.speed else self.MAX_BLOCK_FRAMES
+        return self.read(frames * self.CHUNK).reshape(-1, self.CHUNK)
+
+    def stop(self):
+        pass
@@ -0,0 +1,295 @@
+"""
+녹음해 둔 wav 세션 디렉터리를 전체 파이프라인(VAD -> STT -> ChatGPT -> XTTS)에 흘려 보내며
+단계별 처리량, p50/p95/p99 지연, 최대 RSS를 측정합니다.
+ChatGPT와 XTTS는 로컬 가짜 서버로 대체하므로 네트워크와 과금 없이 반복 측정할 수 있습니다.
+
+    python -m benchmarks.replay sessions/ --output report.json
+    python -m benchmarks.replay sessions/ --baseline report.json --tolerance 0.15
+"""
+
+import argparse
+from contextlib import contextmanager
+import glob
+import json
+import os
+import sys
+import time
+from typing import Any, Optional
+import numpy as np
+import pyaudio
+from returns.pipeline import is_successful
+
+from ai.ai import AI
+from ai.context import ContextLoader
+from benchmarks.file_stream import FileAudioStream
+from benchmarks.servers import fake_openai_handler, serve, stub_xtts_handler
+from converters.tts import XTTS
+
+REPLY = (
+    "네, 알겠습니다. 요청하신 내용을 확인했어요. 다른 도움이 필요하시면 말씀해 주세요."
+)
+# 비교할 지표와 허용 오차를 넘으면 회귀로 봄 (값이 클수록 나쁨)
+COMPARED = ("p50", "p95", "p99")
+MIN_DELTA = 0.005  # 이보다 작은 차이(초)는 측정 잡음으로 보고 무시
+
+
+class NullOutput:
+    def write(self, data: bytes):
+        pass
+
+
+class BenchmarkXTTS(XTTS):
+    """재생 장치 대신 버리는 출력으로 쓰는 XTTS"""
+
+    @contextmanager
+    def player(self):
+        yield NullOutput()
+
+
+class StageStats:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        # 단계별 처리한 양 (segment/stt는 오디오 초, 나머지는 요청 수)
+        self.work: dict[str, float] = {}
+
+    @contextmanager
+    def measure(self, stage: str, work: float = 1.0):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(stage, []).append(time.perf_counter() - started)
+            self.work[stage] = self.work.get(stage, 0.0) + work
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        result = {}
+        for stage, values in self.samples.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            total = sum(values)
+            result[stage] = dict(
+                count=len(values),
+                mean=float(np.mean(values)),
+                p50=float(p50),
+                p95=float(p95),
+                p99=float(p99),
+                throughput=self.work[stage] / total if total else 0.0,
+            )
+        return result
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # 리눅스는 KB, macOS는 바이트 단위
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def replay_file(
+    p: pyaudio.PyAudio,
+    file_name: str,
+    stt,
+    ai: AI,
+    tts: XTTS,
+    stats: StageStats,
+    speed: float,
+    streaming: bool,
+) -> int:
+    stream = FileAudioStream(p, file_name, speed)
+    stt.attach(stream)
+    try:
+        return replay_stream(stream, stt, ai, tts, stats, streaming)
+    finally:
+        # 다음 파일을 재생할 때 이전 스트림의 리스너와 발화 상태가 남지 않도록 함
+        stt.detach(stream)
+
+
+def replay_stream(
+    stream: FileAudioStream,
+    stt,
+    ai: AI,
+    tts: XTTS,
+    stats: StageStats,
+    streaming: bool,
+) -> int:
+    utterances = 0
+    while True:
+        started = time.perf_counter()
+        audio_data = stream.detect_audio()
+        if not is_successful(audio_data):
+            break
+        recorded = audio_data.unwrap()
+        duration = len(recorded.ndarray) / recorded.rate
+        stats.samples.setdefault("segment", []).append(time.perf_counter() - started)
+        stats.work["segment"] = stats.work.get("segment", 0.0) + duration
+        utterances += 1
+        with stats.measure("stt", duration):
+            prompt = stt.run(recorded).strip()
+        if not prompt:
+            continue
+        if streaming:
+            with stats.measure("ai"):
+                first = time.perf_counter()
+                sentences = []
+                for sentence in ai.stream(prompt):
+                    if not sentences:
+                        stats.samples.setdefault("ai_first_sentence", []).append(
+                            time.perf_counter() - first
+                        )
+                        stats.work["ai_first_sentence"] = (
+                            stats.work.get("ai_first_sentence", 0.0) + 1
+                        )
+                    sentences.append(sentence)
+            response = " ".join(sentences)
+        else:
+            with stats.measure("ai"):
+                response = ai.run(prompt).unwrap()
+        with stats.measure("tts"):
+            tts.runner(response)
+    return utterances
+
+
+def run(
+    directory: str,
+    chat_latency: float,
+    token_delay: float,
+    tts_first_byte: float,
+    speed: float,
+    streaming: bool,
+) -> dict[str, Any]:
+    from client_loaders import async_openai_loader, openai_loader, stt_loader
+
+    files = sorted(glob.glob(os.path.join(directory, "*.wav")))
+    if not files:
+        raise FileNotFoundError(f"no .wav files in {directory}")
+    chat_server, chat_url = serve(fake_openai_handler(chat_latency, token_delay, REPLY))
+    tts_server, tts_url = serve(stub_xtts_handler(tts_first_byte, 0.08))
+    # openai 클라이언트는 처음 만들어질 때 이 환경 변수를 읽음
+    os.environ["OPENAI_BASE_URL"] = f"{chat_url}/v1"
+    openai_loader.cache_clear()
+    async_openai_loader.cache_clear()
+    p = pyaudio.PyAudio()
+    try:
+        stt = stt_loader()
+        ai = AI.ChatGPT(ContextLoader.InmemoryLoader())
+        tts = BenchmarkXTTS(p=p)
+        tts.url = f"{tts_url}/tts_stream"
+        stats = StageStats()
+        started = time.perf_counter()
+        utterances = 0
+        audio_seconds = 0.0
+        for file_name in files:
+            utterances += replay_file(
+                p, file_name, stt, ai, tts, stats, speed, streaming
+            )
+            audio_seconds += FileAudioStream(p, file_name).duration
+        wall = time.perf_counter() - started
+        tts.close()
+    finally:
+        p.terminate()
+        chat_server.shutdown()
+        tts_server.shutdown()
+    return dict(
+        files=len(files),
+        utterances=utterances,
+        audio_seconds=audio_seconds,
+        wall_seconds=wall,
+        realtime_factor=wall / audio_seconds if audio_seconds else 0.0,
+        peak_rss_mb=peak_rss_mb(),
+        stages=stats.summary(),
+    )
+
+
+def compare(
+    report: dict[str, Any], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    """baseline보다 tolerance 비율 이상 나빠진 지표 목록"""
+    regressions = []
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous:
+            continue
+        for metric in COMPARED:
+            limit = max(
+                previous[metric] * (1 + tolerance), previous[metric] + MIN_DELTA
+            )
+            if current[metric] > limit:
+                regressions.append(
+                    f"{stage}.{metric}: {previous[metric]:.3f}s -> {current[metric]:.3f}s"
+                )
+    before, after = baseline.get("peak_rss_mb"), report.get("peak_rss_mb")
+    if before and after and after > before * (1 + tolerance):
+        regressions.append(f"peak_rss_mb: {before:.0f} -> {after:.0f}")
+    return regressions
+
+
+def print_report(report: dict[str, Any], baseline: Optional[dict[str, Any]]):
+    print(
+        f"{report['files']} files, {report['utterances']} utterances, "
+        f"{report['audio_seconds']:.1f}s audio in {report['wall_seconds']:.1f}s, "
+        f"peak RSS {report['peak_rss_mb'] or 0:.0f}MB"
+    )
+    print(
+        f"{'stage':<18}{'count':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'thru':>11}{'Δp95':>8}"
+    )
+    for stage, row in report["stages"].items():
+        previous = (baseline or {}).get("stages", {}).get(stage)
+        delta = (
+            f"{(row['p95'] / previous['p95'] - 1) * 100:+.0f}%"
+            if previous and previous["p95"]
+            else "-"
+        )
+        print(
+            f"{stage:<18}{row['count']:>6}{row['p50']:>9.3f}{row['p95']:>9.3f}"
+            f"{row['p99']:>9.3f}{row['throughput']:>11.1f}{delta:>8}"
+        )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("directory", help="16kHz wav 파일이 들어 있는 디렉터리")
+    parser.add_argument("--baseline", help="비교할 이전 결과 JSON")
+    parser.add_argument("--output", help="결과를 저장할 JSON 경로")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--chat-latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--tts-first-byte", type=float, default=0.1)
+    parser.add_argument(
+        "--speed", type=float, default=0.0, help="0이면 최대 속도, 1이면 실시간"
+    )
+    parser.add_argument("--streaming", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = run(
+        args.directory,
+        args.chat_latency,
+        args.token_delay,
+        args.tts_first_byte,
+        args.speed,
+        args.streaming,
+    )
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if baseline is None:
+        return 0
+    regressions = compare(report, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+def serve(handler: type[BaseHTTPRequestHandler]) -> tuple[ThreadingHTTPServer, str]:
+    """빈 포트에서 서버를 띄우고 (서버, 기본 URL)을 반환합니다."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive 재사용을 측정에 포함
+
+    def log_message(self, format, *args):
+        pass
+
+
+def fake_openai_handler(latency: float, token_delay: float, reply: str):
+    """OpenAI 호환 /v1/chat/completions. latency 뒤에 reply를 돌려주거나 단어 단위로 스트리밍합니다."""
+
+    class Handler(QuietHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if not self.path.endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            time.sleep(latency)
+            if body.get("stream"):
+                return self.stream(body["model"])
+            payload = json.dumps(
+                {
+                    "id": "chatcmpl-benchmark",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": reply},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                }
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def stream(self, model: str):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            words = reply.split(" ")
+            for i, word in enumerate(words):
+                chunk = {
+                    "id": "chatcmpl-benchmark",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"content": word if i == 0 else " " + word},
+                            "finish_reason": "stop" if i == len(words) - 1 else None,
+                        }
+                    ],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(token_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return Handler
+
+
+def stub_xtts_handler(first_byte: float, seconds_per_char: float, rate: int = 24000):
+    """XTTS /tts_stream 흉내. first_byte 뒤에 글자 수에 비례하는 길이의 무음 PCM을 보냅니다."""
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/tts_stream":
+                self.send_error(404)
+                return
+            text = parse_qs(url.query).get("text", [""])[0]
+            samples = int(len(text) * seconds_per_char * rate)
+            time.sleep(first_byte)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(samples * 2))
+            self.end_headers()
+            remaining = samples * 2
+            while remaining > 0:
+                size = min(4096, remaining)
+                self.wfile.write(bytes(size))
+                remaining -= size
+
+    return Handler
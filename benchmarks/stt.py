@@ -0,0 +1,181 @@
+"""
+같은 녹음으로 STT 백엔드(기본: local openai-whisper fp32, faster int8)의 실시간 배율(RTF),
+모델 로드 시간, 최대 RSS와 전사 차이(WER/CER)를 비교합니다.
+백엔드마다 새 프로세스에서 돌려 메모리를 따로 잽니다.
+
+    python -m benchmarks.stt recordings/ --output stt.json
+
+wav 옆에 같은 이름의 .txt 정답 전사가 있으면 두 백엔드 모두 정답과 비교하고,
+없으면 첫 번째(기준) 백엔드 전사를 정답으로 봅니다.
+후보 백엔드의 WER이 기준보다 --tolerance(기본 0.05 = 5%p) 넘게 나쁘면 1로 종료합니다.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Optional
+import pyaudio
+
+from benchmarks.replay import peak_rss_mb
+from recorder.audio_recorder import AudioStream
+from recorder.recorded_file import RecordedFile
+from recorder.vad import read_wav
+
+
+def normalize(text: str) -> str:
+    return " ".join(
+        "".join(c for c in text.lower() if c.isalnum() or c.isspace()).split()
+    )
+
+
+def edit_distance(reference: list[str], hypothesis: list[str]) -> int:
+    row = list(range(len(hypothesis) + 1))
+    for i, r in enumerate(reference, 1):
+        previous, row[0] = row[0], i
+        for j, h in enumerate(hypothesis, 1):
+            previous, row[j] = row[j], min(
+                row[j] + 1, row[j - 1] + 1, previous + (r != h)
+            )
+    return row[-1]
+
+
+def error_rates(references: list[str], hypotheses: list[str]) -> dict[str, float]:
+    """전체 발화를 합친 단어 오류율(WER)과 글자 오류율(CER)"""
+    words = chars = word_errors = char_errors = 0
+    for reference, hypothesis in zip(references, hypotheses):
+        reference, hypothesis = normalize(reference), normalize(hypothesis)
+        word_errors += edit_distance(reference.split(), hypothesis.split())
+        words += len(reference.split())
+        reference, hypothesis = reference.replace(" ", ""), hypothesis.replace(" ", "")
+        char_errors += edit_distance(list(reference), list(hypothesis))
+        chars += len(reference)
+    return dict(
+        wer=word_errors / words if words else 0.0,
+        cer=char_errors / chars if chars else 0.0,
+    )
+
+
+def measure(backend: str, files: list[str]) -> dict[str, Any]:
+    """워커 프로세스에서 backend로 files를 전사합니다."""
+    from converters.stt import STT
+
+    factories = dict(
+        local=STT.LocalSTT,
+        faster=STT.FasterSTT,
+        pool=STT.PooledSTT,
+        remote=STT.RemoteSTT,
+    )
+    p = pyaudio.PyAudio()
+    started = time.perf_counter()
+    stt = factories[backend]()
+    load_seconds = time.perf_counter() - started
+    recordings = []
+    for file_name in files:
+        samples, rate = read_wav(file_name)
+        if rate != AudioStream.RATE:
+            raise ValueError(
+                f"{file_name}: expected {AudioStream.RATE}Hz, got {rate}Hz"
+            )
+        recordings.append(RecordedFile(p, samples, file_name, rate, 1))
+    # 첫 호출의 지연 초기화는 따로 잼. run()은 전사를 다음 프롬프트로 기억하므로
+    # 파일끼리 영향을 주지 않도록 runner()로 전사함
+    started = time.perf_counter()
+    stt.runner(recordings[0])
+    warmup_seconds = time.perf_counter() - started
+    transcripts, seconds = [], []
+    for recorded in recordings:
+        started = time.perf_counter()
+        transcripts.append(stt.runner(recorded).strip())
+        seconds.append(time.perf_counter() - started)
+    p.terminate()
+    audio_seconds = sum(len(r.ndarray) / r.rate for r in recordings)
+    return dict(
+        backend=backend,
+        load_seconds=load_seconds,
+        warmup_seconds=warmup_seconds,
+        decode_seconds=sum(seconds),
+        audio_seconds=audio_seconds,
+        rtf=sum(seconds) / audio_seconds if audio_seconds else 0.0,
+        peak_rss_mb=peak_rss_mb(),
+        transcripts=transcripts,
+    )
+
+
+def run(directory: str, backends: list[str]) -> dict[str, Any]:
+    files = sorted(glob.glob(os.path.join(directory, "*.wav")))
+    if not files:
+        raise FileNotFoundError(f"no .wav files in {directory}")
+    references: Optional[list[str]] = None
+    labels = [os.path.splitext(file_name)[0] + ".txt" for file_name in files]
+    if all(os.path.exists(label) for label in labels):
+        references = []
+        for label in labels:
+            with open(label, encoding="utf-8") as f:
+                references.append(f.read().strip())
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(executor.submit(measure, backend, files).result())
+    baseline = results[0]["transcripts"]
+    for result in results:
+        result.update(error_rates(references or baseline, result["transcripts"]))
+    return dict(
+        files=[os.path.basename(file_name) for file_name in files],
+        reference="labels" if references else backends[0],
+        results=results,
+    )
+
+
+def regressions(report: dict[str, Any], tolerance: float) -> list[str]:
+    baseline, *candidates = report["results"]
+    failed = []
+    for result in candidates:
+        if result["wer"] > baseline["wer"] + tolerance:
+            failed.append(
+                f"{result['backend']}.wer: {baseline['wer']:.3f} -> {result['wer']:.3f}"
+            )
+    return failed
+
+
+def print_report(report: dict[str, Any]):
+    print(f"{len(report['files'])} files, reference: {report['reference']}")
+    print(
+        f"{'backend':<10}{'load':>8}{'warmup':>8}{'rtf':>8}{'rss MB':>9}{'wer':>8}{'cer':>8}"
+    )
+    for result in report["results"]:
+        print(
+            f"{result['backend']:<10}{result['load_seconds']:>8.1f}"
+            f"{result['warmup_seconds']:>8.1f}{result['rtf']:>8.3f}"
+            f"{result['peak_rss_mb'] or 0:>9.0f}{result['wer']:>8.3f}{result['cer']:>8.3f}"
+        )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("directory", help="16kHz wav 파일이 들어 있는 디렉터리")
+    parser.add_argument(
+        "--backends", default="local,faster", help="쉼표로 구분, 첫 번째가 기준"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    parser.add_argument("--output", help="결과를 저장할 JSON 경로")
+    args = parser.parse_args(argv)
+
+    report = run(args.directory, args.backends.split(","))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    failed = regressions(report, args.tolerance)
+    for regression in failed:
+        print(f"REGRESSION {regression}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
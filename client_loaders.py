@@ -1,25 +1,119 @@
+import asyncio
 from functools import cache
+from typing import Optional
 import pyaudio
 from converters.tts import TTS
 from converters.stt import STT
-from ai.ai import AI
+from ai.ai import AI, summarize_conversation
+from ai.context import ContextLoader, TokenCounter
+from recorder.audio_recorder import AudioStream
 from settings import Setting
 
 
 def tts_loader(p: pyaudio.PyAudio):
+    cache = audio_cache_loader() if Setting.TTS_CACHE else None
     if Setting.TTS == "gtts":
-        return TTS.GTTS(p)
-    return TTS.XTTS(p)
+        return TTS.GTTS(p, cache=cache)
+    return TTS.XTTS(p, cache=cache)
 
 
-def stt_loader():
-    if Setting.STT == "remote":
+def backend_stt_loader(name: str):
+    if name == "remote":
         return STT.RemoteSTT()
+    elif name == "pool":
+        return STT.PooledSTT()
+    elif name == "faster":
+        return STT.FasterSTT()
     return STT.LocalSTT()
 
 
-def ai_loader():
-    return AI.ChatGPT()
+def stt_loader():
+    stt = backend_stt_loader(Setting.STT)
+    if Setting.STT_HEDGE and Setting.STT_HEDGE != Setting.STT:
+        stt = STT.Hedged(
+            stt,
+            backend_stt_loader(Setting.STT_HEDGE),
+            Setting.STT_HEDGE_PERCENTILE,
+            Setting.STT_HEDGE_INITIAL_DELAY,
+            Setting.STT_HEDGE_MIN_DELAY,
+        )
+    if Setting.STT_STREAMING:
+        stt = STT.Streaming(
+            stt, Setting.STT_STREAMING_WINDOW, Setting.STT_STREAMING_STEP
+        )
+    if Setting.WAKE_WORD_FILTER:
+        stt = STT.WakeWord(stt, Setting.SECRETARY_NAMES, Setting.WAKE_WORD_WINDOW)
+    return stt
+
+
+def audio_stream_loader(p: pyaudio.PyAudio, device_index: int):
+    calibrator = noise_calibrator_loader(device_index)
+    if Setting.CAPTURE_MODE == "blocking":
+        return AudioStream.Blocking(p, device_index, calibrator)
+    return AudioStream.Callback(p, device_index, calibrator)
+
+
+def noise_calibrator_loader(device_index: int):
+    if not Setting.NOISE_CALIBRATION:
+        return None
+    from recorder.calibration import NoiseCalibrator
+
+    return NoiseCalibrator(
+        noise_profiles_loader(),
+        device_index,
+        AudioStream.THRESHOLD,
+        percentile=Setting.NOISE_PERCENTILE,
+        margin=Setting.NOISE_MARGIN,
+        min_threshold=Setting.NOISE_MIN_THRESHOLD,
+        max_threshold=Setting.NOISE_MAX_THRESHOLD,
+    )
+
+
+@cache
+def noise_profiles_loader():
+    from recorder.calibration import NoiseProfiles
+
+    return NoiseProfiles(Setting.NOISE_PROFILE_FILE)
+
+
+def context_loader(name: str):
+    if Setting.CONTEXT_STORE == "json":
+        return ContextLoader.JsonLoader(f"{name}.json")
+    if not Setting.CONTEXT_TOKEN_BUDGET:
+        return ContextLoader.JsonlLoader(
+            f"{name}.jsonl", legacy_file_name=f"{name}.json"
+        )
+    # 토큰 예산으로 자르므로 저장소에서는 넉넉하게 읽어 옴
+    store = ContextLoader.JsonlLoader(
+        f"{name}.jsonl", legacy_file_name=f"{name}.json", limit=100
+    )
+    return ContextLoader.BudgetedLoader(
+        store,
+        budget=Setting.CONTEXT_TOKEN_BUDGET,
+        summarizer=summarize_conversation,
+        counter=TokenCounter(Setting.CHAT_GPT_MODEL_NAME),
+        summary_file=f"{name}.summary.json",
+    )
+
+
+def ai_loader(device_index: Optional[int] = None):
+    cache = response_cache_loader() if Setting.RESPONSE_CACHE else None
+    if device_index is None:
+        return AI.ChatGPT(context_loader("context"), cache)
+    # 장치마다 대화 컨텍스트를 따로 둠
+    return AI.ChatGPT(
+        context_loader(f"context_{device_index}"), cache, str(device_index)
+    )
+
+
+def speculator_loader(ai: AI):
+    if not (Setting.SPECULATIVE_AI and Setting.STT_STREAMING):
+        return None
+    from ai.speculation import SpeculativeAI
+
+    return SpeculativeAI(
+        ai, Setting.SPECULATION_STABILITY, Setting.SPECULATION_SIMILARITY
+    )
 
 
 @cache
@@ -30,9 +124,92 @@ def openai_loader():
 
 
 @cache
-def whisper_loader():
+def async_openai_loader(loop: asyncio.AbstractEventLoop):
+    # httpx 커넥션 풀은 연결을 연 이벤트 루프에 묶이므로 루프마다 클라이언트를 따로 둠
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=Setting.OPEN_AI_KEY)
+
+
+@cache
+def async_http_loader(loop: asyncio.AbstractEventLoop):
+    import httpx
+
+    return httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0))
+
+
+@cache
+def whisper_loader(name: Optional[str] = None):
     import whisper
 
     return whisper.load_model(
-        name=Setting.WHISPER_MODEL_NAME, device=Setting.WHISPER_DEVICE
+        name=name or Setting.WHISPER_MODEL_NAME, device=Setting.WHISPER_DEVICE
+    )
+
+
+@cache
+def faster_whisper_loader(name: Optional[str] = None):
+    from faster_whisper import WhisperModel
+
+    return WhisperModel(
+        name or Setting.WHISPER_MODEL_NAME,
+        device=Setting.WHISPER_DEVICE or "cpu",
+        compute_type=Setting.FASTER_WHISPER_COMPUTE_TYPE,
+        cpu_threads=Setting.FASTER_WHISPER_THREADS,
+    )
+
+
+@cache
+def whisper_pool_loader():
+    from converters.whisper_pool import WhisperPool
+
+    return WhisperPool(
+        model_name=Setting.WHISPER_MODEL_NAME,
+        device=Setting.WHISPER_DEVICE,
+        workers=Setting.WHISPER_WORKERS,
+        batch_size=Setting.WHISPER_BATCH_SIZE,
+    )
+
+
+@cache
+def audio_cache_loader():
+    from converters.tts_cache import AudioCache
+
+    return AudioCache(
+        Setting.TTS_CACHE_DIR,
+        max_bytes=Setting.TTS_CACHE_MEMORY_MB * 1024 * 1024,
+        max_disk_bytes=Setting.TTS_CACHE_DISK_MB * 1024 * 1024,
+    )
+
+
+@cache
+def response_cache_loader():
+    from ai.response_cache import (
+        HashingEmbedder,
+        ResponseCache,
+        SentenceTransformerEmbedder,
+    )
+
+    if Setting.RESPONSE_CACHE_EMBEDDING == "hashing":
+        embedder = HashingEmbedder()
+    else:
+        embedder = SentenceTransformerEmbedder(Setting.RESPONSE_CACHE_EMBEDDING)
+    return ResponseCache(
+        embedder,
+        dim=embedder.dim,
+        threshold=Setting.RESPONSE_CACHE_THRESHOLD,
+        ttl=Setting.RESPONSE_CACHE_TTL,
+        max_entries=Setting.RESPONSE_CACHE_SIZE,
     )
+
+
+@cache
+def tracer_loader():
+    if not Setting.TRACING:
+        return None
+    from tracing import Tracer
+
+    tracer = Tracer(Setting.TRACE_FILE or None)
+    if Setting.METRICS_PORT:
+        tracer.serve(Setting.METRICS_PORT)
+    return tracer
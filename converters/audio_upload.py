@@ -0,0 +1,86 @@
+from io import BytesIO
+import logging
+import os
+import random
+import time
+from typing import IO, Callable, Literal, TypeVar
+
+from recorder.recorded_file import RecordedFile
+
+T = TypeVar("T")
+UploadFormat = Literal["wav", "flac", "opus"]
+# (파일 이름, 파일 객체, MIME 타입) - openai 클라이언트의 file 인자 형식
+Upload = tuple[str, IO[bytes], str]
+
+logger = logging.getLogger("Secretary")
+
+# soundfile(libsndfile)로 압축할 때의 (format, subtype, 확장자, MIME 타입)
+COMPRESSED = {
+    "flac": ("FLAC", "PCM_16", "flac", "audio/flac"),
+    "opus": ("OGG", "OPUS", "ogg", "audio/ogg"),
+}
+
+
+def encode(data: RecordedFile, format: UploadFormat) -> Upload:
+    """
+    업로드할 파일을 만듭니다. wav는 녹음 버퍼를 그대로 스트리밍하고,
+    flac/opus는 soundfile이 있을 때만 압축하며 없거나 실패하면 wav로 보냅니다.
+    """
+    stem = os.path.splitext(data.file_name)[0]
+    if format in COMPRESSED:
+        sf_format, subtype, extension, mime = COMPRESSED[format]
+        try:
+            import soundfile
+
+            f = BytesIO()
+            soundfile.write(
+                f, data.ndarray, data.rate, format=sf_format, subtype=subtype
+            )
+            f.seek(0)
+            return f"{stem}.{extension}", f, mime
+        except Exception as e:
+            logger.warning(f"{format} encoding unavailable, sending wav: {e!r}")
+    return f"{stem}.wav", data.stream(), "audio/wav"
+
+
+def is_retryable(error: Exception) -> bool:
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409) or error.status_code >= 500
+    return False
+
+
+def retry(
+    call: Callable[[float], T],
+    deadline: float,
+    retries: int,
+    base_delay: float = 0.25,
+    max_delay: float = 4.0,
+) -> T:
+    """
+    call(남은 시간)을 deadline 초 안에서 최대 retries번 다시 시도합니다.
+    대기 시간은 지수 백오프 상한 안에서 무작위로 고르고(full jitter),
+    재시도할 수 없는 오류이거나 대기하면 deadline을 넘기는 경우 마지막 오류를 그대로 올립니다.
+    """
+    until = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        remaining = until - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"deadline of {deadline}s exceeded")
+        try:
+            return call(remaining)
+        except Exception as e:
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            if (
+                attempt >= retries
+                or not is_retryable(e)
+                or time.monotonic() + delay >= until
+            ):
+                raise
+            attempt += 1
+            logger.warning(f"retrying ({attempt}/{retries}) in {delay:.2f}s: {e!r}")
+            time.sleep(delay)
@@ -1,5 +1,28 @@
-from typing import Any, TypedDict
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from difflib import SequenceMatcher
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional, TypedDict
+import weakref
+import numpy as np
+import pyaudio
+from returns.result import safe
+
+from recorder.audio_recorder import AudioStream, RecordingListener, RecordingSession
+from converters.audio_upload import encode, retry
+from converters.whisper_state import (
+    N_SAMPLES,
+    MelFrontEnd,
+    PromptHistory,
+    is_fallback,
+    is_silence,
+)
 from recorder.recorded_file import RecordedFile
+import tracing
+
+logger = logging.getLogger("Secretary")
 
 
 class STTResult(TypedDict):
@@ -7,6 +30,8 @@ class STTResult(TypedDict):
 
 
 class STT:
+    # 파이프라인에서 동시에 전사를 맡길 수 있는 발화 수
+    concurrency = 1
 
     def __init__(self):
         pass
@@ -14,7 +39,29 @@ class STT:
     def runner(self, data: RecordedFile) -> str: ...
 
     def run(self, data: RecordedFile) -> str:
-        return self.runner(data)
+        text = self.runner(data)
+        self.remember(data, text)
+        return text
+
+    def remember(self, data: RecordedFile, text: str):
+        """최종 전사 결과. 다음 전사의 프롬프트로 쓰는 STT만 기록합니다."""
+        pass
+
+    def attach(self, stream: AudioStream):
+        """녹음 스트림에 연결이 필요한 STT는 여기서 리스너를 등록합니다."""
+        pass
+
+    def detach(self, stream: AudioStream):
+        """attach로 등록한 리스너와 그 스트림의 상태를 지웁니다."""
+        pass
+
+    def on_partial(self, listener: Callable[[AudioStream, str], Any]):
+        """녹음 중 부분 전사 결과를 받을 콜백. 스트리밍 STT만 호출합니다."""
+        pass
+
+    def stats(self) -> dict[str, Any]:
+        """로그로 남길 통계. 감싼 STT가 있으면 그 통계도 포함합니다."""
+        return {}
 
     @classmethod
     def LocalSTT(cls) -> "STT":
@@ -24,34 +71,605 @@ class STT:
     def RemoteSTT(cls) -> "STT":
         return RemoteWhisper()
 
+    @classmethod
+    def PooledSTT(cls) -> "STT":
+        return PooledWhisper()
+
+    @classmethod
+    def FasterSTT(cls) -> "STT":
+        return FasterWhisper()
+
+    @classmethod
+    def Hedged(
+        cls,
+        primary: "STT",
+        secondary: "STT",
+        percentile: float = 95.0,
+        initial_delay: float = 3.0,
+        min_delay: float = 0.5,
+    ) -> "STT":
+        return HedgedSTT(primary, secondary, percentile, initial_delay, min_delay)
+
+    @classmethod
+    def Streaming(cls, stt: "STT", window: float, step: float) -> "STT":
+        return StreamingSTT(stt, window, step)
+
+    @classmethod
+    def WakeWord(cls, stt: "STT", names: list[str], window: float) -> "STT":
+        return WakeWordSTT(stt, names, window)
+
 
 class LocalWhisper(STT):
+    """
+    장치별 최근 전사를 호출어와 함께 initial_prompt로 넣고,
+    30초 이하 발화는 재사용하는 mel 버퍼로 한 번에 디코딩합니다.
+    """
+
     def __init__(self):
         from client_loaders import whisper_loader
+        from settings import Setting
 
         self.client = whisper_loader()
+        self.prompts = PromptHistory(
+            [*Setting.SECRETARY_NAMES, *(Setting.STT_PROMPT_TERMS or [])],
+            Setting.STT_PROMPT_HISTORY,
+        )
+        self.mel = MelFrontEnd(self.client.dims.n_mels, self.client.device)
+
+    def remember(self, data: RecordedFile, text: str):
+        self.prompts.remember(data.device, text)
+
+    def decode(self, data: RecordedFile, prompt: Optional[str]) -> Optional[str]:
+        import whisper
+
+        options = whisper.DecodingOptions(
+            language="ko", fp16=False, prompt=prompt, without_timestamps=True
+        )
+        result = whisper.decode(self.client, self.mel(data), options)
+        if is_silence(result):
+            return ""
+        # 반복/저신뢰 결과는 temperature fallback이 있는 transcribe로 다시 전사
+        return None if is_fallback(result) else result.text
 
     def runner(self, data: RecordedFile) -> str:
+        prompt = self.prompts.prompt(data.device)
+        if len(data.ndarray) <= N_SAMPLES:
+            text = self.decode(data, prompt)
+            if text is not None:
+                return text
         return self.client.transcribe(
-            data.translate_16_to_32(), fp16=False, language="ko"
+            data.translate_16_to_32(),
+            fp16=False,
+            language="ko",
+            initial_prompt=prompt,
         )[
             "text"
         ]  # type:ignore
 
 
+class FasterWhisper(STT):
+    """
+    faster-whisper(CTranslate2)로 양자화된(int8) 모델을 CPU에서 돌립니다.
+    segments는 순회할 때 디코딩되므로 변환 버퍼가 덮어써지기 전에 바로 이어 붙입니다.
+    """
+
+    def __init__(self):
+        from client_loaders import faster_whisper_loader
+        from settings import Setting
+
+        self.client = faster_whisper_loader()
+        self.beam_size = Setting.FASTER_WHISPER_BEAM_SIZE
+
+    def runner(self, data: RecordedFile) -> str:
+        segments, _ = self.client.transcribe(
+            data.translate_16_to_32(), language="ko", beam_size=self.beam_size
+        )
+        return "".join(segment.text for segment in segments)
+
+
+class PooledWhisper(STT):
+    def __init__(self):
+        from client_loaders import whisper_pool_loader
+
+        from settings import Setting
+
+        self.pool = whisper_pool_loader()
+        self.timeout = Setting.WHISPER_POOL_TIMEOUT
+        # 워커마다 한 배치씩 묶어 디코딩하므로 그만큼 겹쳐서 받아야 배치가 참
+        self.concurrency = Setting.WHISPER_WORKERS * Setting.WHISPER_BATCH_SIZE
+
+    def runner(self, data: RecordedFile) -> str:
+        return self.pool.transcribe(data.translate_16_to_32(), self.timeout)
+
+
+class WakeWordSTT(STT):
+    """
+    발화 앞부분만 작은 Whisper 모델로 전사해 호출어가 있을 때만
+    전체 전사를 실행합니다. 건너뛴 횟수는 skipped에 기록됩니다.
+    """
+
+    def __init__(self, stt: STT, names: list[str], window: float, ratio: float = 0.6):
+        from client_loaders import whisper_loader
+        from settings import Setting
+
+        self.stt = stt
+        if isinstance(stt, StreamingSTT):
+            # 스트리밍 부분 전사도 호출어가 있는 발화에서만 돌도록 판정을 넘김
+            stt.set_gate(self.detect, window)
+        # 호출어 판정은 짧으므로 감싼 STT만큼 겹쳐서 받음
+        self.concurrency = stt.concurrency
+        self.names = [self.normalize(name) for name in names]
+        self.window = window
+        self.ratio = ratio
+        self.client = whisper_loader(Setting.WAKE_WORD_MODEL_NAME)
+        self.model_lock = threading.Lock()
+        self.prompt = ", ".join(names)
+        # 동시에 전사하는 발화끼리 세는 값이 어긋나지 않도록 잠금
+        self.count_lock = threading.Lock()
+        self.skipped = 0
+        self.passed = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return "".join(filter(str.isalnum, text)).lower()
+
+    def attach(self, stream: AudioStream):
+        self.stt.attach(stream)
+
+    def detach(self, stream: AudioStream):
+        self.stt.detach(stream)
+
+    def on_partial(self, listener: Callable[[AudioStream, str], Any]):
+        self.stt.on_partial(listener)
+
+    def detect(self, data: RecordedFile) -> bool:
+        with self.model_lock:
+            head = self.normalize(
+                self.client.transcribe(
+                    data.head(self.window).translate_16_to_32(),
+                    fp16=False,
+                    language="ko",
+                    initial_prompt=self.prompt,
+                )["text"]  # type:ignore
+            )
+        # 작은 모델의 오인식을 감안해 앞부분과 이름의 유사도로 판정
+        return any(
+            name in head
+            or SequenceMatcher(None, head[: len(name) + 1], name).ratio() >= self.ratio
+            for name in self.names
+        )
+
+    def stats(self) -> dict[str, Any]:
+        with self.count_lock:
+            counts = dict(skipped=self.skipped, passed=self.passed)
+        return dict(self.stt.stats(), wake_word=counts)
+
+    def runner(self, data: RecordedFile) -> str:
+        # 스트리밍 중에 이미 판정했으면 그 결과를 씀
+        detected = self.stt.woke(data) if isinstance(self.stt, StreamingSTT) else None
+        if detected is None:
+            with tracing.span("wake_word"):
+                detected = self.detect(data)
+        with self.count_lock:
+            if detected:
+                self.passed += 1
+            else:
+                self.skipped += 1
+        return self.stt.run(data) if detected else ""
+
+
 class RemoteWhisper(STT):
+    """
+    녹음 버퍼를 wav로 바로 스트리밍하거나 flac/opus로 압축해 업로드합니다.
+    실패하면 deadline 안에서 지터를 준 백오프로 재시도하고,
+    동시에 진행하는 업로드는 concurrency개로 제한합니다.
+    """
+
     def __init__(self):
         from client_loaders import openai_loader
+        from settings import Setting
+
+        # 재시도는 deadline을 지키도록 여기서 직접 함
+        self.client = openai_loader().with_options(max_retries=0)
+        self.format = Setting.REMOTE_STT_FORMAT
+        self.deadline = Setting.REMOTE_STT_DEADLINE
+        self.retries = Setting.REMOTE_STT_RETRIES
+        self.concurrency = Setting.REMOTE_STT_CONCURRENCY
+        self.executor = ThreadPoolExecutor(
+            self.concurrency, thread_name_prefix="remote-stt"
+        )
+
+    def upload(self, data: RecordedFile, timeout: float) -> str:
+        name, f, mime = encode(data, self.format)
+        with f:
+            return self.client.audio.transcriptions.create(
+                file=(name, f, mime),
+                model="whisper-1",
+                timeout=timeout,
+            ).text
+
+    def submit(self, data: RecordedFile) -> Future[str]:
+        return self.executor.submit(
+            retry,
+            lambda timeout: self.upload(data, timeout),
+            self.deadline,
+            self.retries,
+        )
+
+    def runner(self, data: RecordedFile) -> str:
+        try:
+            return self.submit(data).result()
+        except Exception as e:
+            logger.error(f"remote STT failed: {e!r}")
+            raise
+
+
+class LatencyWindow:
+    """최근 size개 응답 시간과 실패 횟수"""
+
+    def __init__(self, size: int = 100):
+        self.samples = deque[float](maxlen=size)
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def fail(self):
+        with self.lock:
+            self.failures += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self.lock:
+            samples = list(self.samples)
+        return float(np.percentile(samples, q)) if samples else None
+
+    def stats(self) -> dict[str, Any]:
+        return dict(
+            count=len(self.samples),
+            failures=self.failures,
+            p50=self.percentile(50),
+            p95=self.percentile(95),
+        )
+
+
+class HedgedSTT(STT):
+    """
+    발화를 primary에 먼저 보내고, primary 응답 시간의 percentile을 넘기도록 답이 없거나
+    실패하면 secondary에도 보내서 먼저 성공한 결과를 씁니다.
+    늦게 끝난 쪽의 응답 시간도 기록하므로 헤지 기준은 백엔드 상태에 맞춰 스스로 바뀝니다.
+    진 요청도 끝까지 돌기 때문에 백엔드마다 concurrency개까지만 동시에 맡기고,
+    secondary가 모두 사용 중이면 헤지하지 않고 primary를 기다립니다.
+    """
+
+    min_samples = 10  # 이보다 적게 기록되었으면 initial_delay를 씀
+
+    def __init__(
+        self,
+        primary: STT,
+        secondary: STT,
+        percentile: float,
+        initial_delay: float,
+        min_delay: float,
+    ):
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.concurrency = primary.concurrency
+        self.latencies = {primary: LatencyWindow(), secondary: LatencyWindow()}
+        # 같은 모델에서 디코딩이 겹치지 않도록 백엔드별 동시 실행 수 제한
+        self.slots = {
+            primary: threading.Semaphore(primary.concurrency),
+            secondary: threading.Semaphore(secondary.concurrency),
+        }
+        self.executor = ThreadPoolExecutor(
+            primary.concurrency + secondary.concurrency,
+            thread_name_prefix="hedged-stt",
+        )
+        # runner는 여러 스레드에서 동시에 불리므로 세는 값은 잠금 안에서 갱신
+        self.count_lock = threading.Lock()
+        self.turns = 0
+        self.hedged = 0
+        self.skipped = 0
+        self.secondary_wins = 0
+
+    def hedge_delay(self) -> float:
+        latencies = self.latencies[self.primary]
+        if len(latencies.samples) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, latencies.percentile(self.percentile) or 0.0)
+
+    def call(self, stt: STT, data: RecordedFile) -> str:
+        """slots[stt]를 잡은 상태에서 실행하고 끝나면 놓습니다."""
+        latencies = self.latencies[stt]
+        started = time.perf_counter()
+        try:
+            text = stt.runner(data)
+        except Exception:
+            latencies.fail()
+            raise
+        finally:
+            self.slots[stt].release()
+        latencies.observe(time.perf_counter() - started)
+        return text
+
+    def submit(
+        self, stt: STT, data: RecordedFile, blocking: bool = True
+    ) -> Optional[Future[str]]:
+        """blocking이 아니면 stt가 모두 사용 중일 때 None을 반환합니다."""
+        if not self.slots[stt].acquire(blocking=blocking):
+            return None
+        return self.executor.submit(self.call, stt, data)
+
+    def runner(self, data: RecordedFile) -> str:
+        with self.count_lock:
+            self.turns += 1
+        primary = self.submit(self.primary, data)
+        assert primary is not None
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done and primary.exception() is None:
+            return primary.result()
+        secondary = self.submit(self.secondary, data, blocking=False)
+        if secondary is None:
+            with self.count_lock:
+                self.skipped += 1
+            return primary.result()
+        with self.count_lock:
+            self.hedged += 1
+        pending = {primary, secondary}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is secondary:
+                        with self.count_lock:
+                            self.secondary_wins += 1
+                    return future.result()
+        # 둘 다 실패하면 primary의 오류를 올림
+        return primary.result()
+
+    def remember(self, data: RecordedFile, text: str):
+        self.primary.remember(data, text)
+        self.secondary.remember(data, text)
+
+    def stats(self) -> dict[str, Any]:
+        with self.count_lock:
+            counts = dict(
+                turns=self.turns,
+                hedged=self.hedged,
+                skipped=self.skipped,
+                secondary_wins=self.secondary_wins,
+            )
+        return dict(
+            counts,
+            hedge_delay=self.hedge_delay(),
+            primary=self.latencies[self.primary].stats(),
+            secondary=self.latencies[self.secondary].stats(),
+        )
+
+
+class StreamingUtterance:
+    """녹음 중인 한 발화의 누적 샘플과 확정/임시 전사 결과"""
+
+    def __init__(
+        self, p: pyaudio.PyAudio, rate: int, channels: int, device: Optional[int]
+    ):
+        self.p = p
+        self.rate = rate
+        self.channels = channels
+        self.device = device
+        self.chunks: list[np.ndarray] = []
+        self.samples = 0
+        self.committed: list[str] = []
+        self.committed_samples = 0
+        self.transcribed_samples = 0
+        self.partial = ""
+        # 호출어 판정 결과, 아직 판정 전이면 None
+        self.woke: Optional[bool] = None
+
+    def append(self, frames: np.ndarray):
+        if len(frames):
+            self.chunks.append(frames.reshape(-1))
+            self.samples += frames.size
+
+    def audio(self) -> np.ndarray:
+        if len(self.chunks) > 1:
+            self.chunks = [np.concatenate(self.chunks)]
+        return self.chunks[0] if self.chunks else np.empty(0, dtype=np.int16)
+
+    def to_recorded_file(self, audio: np.ndarray) -> RecordedFile:
+        return RecordedFile(
+            self.p,
+            ndarray=audio,
+            file_name="partial.wav",
+            rate=self.rate,
+            channels=self.channels,
+            device=self.device,
+        )
+
+    def text(self) -> str:
+        return " ".join([*self.committed, self.partial]).strip()
+
+
+class StreamingSTT(STT, RecordingListener):
+    """
+    녹음 중인 발화를 점점 커지는 창 단위로 백그라운드에서 미리 전사합니다.
+    창이 window 초를 넘으면 가장 조용한 지점에서 잘라 결과를 확정하므로,
+    침묵이 감지된 뒤에는 마지막 창만 전사하면 됩니다.
+    gate가 있으면 앞부분 gate_window 초로 판정을 통과한 발화만 미리 전사합니다.
+    """
+
+    def __init__(self, stt: STT, window: float, step: float):
+        self.stt = stt
+        self.concurrency = stt.concurrency
+        self.window = window
+        self.step = step
+        # 장치(스트림)별로 녹음 중인 발화
+        self.current: dict[AudioStream, StreamingUtterance] = {}
+        self.finished = weakref.WeakKeyDictionary[RecordedFile, StreamingUtterance]()
+        self.partial_listeners: list[Callable[[AudioStream, str], Any]] = []
+        self.gate: Optional[Callable[[RecordedFile], bool]] = None
+        self.gate_window = 0.0
+        self.lock = threading.Lock()
+        self.model_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.worker = threading.Thread(target=self.transcribe_loop, daemon=True)
+        self.worker.start()
+
+    def attach(self, stream: AudioStream):
+        stream.listeners.append(self)
+
+    def detach(self, stream: AudioStream):
+        if self in stream.listeners:
+            stream.listeners.remove(self)
+        with self.lock:
+            self.current.pop(stream, None)
+
+    def on_partial(self, listener: Callable[[AudioStream, str], Any]):
+        self.partial_listeners.append(listener)
+
+    def set_gate(self, gate: Callable[[RecordedFile], bool], window: float):
+        self.gate = gate
+        self.gate_window = window
+
+    def woke(self, data: RecordedFile) -> Optional[bool]:
+        """끝난 발화에 대해 이미 내린 gate 판정을 돌려줍니다."""
+        with self.lock:
+            utterance = self.finished.get(data)
+            return utterance.woke if utterance else None
+
+    def partial(self, stream: AudioStream) -> str:
+        with self.lock:
+            utterance = self.current.get(stream)
+            return utterance.text() if utterance else ""
+
+    def pending(self, utterance: StreamingUtterance) -> int:
+        return utterance.samples - utterance.transcribed_samples
+
+    def gated(self, utterance: StreamingUtterance) -> bool:
+        """판정에서 떨어졌거나 판정할 만큼 아직 녹음되지 않은 발화"""
+        if not self.gate:
+            return False
+        if utterance.woke is None:
+            return utterance.samples < self.gate_window * utterance.rate
+        return not utterance.woke
+
+    # RecordingListener
+    def on_start(self, session: RecordingSession, frames: np.ndarray):
+        stream = session.stream
+        with self.lock:
+            utterance = StreamingUtterance(
+                stream.p, stream.RATE, stream.CHANNELS, stream.device_index
+            )
+            utterance.append(frames)
+            self.current[stream] = utterance
+
+    def on_frames(self, session: RecordingSession, frames: np.ndarray):
+        with self.lock:
+            utterance = self.current.get(session.stream)
+            if not utterance:
+                return
+            utterance.append(frames)
+            if self.pending(utterance) >= self.step * utterance.rate:
+                self.wakeup.set()
+
+    def on_drop(self, session: RecordingSession):
+        with self.lock:
+            self.current.pop(session.stream, None)
+
+    def on_end(self, session: RecordingSession, recorded: RecordedFile):
+        with self.lock:
+            utterance = self.current.pop(session.stream, None)
+            if utterance and utterance.samples == len(recorded.ndarray):
+                self.finished[recorded] = utterance
+
+    def next_utterance(self):
+        # 밀린 오디오가 가장 많은 발화부터 처리
+        candidates = [
+            (stream, utterance)
+            for stream, utterance in self.current.items()
+            if self.pending(utterance) >= self.step * utterance.rate
+            and not self.gated(utterance)
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda item: self.pending(item[1]))
+
+    def transcribe_loop(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            with self.lock:
+                candidate = self.next_utterance()
+                if not candidate:
+                    continue
+                stream, utterance = candidate
+                gate = self.gate if utterance.woke is None else None
+                recorded = utterance.audio()
+                audio = recorded[utterance.committed_samples :]
+                end = utterance.samples
+            if gate:
+                # 호출어가 없는 발화는 큰 모델로 부분 전사하지 않음
+                woke = safe(gate)(utterance.to_recorded_file(recorded)).value_or(True)
+                with self.lock:
+                    utterance.woke = woke
+                    if not woke and self.next_utterance():
+                        self.wakeup.set()
+                if not woke:
+                    continue
+            commit = len(audio) >= self.window * utterance.rate
+            if commit:
+                audio = audio[: self.split_point(audio, utterance.rate)]
+            # 마지막 구간 전사(runner)가 중간 상태를 보지 않도록 갱신까지 모델 락을 잡음
+            with self.model_lock:
+                text = safe(self.transcribe)(utterance.to_recorded_file(audio))
+                with self.lock:
+                    if commit:
+                        utterance.committed.append(text.value_or(""))
+                        utterance.committed_samples += len(audio)
+                        utterance.partial = ""
+                        utterance.transcribed_samples = utterance.committed_samples
+                    else:
+                        utterance.partial = text.value_or(utterance.partial)
+                        utterance.transcribed_samples = end
+                    is_current = self.current.get(stream) is utterance
+                    hypothesis = utterance.text() if is_current else None
+                    if self.next_utterance():
+                        self.wakeup.set()
+            if hypothesis is not None:
+                for listener in self.partial_listeners:
+                    listener(stream, hypothesis)
+
+    def split_point(self, audio: np.ndarray, rate: int) -> int:
+        # 마지막 step 초 안에서 에너지가 가장 낮은 지점에서 창을 자름
+        frame = rate // 50
+        usable = len(audio) // frame * frame
+        search = max(frame, int(self.step * rate) // frame * frame)
+        tail = audio[usable - search : usable].reshape(-1, frame).astype(np.float32)
+        quietest = int(np.argmin(np.mean(tail * tail, axis=1)))
+        return usable - search + (quietest + 1) * frame
+
+    def transcribe(self, data: RecordedFile) -> str:
+        return self.stt.runner(data).strip()
+
+    def remember(self, data: RecordedFile, text: str):
+        self.stt.remember(data, text)
 
-        self.client = openai_loader()
+    def stats(self) -> dict[str, Any]:
+        return self.stt.stats()
 
     def runner(self, data: RecordedFile) -> str:
-        with data.to_file() as f:
-            try:
-                return self.client.audio.transcriptions.create(
-                    file=f,
-                    model="whisper-1",
-                ).text
-            except Exception as e:
-                print(e)
-                raise e
+        with self.model_lock:
+            with self.lock:
+                utterance = self.finished.pop(data, None)
+            if not utterance:
+                return self.transcribe(data)
+            # 확정된 창 이후의 마지막 구간만 전사
+            tail = data.ndarray[utterance.committed_samples :]
+            text = (
+                self.transcribe(utterance.to_recorded_file(tail)) if len(tail) else ""
+            )
+            return " ".join([*utterance.committed, text]).strip()
@@ -1,32 +1,116 @@
-from contextlib import contextmanager
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+import contextvars
+import queue
+import threading
+import time
+from typing import Any, Iterator, Mapping, Optional
 import uuid
 from gtts import gTTS
 import pyaudio
 from playsound import playsound
 import requests
-from returns.result import safe
+from requests.adapters import HTTPAdapter
+from returns.result import Failure, Result, Success, safe
 
+from converters.tts_cache import AudioCache
 from decorators.threaded import threaded
+import tracing
 
 
 class TTS:
 
-    def __init__(self, p: pyaudio.PyAudio, *args, **kwargs):
+    def __init__(
+        self, p: pyaudio.PyAudio, *args, cache: Optional[AudioCache] = None, **kwargs
+    ):
         self.p = p
+        self.cache = cache
+        self.speeches = queue.Queue[
+            tuple[str, contextvars.Context, Optional[tracing.Trace]]
+        ]()
+        self.speaker: Optional[threading.Thread] = None
 
     def runner(self, text: str): ...
 
-    @threaded
+    def enqueue(self, text: str):
+        """문장 단위 재생용. 넣은 순서대로 하나의 스레드에서 재생합니다."""
+        if self.speaker is None:
+            self.speaker = threading.Thread(target=self.speak_loop, daemon=True)
+            self.speaker.start()
+        # 재생 스레드에서도 넣은 쪽의 트레이스에 기록되도록 컨텍스트를 함께 넘김
+        self.speeches.put((text, contextvars.copy_context(), tracing.hold()))
+
+    def speak_loop(self):
+        while True:
+            text, context, trace = self.speeches.get()
+            context.run(safe(self.runner), text)
+            tracing.release(trace)
+
     def run(self, text: str):
-        return safe(self.runner)(text)
+        # 재생이 끝날 때까지 현재 턴의 트레이스를 열어 둠
+        return self.play(text, tracing.hold())
+
+    @threaded
+    def play(self, text: str, trace: Optional[tracing.Trace]):
+        try:
+            return safe(self.runner)(text)
+        finally:
+            tracing.release(trace)
+
+    async def arunner(self, text: str):
+        await asyncio.to_thread(self.runner, text)
+
+    async def arun(self, text: str) -> Result[None, Exception]:
+        try:
+            return Success(await self.arunner(text))
+        except Exception as e:
+            return Failure(e)
+
+    def stats(self) -> dict[str, Any]:
+        """로그로 남길 캐시 통계"""
+        return self.cache.stats() if self.cache else {}
 
     @staticmethod
-    def XTTS(p: pyaudio.PyAudio) -> "TTS":
-        return XTTS(p=p)
+    def XTTS(p: pyaudio.PyAudio, cache: Optional[AudioCache] = None) -> "TTS":
+        return XTTS(p=p, cache=cache)
 
     @staticmethod
-    def GTTS(p: pyaudio.PyAudio) -> "TTS":
-        return GTTS(p=p)
+    def GTTS(p: pyaudio.PyAudio, cache: Optional[AudioCache] = None) -> "TTS":
+        return GTTS(p=p, cache=cache)
+
+
+class JitterBuffer:
+    """
+    네트워크에서 들쭉날쭉하게 오는 PCM 조각을 고정 크기 프레임으로 맞춥니다.
+    재생 시작 전에 prefill 프레임만큼 미리 모아 초반 끊김을 줄입니다.
+    """
+
+    def __init__(self, frame_bytes: int, prefill: int):
+        self.frame_bytes = frame_bytes
+        self.prefill = prefill
+        self.buffer = bytearray()
+        self.started = False
+
+    def push(self, data: bytes) -> Iterator[bytes]:
+        self.buffer += data
+        if not self.started and len(self.buffer) < self.frame_bytes * self.prefill:
+            return
+        self.started = True
+        while len(self.buffer) >= self.frame_bytes:
+            yield bytes(self.buffer[: self.frame_bytes])
+            del self.buffer[: self.frame_bytes]
+
+    def flush_with(self, data: bytes) -> Iterator[bytes]:
+        yield from self.push(data)
+        yield from self.flush()
+
+    def flush(self) -> Iterator[bytes]:
+        self.started = True
+        yield from self.push(b"")
+        if self.buffer:
+            # 마지막 프레임은 무음으로 채워 프레임 크기를 맞춤
+            yield bytes(self.buffer) + bytes(self.frame_bytes - len(self.buffer))
+            self.buffer.clear()
 
 
 class XTTS(TTS):
@@ -34,37 +118,150 @@ class XTTS(TTS):
     format = pyaudio.paInt16
     rate = 24000
     chunk = 1024
+    prefill = 3  # 재생 시작 전에 모아둘 프레임 수
+    url = "http://localhost:8020/tts_stream"
+    headers = {"Content-Type": "application/json"}
+    timeout = (3.05, 30)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # keep-alive 연결을 재사용하는 세션
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.output: Optional[pyaudio.Stream] = None
+        self.output_lock = threading.Lock()
+        # 비동기 경로의 재생 순서. await 하는 동안 스레드 잠금을 들고 있지 않도록 따로 둠
+        self.async_output_lock = asyncio.Lock()
+
+    @property
+    def frame_bytes(self):
+        return self.chunk * self.channels * self.p.get_sample_size(self.format)
+
+    def params(self, text: str):
+        return {
+            "text": text,
+            "speaker_wav": "calm_female",
+            "language": "ko",
+        }
+
+    def cache_key(self, text: str):
+        params = self.params(text)
+        return AudioCache.key(text, params["speaker_wav"], params["language"])
+
+    def cached(self, text: str) -> Optional[bytes]:
+        return self.cache.get(self.cache_key(text)) if self.cache else None
+
+    def complete(self, headers: Mapping[str, str], data: bytes) -> bool:
+        """Content-Length와 샘플 크기로 응답을 끝까지 받았는지 확인합니다."""
+        length = headers.get("content-length")
+        if length and "content-encoding" not in headers and int(length) != len(data):
+            return False
+        return len(data) % (self.channels * self.p.get_sample_size(self.format)) == 0
+
+    def store(self, text: str, data: bytes, headers: Mapping[str, str]):
+        # 중간에 끊긴 응답이 캐시되면 다음부터 잘린 음성이 재생됨
+        if self.cache and data and self.complete(headers, data):
+            self.cache.put(self.cache_key(text), data)
 
     def runner(self, text: str):
-        with requests.get(
-            "http://localhost:8020/tts_stream",
-            headers={"Content-Type": "application/json"},
-            params={
-                "text": text,
-                "speaker_wav": "calm_female",
-                "language": "ko",
-            },
+        started = time.monotonic()
+        if (cached := self.cached(text)) is not None:
+            with self.player() as stream:
+                tracing.add("tts_first_byte", started, time.monotonic(), cached=True)
+                stream.write(
+                    b"".join(JitterBuffer(self.frame_bytes, 0).flush_with(cached))
+                )
+            tracing.add("tts_playback", started, time.monotonic(), cached=True)
+            return
+        recorded = bytearray()
+        with self.session.get(
+            self.url,
+            headers=self.headers,
+            params=self.params(text),
             stream=True,
+            timeout=self.timeout,
         ) as r:
+            r.raise_for_status()
             with self.player() as stream:
-                for chunk in r.iter_content(chunk_size=self.chunk):
-                    stream.write(chunk)
+                buffer = JitterBuffer(self.frame_bytes, self.prefill)
+                for chunk in r.iter_content(chunk_size=self.frame_bytes):
+                    if not recorded:
+                        tracing.add("tts_first_byte", started, time.monotonic())
+                    recorded += chunk
+                    for frame in buffer.push(chunk):
+                        stream.write(frame)
+                for frame in buffer.flush():
+                    stream.write(frame)
+        tracing.add("tts_playback", started, time.monotonic())
+        self.store(text, bytes(recorded), r.headers)
 
-    @contextmanager
-    def player(self):
-        try:
-            stream = self.p.open(
+    async def arunner(self, text: str):
+        from client_loaders import async_http_loader
+
+        started = time.monotonic()
+        if (cached := self.cached(text)) is not None:
+            async with self.aplayer() as stream:
+                tracing.add("tts_first_byte", started, time.monotonic(), cached=True)
+                frames = b"".join(JitterBuffer(self.frame_bytes, 0).flush_with(cached))
+                await asyncio.to_thread(stream.write, frames)
+            tracing.add("tts_playback", started, time.monotonic(), cached=True)
+            return
+        client = async_http_loader(asyncio.get_running_loop())
+        recorded = bytearray()
+        async with client.stream(
+            "GET", self.url, headers=self.headers, params=self.params(text)
+        ) as r:
+            r.raise_for_status()
+            async with self.aplayer() as stream:
+                buffer = JitterBuffer(self.frame_bytes, self.prefill)
+                async for chunk in r.aiter_bytes(self.frame_bytes):
+                    if not recorded:
+                        tracing.add("tts_first_byte", started, time.monotonic())
+                    recorded += chunk
+                    frames = b"".join(buffer.push(chunk))
+                    # 출력 장치 쓰기는 블로킹이므로 스레드 풀에서 실행
+                    if frames:
+                        await asyncio.to_thread(stream.write, frames)
+                await asyncio.to_thread(stream.write, b"".join(buffer.flush()))
+        tracing.add("tts_playback", started, time.monotonic())
+        self.store(text, bytes(recorded), r.headers)
+
+    def open_output(self) -> pyaudio.Stream:
+        """한 번 연 출력 스트림을 계속 재사용합니다. output_lock을 잡고 불러야 합니다."""
+        if self.output is None:
+            self.output = self.p.open(
                 format=self.format,
                 channels=self.channels,
                 rate=self.rate,
                 output=True,
                 frames_per_buffer=self.chunk,
             )
-            yield stream
-        finally:
-            print("done")
-            stream.stop_stream()
-            stream.close()
+        return self.output
+
+    @contextmanager
+    def player(self):
+        """동시에 한 발화만 재생됩니다."""
+        with self.output_lock:
+            yield self.open_output()
+
+    @asynccontextmanager
+    async def aplayer(self):
+        """비동기 경로용 player. 이벤트 루프를 막지 않고 차례를 기다립니다."""
+        async with self.async_output_lock:
+            # 장치를 여는 동안에도 루프를 막지 않도록 스레드에서 엶
+            yield await asyncio.to_thread(self.locked_output)
+
+    def locked_output(self) -> pyaudio.Stream:
+        with self.output_lock:
+            return self.open_output()
+
+    def close(self):
+        with self.output_lock:
+            if self.output is not None:
+                self.output.stop_stream()
+                self.output.close()
+                self.output = None
+        self.session.close()
 
 
 class GTTS(TTS):
@@ -73,9 +270,18 @@ class GTTS(TTS):
         super().__init__(*args, **kwargs)
 
     def runner(self, text: str):
-        tts = gTTS(text, lang="ko", slow=False)
-        tts.save(self.file_name)
-        self.player()
+        if not self.cache:
+            with tracing.span("tts_first_byte"):
+                tts = gTTS(text, lang="ko", slow=False)
+                tts.save(self.file_name)
+            return self.player()
+        key = AudioCache.key(text, "gtts", "ko")
+        with tracing.span("tts_first_byte"):
+            if not (file_name := self.cache.lookup_file(key, ".mp3")):
+                tts = gTTS(text, lang="ko", slow=False)
+                file_name = self.cache.store_file(key, ".mp3", tts.save)
+        self.player(file_name)
 
-    def player(self):
-        playsound(self.file_name)
+    def player(self, file_name: Optional[str] = None):
+        with tracing.span("tts_playback"):
+            playsound(file_name or self.file_name)
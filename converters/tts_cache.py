@@ -0,0 +1,151 @@
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+from typing import Callable, Optional
+
+
+class AudioCache:
+    """
+    합성된 음성을 (G2P 정규화된 텍스트, 화자, 언어) 해시로 보관합니다.
+    메모리에는 max_bytes 까지 LRU로, 디스크에는 directory 아래 파일로 max_disk_bytes 까지 저장하고
+    넘치면 가장 오래 안 쓴(mtime) 파일부터 지웁니다.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_disk_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict[str, bytes]()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.disk_bytes = sum(entry.stat().st_size for entry in self.files())
+        self.evicted = 0
+
+    def files(self) -> list[os.DirEntry]:
+        return [
+            entry
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and not entry.name.endswith(".tmp")
+        ]
+
+    @staticmethod
+    def key(text: str, speaker: str, language: str) -> str:
+        normalized = " ".join(text.split())
+        return hashlib.sha256(
+            "\0".join([normalized, speaker, language]).encode("utf-8")
+        ).hexdigest()
+
+    def path(self, key: str, suffix: str = ".pcm") -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def remember(self, key: str, data: bytes):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return
+            self.memory[key] = data
+            self.memory_bytes += len(data)
+            while self.memory_bytes > self.max_bytes and len(self.memory) > 1:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return data
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            # 없거나 읽는 사이 evict로 지워진 경우
+            self.count(hit=False)
+            return None
+        self.touch(path)
+        self.count(hit=True)
+        self.remember(key, data)
+        return data
+
+    def count(self, hit: bool):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, key: str, data: bytes):
+        self.remember(key, data)
+        self.store_file(key, ".pcm", lambda path: self.write(path, data))
+
+    @staticmethod
+    def write(path: str, data: bytes):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def lookup_file(self, key: str, suffix: str) -> Optional[str]:
+        """파일로만 재생할 수 있는 형식(mp3 등)의 캐시 경로"""
+        path = self.path(key, suffix)
+        if os.path.exists(path):
+            self.touch(path)
+            self.count(hit=True)
+            return path
+        self.count(hit=False)
+        return None
+
+    def store_file(self, key: str, suffix: str, writer: Callable[[str], None]) -> str:
+        path = self.path(key, suffix)
+        temp = f"{path}.{threading.get_ident()}.tmp"
+        writer(temp)
+        with self.lock:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            # 다 쓴 뒤에 교체해서 재생 중 깨진 파일을 읽지 않도록 함
+            os.replace(temp, path)
+            self.disk_bytes += os.path.getsize(path) - previous
+            if self.disk_bytes > self.max_disk_bytes:
+                self.evict(keep=path)
+        return path
+
+    @staticmethod
+    def touch(path: str):
+        # 디스크 항목의 LRU 순서는 mtime으로 관리
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def evict(self, keep: str):
+        """디스크 사용량이 max_disk_bytes의 90% 아래로 내려갈 때까지 오래된 파일부터 지웁니다."""
+        target = self.max_disk_bytes * 0.9
+        entries = sorted(self.files(), key=lambda entry: entry.stat().st_mtime)
+        self.disk_bytes = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.disk_bytes <= target:
+                break
+            if entry.path == keep:
+                continue
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self.disk_bytes -= size
+            self.evicted += 1
+
+    def stats(self) -> dict[str, float]:
+        with self.lock:
+            total = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / total if total else 0.0,
+                memory_bytes=self.memory_bytes,
+                disk_bytes=self.disk_bytes,
+                evicted=self.evicted,
+            )
@@ -0,0 +1,221 @@
+import itertools
+import logging
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+import queue
+import threading
+from concurrent.futures import Future
+from typing import NamedTuple, Optional
+import numpy as np
+
+# 이 모듈은 spawn된 워커 프로세스에서도 import 되므로 무거운 의존성은 함수 안에서 import 합니다.
+
+SAMPLE_RATE = 16000
+MAX_BATCH_DURATION = 30  # Whisper 한 번의 디코딩 입력 길이 (초)
+
+logger = logging.getLogger("Secretary")
+
+
+class WhisperTask(NamedTuple):
+    task_id: int
+    shm_name: str
+    length: int
+
+
+class WhisperTaskResult(NamedTuple):
+    task_id: int
+    text: str
+    error: Optional[str]
+
+
+def load_task(task: WhisperTask) -> np.ndarray:
+    shm = SharedMemory(name=task.shm_name)
+    try:
+        view = np.ndarray((task.length,), dtype=np.float32, buffer=shm.buf)
+        audio = view.copy()
+        del view
+    finally:
+        shm.close()
+    return audio
+
+
+def transcribe_batch(model, audios: list[np.ndarray], language: str) -> list[str]:
+    import torch
+    import whisper
+
+    texts = [""] * len(audios)
+    short = [
+        i for i, a in enumerate(audios) if len(a) <= MAX_BATCH_DURATION * SAMPLE_RATE
+    ]
+    if short:
+        # 30초 이하 구간은 mel을 쌓아서 한 번에 디코딩
+        mel = torch.stack(
+            [
+                whisper.log_mel_spectrogram(
+                    whisper.pad_or_trim(torch.from_numpy(audios[i])),
+                    n_mels=model.dims.n_mels,
+                )
+                for i in short
+            ]
+        ).to(model.device)
+        options = whisper.DecodingOptions(language=language, fp16=False)
+        for i, result in zip(short, whisper.decode(model, mel, options)):
+            texts[i] = result.text
+    for i, audio in enumerate(audios):
+        if i not in short:
+            texts[i] = model.transcribe(audio, fp16=False, language=language)["text"]
+    return texts
+
+
+def worker(
+    model_name: str,
+    device: Optional[str],
+    language: str,
+    batch_size: int,
+    tasks: "mp.Queue[Optional[WhisperTask]]",
+    results: "mp.Queue[WhisperTaskResult]",
+):
+    import whisper
+
+    model = whisper.load_model(name=model_name, device=device)
+    running = True
+    while running:
+        task = tasks.get()
+        if task is None:
+            break
+        batch = [task]
+        # 동시에 도착한 구간을 배치로 묶음
+        while len(batch) < batch_size:
+            try:
+                task = tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                running = False
+                break
+            batch.append(task)
+        # 시간이 초과되어 부모가 이미 지운 공유 메모리는 건너뜀
+        audios = []
+        for t in batch[:]:
+            try:
+                audios.append(load_task(t))
+            except FileNotFoundError as e:
+                batch.remove(t)
+                results.put(WhisperTaskResult(t.task_id, "", repr(e)))
+        if not batch:
+            continue
+        try:
+            texts = transcribe_batch(model, audios, language)
+            for t, text in zip(batch, texts):
+                results.put(WhisperTaskResult(t.task_id, text, None))
+        except Exception as e:
+            for t in batch:
+                results.put(WhisperTaskResult(t.task_id, "", repr(e)))
+
+
+class WhisperPool:
+    """
+    모델을 한 번씩 로드한 워커 프로세스 N개에 공유 메모리로 오디오를 넘겨 전사합니다.
+    워커가 죽으면 어느 작업을 들고 있었는지 알 수 없으므로 대기 중인 작업을 모두 실패시키고
+    새 워커를 띄웁니다.
+    """
+
+    poll_interval = 1.0  # 워커 생존 확인 간격 (초)
+
+    def __init__(
+        self,
+        model_name: str,
+        device: Optional[str],
+        workers: int,
+        batch_size: int,
+        language: str = "ko",
+    ):
+        self.context = mp.get_context("spawn")
+        self.tasks: "mp.Queue[Optional[WhisperTask]]" = self.context.Queue()
+        self.results: "mp.Queue[WhisperTaskResult]" = self.context.Queue()
+        self.args = (model_name, device, language, batch_size, self.tasks, self.results)
+        self.processes = [self.spawn() for _ in range(workers)]
+        self.closing = False
+        self.pending: dict[int, tuple[Future[str], SharedMemory]] = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.collector = threading.Thread(target=self.collect, daemon=True)
+        self.collector.start()
+
+    def spawn(self):
+        process = self.context.Process(target=worker, args=self.args, daemon=True)
+        process.start()
+        return process
+
+    def submit(self, audio: np.ndarray) -> Future[str]:
+        return self.enqueue(audio)[1]
+
+    def enqueue(self, audio: np.ndarray) -> tuple[int, Future[str]]:
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        shm = SharedMemory(create=True, size=max(1, audio.nbytes))
+        view = np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)
+        view[:] = audio
+        del view
+        future = Future[str]()
+        task_id = next(self.counter)
+        with self.lock:
+            self.pending[task_id] = (future, shm)
+        self.tasks.put(WhisperTask(task_id, shm.name, len(audio)))
+        return task_id, future
+
+    def transcribe(self, audio: np.ndarray, timeout: Optional[float]) -> str:
+        task_id, future = self.enqueue(audio)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            # 워커가 나중에 이 작업을 꺼내면 공유 메모리가 없어 건너뜀
+            self.finish(task_id, TimeoutError(f"no result in {timeout}s"))
+            raise
+
+    def finish(self, task_id: int, error: Optional[Exception] = None, text: str = ""):
+        """대기 중인 작업을 끝내고 공유 메모리를 지웁니다. 이미 끝났으면 무시합니다."""
+        with self.lock:
+            entry = self.pending.pop(task_id, None)
+        if entry is None:
+            return
+        future, shm = entry
+        shm.close()
+        shm.unlink()
+        if future.done():
+            return
+        if error:
+            future.set_exception(error)
+        else:
+            future.set_result(text)
+
+    def check_workers(self):
+        dead = [p for p in self.processes if not p.is_alive()]
+        if not dead or self.closing:
+            return
+        codes = ", ".join(str(p.exitcode) for p in dead)
+        logger.error(f"whisper worker exited ({codes}), failing pending tasks")
+        with self.lock:
+            task_ids = list(self.pending)
+        for task_id in task_ids:
+            self.finish(task_id, RuntimeError(f"whisper worker exited ({codes})"))
+        self.processes = [self.spawn() if p in dead else p for p in self.processes]
+
+    def collect(self):
+        while True:
+            try:
+                result = self.results.get(timeout=self.poll_interval)
+            except queue.Empty:
+                self.check_workers()
+                continue
+            if result is None:
+                break
+            error = RuntimeError(result.error) if result.error else None
+            self.finish(result.task_id, error, result.text)
+
+    def close(self):
+        self.closing = True
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join()
+        self.results.put(None)  # type:ignore
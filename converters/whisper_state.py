@@ -0,0 +1,96 @@
+from collections import deque
+import threading
+from typing import Any, Iterable, Optional
+
+from recorder.recorded_file import RecordedFile
+
+# whisper.audio 상수. 모듈을 import 하지 않고도 길이를 비교할 수 있게 둠
+SAMPLE_RATE = 16000
+N_SAMPLES = 30 * SAMPLE_RATE  # Whisper 한 번의 디코딩 입력 길이
+
+
+class PromptHistory:
+    """
+    장치(세션)별 최근 전사를 호출어/용어와 함께 initial_prompt로 만들어 줍니다.
+    Whisper 프롬프트는 224 토큰까지만 쓰이므로 max_chars를 넘으면 오래된 쪽부터 자릅니다.
+    """
+
+    def __init__(self, terms: Iterable[str], size: int, max_chars: int = 200):
+        self.terms = ", ".join(terms)
+        self.size = size
+        self.max_chars = max_chars
+        self.history: dict[Optional[int], deque[str]] = {}
+        self.lock = threading.Lock()
+
+    def prompt(self, device: Optional[int]) -> Optional[str]:
+        with self.lock:
+            recent = " ".join(self.history.get(device, ()))
+        budget = max(0, self.max_chars - len(self.terms))
+        recent = recent[len(recent) - budget :].strip() if budget else ""
+        prompt = " ".join(part for part in (self.terms, recent) if part)
+        return prompt or None
+
+    def remember(self, device: Optional[int], text: str):
+        text = text.strip()
+        if not text or not self.size:
+            return
+        with self.lock:
+            history = self.history.get(device)
+            if history is None:
+                history = self.history[device] = deque(maxlen=self.size)
+            history.append(text)
+
+
+class MelFrontEnd:
+    """
+    30초 입력 버퍼, STFT 창, mel 필터 뱅크를 한 번만 만들어 두고 매 발화에 재사용합니다.
+    int16 샘플은 버퍼에 바로 float32로 변환되고, 이전 발화가 남긴 꼬리만 0으로 지웁니다.
+    """
+
+    def __init__(self, n_mels: int, device: Any):
+        import torch
+        from whisper.audio import N_FFT, mel_filters
+
+        self.buffer = torch.zeros(N_SAMPLES, dtype=torch.float32)
+        self.samples = self.buffer.numpy()
+        self.filled = 0
+        self.device = device
+        self.window = torch.hann_window(N_FFT, device=device)
+        self.filters = mel_filters(device, n_mels)
+        self.lock = threading.Lock()
+
+    def __call__(self, data: RecordedFile):
+        """30초 이하 발화의 (n_mels, 3000) log-mel 스펙트로그램"""
+        import torch
+        from whisper.audio import HOP_LENGTH, N_FFT
+
+        size = len(data.ndarray)
+        if size > N_SAMPLES:
+            raise ValueError(f"audio longer than {N_SAMPLES} samples: {size}")
+        with self.lock:
+            data.translate_16_to_32(out=self.samples[:size])
+            if self.filled > size:
+                self.samples[size : self.filled] = 0
+            self.filled = size
+            # whisper.log_mel_spectrogram(pad_or_trim(audio))와 같은 계산
+            stft = torch.stft(
+                self.buffer.to(self.device),
+                N_FFT,
+                HOP_LENGTH,
+                window=self.window,
+                return_complex=True,
+            )
+            magnitudes = stft[..., :-1].abs() ** 2
+            log_spec = torch.clamp(self.filters @ magnitudes, min=1e-10).log10()
+        log_spec = torch.maximum(log_spec, log_spec.max() - 8.0)
+        return (log_spec + 4.0) / 4.0
+
+
+def is_fallback(result: Any) -> bool:
+    """whisper.transcribe가 더 높은 temperature로 다시 디코딩하는 조건"""
+    return result.compression_ratio > 2.4 or result.avg_logprob < -1.0
+
+
+def is_silence(result: Any) -> bool:
+    """whisper.transcribe가 무음 구간으로 건너뛰는 조건"""
+    return result.no_speech_prob > 0.6 and result.avg_logprob < -1.0
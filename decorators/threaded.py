@@ -1,3 +1,4 @@
+import contextvars
 import queue
 import threading
 from functools import wraps
@@ -14,7 +15,11 @@ class Thread(Generic[P, T]):
         self.args = args
         self.kwargs = kwargs
         self.queue = queue.Queue[Result[T, Exception]]()
-        self.thread = threading.Thread(target=self.run_with_result)
+        # 호출한 쪽의 contextvars(트레이스 등)를 스레드에서도 이어서 사용
+        self.context = contextvars.copy_context()
+        self.thread = threading.Thread(
+            target=self.context.run, args=(self.run_with_result,)
+        )
         self.thread.start()
 
     def run_with_result(self):
@@ -1,7 +1,11 @@
 class RequestLimitError(Exception): ...
 
 
-class ThresholdExceed(Exception): ...
+class StreamClosedError(Exception): ...
+
+
+class SpeculationAborted(Exception):
+    """Raised when a speculative request would call a function with side effects."""
 
 
 class ExecutionLimitExceededError(Exception):
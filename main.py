@@ -1,6 +1,13 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
 import logging
+import queue
+import threading
+import time
+from typing import Optional
 import pyaudio
-from returns.result import safe
+from returns.result import Result, Success, safe
 
 from ai.ai import AI
 from translations import t
@@ -11,9 +18,20 @@ from utils import (
 )
 from converters.stt import STT
 from converters.tts import TTS
-from recorder.audio_recorder import AudioStream
+from recorder.recorded_file import RecordedFile
+from pipeline import Pipeline
+from sessions import DeviceSession, LatencyMetrics
 from settings import Setting
-from client_loaders import tts_loader, stt_loader, ai_loader
+from ai.speculation import SpeculativeAI
+from client_loaders import (
+    tts_loader,
+    stt_loader,
+    ai_loader,
+    audio_stream_loader,
+    speculator_loader,
+    tracer_loader,
+)
+import tracing
 
 # TODO:
 # [O] WHISPER 서버를 이용한 음성 인식 기능 추가
@@ -24,38 +42,207 @@ from client_loaders import tts_loader, stt_loader, ai_loader
 logger = logging.getLogger("Secretary")
 
 
+def traced_turn(session: DeviceSession, audio_data: Result[RecordedFile, Exception]):
+    marks = audio_data.map(lambda recorded: recorded.marks).value_or({})
+    return tracing.turn(tracer_loader(), session.device_index, marks)
+
+
+def handle_turn(
+    audio_data: Result[RecordedFile, Exception],
+    stt: STT,
+    tts: TTS,
+    ai: AI,
+    g2p,
+    metrics: LatencyMetrics,
+    speculator: Optional[SpeculativeAI] = None,
+):
+    respond(
+        transcribe(audio_data, stt, metrics), stt, tts, ai, g2p, metrics, speculator
+    )
+
+
+def transcribe(
+    audio_data: Result[RecordedFile, Exception], stt: STT, metrics: LatencyMetrics
+) -> str:
+    # 오디오 데이터를 텍스트로 변환
+    with metrics.measure("stt"):
+        return audio_data.map(stt.run).value_or("").strip()
+
+
+def respond(
+    prompt: str,
+    stt: STT,
+    tts: TTS,
+    ai: AI,
+    g2p,
+    metrics: LatencyMetrics,
+    speculator: Optional[SpeculativeAI] = None,
+):
+    logger.info(t("prompt: {{prompt}}", prompt=prompt))
+    if not prompt:
+        return
+    if Setting.CHAT_STREAMING and not speculator:
+        return handle_streaming_turn(prompt, tts, ai, g2p, metrics)
+    # 텍스트로 ai 응답 생성 (추측 요청이 맞으면 그 응답을 사용)
+    with metrics.measure("ai"):
+        response = is_ai_call(prompt).bind(speculator.run if speculator else ai.run)
+    if speculator:
+        logger.info(t("speculation: {{stats}}", stats=str(speculator.stats())))
+    if stats := ai.stats():
+        logger.info(t("response cache: {{stats}}", stats=str(stats)))
+    if stats := stt.stats():
+        logger.info(t("stt: {{stats}}", stats=str(stats)))
+    logger.debug(f"{response=}")
+    # 응답을 tts로 출력해야됨
+    response.map(lambda r: logger.info(t("{{response}}", response=r)))
+    response.map(discord_webhook(prompt))
+    with metrics.measure("g2p"):
+        speech = response.bind(safe(g2p))
+    speech.map(tts.run)
+    if stats := tts.stats():
+        logger.info(t("tts cache: {{stats}}", stats=str(stats)))
+
+
+def handle_streaming_turn(prompt: str, tts: TTS, ai: AI, g2p, metrics: LatencyMetrics):
+    # 응답이 생성되는 동안 완성된 문장부터 바로 tts로 재생
+    @safe
+    def speak(message: str):
+        started = time.perf_counter()
+        sentences = []
+        for sentence in ai.stream(message):
+            if not sentences:
+                metrics.record("ai_first_sentence", time.perf_counter() - started)
+            sentences.append(sentence)
+            with tracing.span("g2p"):
+                speech = safe(g2p)(sentence)
+            speech.map(tts.enqueue)
+        metrics.record("ai", time.perf_counter() - started)
+        return " ".join(sentences)
+
+    response = is_ai_call(prompt).bind(speak)
+    logger.debug(f"{response=}")
+    response.map(lambda r: logger.info(t("{{response}}", response=r)))
+    response.map(discord_webhook(prompt))
+
+
 @safe(exceptions=(KeyboardInterrupt, Exception))  # type:ignore
-def loop(p: pyaudio.PyAudio, device_index: int, stt: STT, tts: TTS, ai: AI):
+def loop(p: pyaudio.PyAudio, session: DeviceSession, stt: STT, tts: TTS):
     from g2pk import G2p
 
     g2p = G2p()
 
-    with AudioStream(p, device_index) as stream:
+    with audio_stream_loader(p, session.device_index) as stream:
+        session.attach(stt, stream)
         logger.info(t("실시간 음성 입력을 녹음하고 변환합니다."))
         while True:
             # 오디오 데이터 반환
             audio_data = stream.detect_audio()
-            # 오디오 데이터를 텍스트로 변환
-            prompt = audio_data.map(stt.run).value_or("").strip()
-            logger.info(t("prompt: {{prompt}}", prompt=prompt))
-            if not prompt:
-                continue
-            # 텍스트로 ai 응답 생성
-            response = is_ai_call(prompt).bind(ai.run)
-            print(f"{response=}")
-            # 응답을 tts로 출력해야됨
-            response.map(lambda r: logger.info(t("{{response}}", response=r)))
-            response.map(discord_webhook(prompt))
-            response.bind(safe(g2p)).map(tts.run)
+            with traced_turn(session, audio_data):
+                handle_turn(
+                    audio_data,
+                    stt,
+                    tts,
+                    session.ai,
+                    g2p,
+                    session.metrics,
+                    session.speculator,
+                )
+
+
+@safe(exceptions=(KeyboardInterrupt, Exception))  # type:ignore
+def multi_loop(p: pyaudio.PyAudio, sessions: list[DeviceSession], stt: STT, tts: TTS):
+    """장치마다 녹음 스레드를 두고, 잘린 발화는 하나의 STT/AI/TTS 파이프라인에서 처리합니다."""
+    from g2pk import G2p
+
+    g2p = G2p()
+    segments = queue.Queue[tuple[DeviceSession, Result[RecordedFile, Exception]]]()
+    # 전사는 stt.concurrency개까지 겹쳐서 돌리고, 응답은 들어온 순서대로 하나씩 처리
+    transcripts = queue.Queue[
+        tuple[DeviceSession, Optional[tracing.Trace], Future[str]]
+    ](maxsize=stt.concurrency)
+
+    def transcribe_segments(executor: ThreadPoolExecutor):
+        while True:
+            session, audio_data = segments.get()
+            marks = audio_data.map(lambda recorded: recorded.marks).value_or({})
+            trace = tracing.begin(tracer_loader(), session.device_index, marks)
+
+            def run(session=session, audio_data=audio_data, trace=trace):
+                with tracing.use(trace):
+                    return transcribe(audio_data, stt, session.metrics)
+
+            transcripts.put((session, trace, executor.submit(run)))
+
+    with ExitStack() as stack:
+        executor = stack.enter_context(
+            ThreadPoolExecutor(stt.concurrency, thread_name_prefix="stt")
+        )
+        for session in sessions:
+            stream = stack.enter_context(audio_stream_loader(p, session.device_index))
+            session.attach(stt, stream)
+            threading.Thread(
+                target=session.listen, args=(stream, segments), daemon=True
+            ).start()
+        threading.Thread(
+            target=transcribe_segments, args=(executor,), daemon=True
+        ).start()
+        logger.info(t("실시간 음성 입력을 녹음하고 변환합니다."))
+        while True:
+            session, trace, prompt = transcripts.get()
+            try:
+                with tracing.use(trace):
+                    respond(
+                        prompt.result(),
+                        stt,
+                        tts,
+                        session.ai,
+                        g2p,
+                        session.metrics,
+                        session.speculator,
+                    )
+            finally:
+                tracing.end(trace)
+            logger.info(
+                t(
+                    "device {{device}}: {{metrics}}",
+                    device=str(session.device_index),
+                    metrics=str(session.metrics.summary()),
+                )
+            )
+
+
+@safe(exceptions=(KeyboardInterrupt, Exception))  # type:ignore
+def async_loop(p: pyaudio.PyAudio, sessions: list[DeviceSession], stt: STT, tts: TTS):
+    from g2pk import G2p
+
+    return asyncio.run(Pipeline(stt, tts, G2p()).run(p, sessions))
+
+
+def create_session(device_index: int, ai: AI) -> DeviceSession:
+    return DeviceSession(device_index, ai, speculator_loader(ai))
 
 
 def main():
     p = pyaudio.PyAudio()
     tts = tts_loader(p)
     stt = stt_loader()
-    ai = ai_loader()
-    device = get_record_device(p)
-    result = device.bind(lambda x: loop(p, x, tts=tts, stt=stt, ai=ai))
+    if Setting.RECORD_DEVICES:
+        sessions = Success(
+            [
+                create_session(device_index, ai_loader(device_index))
+                for device_index in Setting.RECORD_DEVICES
+            ]
+        )
+    else:
+        sessions = get_record_device(p).map(
+            lambda x: [create_session(x, ai_loader())]
+        )
+    if Setting.PIPELINE == "async":
+        result = sessions.bind(lambda x: async_loop(p, x, stt=stt, tts=tts))
+    elif Setting.RECORD_DEVICES:
+        result = sessions.bind(lambda x: multi_loop(p, x, stt=stt, tts=tts))
+    else:
+        result = sessions.bind(lambda x: loop(p, x[0], tts=tts, stt=stt))
     logger.error(result.failure())
     logger.info(t("프로그램 종료."))
     p.terminate()
@@ -0,0 +1,210 @@
+import asyncio
+from contextlib import ExitStack, asynccontextmanager
+import logging
+from typing import Any, Callable, Optional, TypeVar
+import pyaudio
+from returns.pipeline import is_successful
+from returns.result import Result
+
+from converters.stt import STT
+from converters.tts import TTS
+from recorder.audio_recorder import AudioStream
+from recorder.recorded_file import RecordedFile
+from sessions import DeviceSession
+from translations import t
+from utils import adiscord_webhook, is_ai_call
+from client_loaders import audio_stream_loader, tracer_loader
+import tracing
+
+Item = tuple[DeviceSession, Optional[tracing.Trace], str]
+T = TypeVar("T")
+
+logger = logging.getLogger("Secretary")
+
+
+class Pipeline:
+    """
+    녹음 -> STT -> AI -> G2P -> TTS 단계를 크기가 제한된 asyncio 큐로 잇습니다.
+    뒷 단계가 밀리면 앞 단계의 put이 대기하므로(backpressure) 메모리가 무한히 늘지 않고,
+    서로 다른 발화의 단계들이 겹쳐서 실행됩니다.
+    """
+
+    def __init__(self, stt: STT, tts: TTS, g2p: Callable[[str], str], maxsize: int = 2):
+        self.stt = stt
+        self.tts = tts
+        self.g2p = g2p
+        self.audios = asyncio.Queue[
+            tuple[DeviceSession, Result[RecordedFile, Exception]]
+        ](maxsize)
+        # 동시에 전사 중인 발화. 결과는 들어온 순서대로 꺼냄
+        self.transcripts = asyncio.Queue[
+            tuple[DeviceSession, Optional[tracing.Trace], asyncio.Task[str]]
+        ](stt.concurrency)
+        self.stt_slots = asyncio.Semaphore(stt.concurrency)
+        # 단계 사이로 발화별 트레이스를 함께 넘김
+        self.prompts = asyncio.Queue[Item](maxsize)
+        self.responses = asyncio.Queue[Item](maxsize)
+        self.speeches = asyncio.Queue[Item](maxsize)
+        self.background = set[asyncio.Task[Any]]()
+
+    def spawn(self, coroutine):
+        # 완료 전에 가비지 컬렉션되지 않도록 참조를 보관
+        task = asyncio.create_task(coroutine)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+        return task
+
+    @asynccontextmanager
+    async def take(self, queue: "asyncio.Queue[T]"):
+        # 처리가 끝나야 task_done을 불러서 종료할 때 join()으로 남은 항목을 기다릴 수 있음
+        item = await queue.get()
+        try:
+            yield item
+        finally:
+            queue.task_done()
+
+    async def record_stage(
+        self, session: DeviceSession, stream: AudioStream
+    ) -> Result[RecordedFile, Exception]:
+        while True:
+            audio_data = await asyncio.to_thread(stream.detect_audio)
+            await self.audios.put((session, audio_data))
+            if not is_successful(audio_data):
+                return audio_data
+
+    async def stt_stage(self):
+        # 원격 STT처럼 느린 전사가 녹음을 막지 않도록 stt.concurrency개까지 겹쳐서 전사
+        while True:
+            async with self.take(self.audios) as (session, audio_data):
+                marks = audio_data.map(lambda recorded: recorded.marks).value_or({})
+                trace = tracing.begin(tracer_loader(), session.device_index, marks)
+                task = self.spawn(self.transcribe(session, trace, audio_data))
+                await self.transcripts.put((session, trace, task))
+
+    async def transcribe(
+        self,
+        session: DeviceSession,
+        trace: Optional[tracing.Trace],
+        audio_data: Result[RecordedFile, Exception],
+    ) -> str:
+        async with self.stt_slots:
+            with tracing.use(trace), session.metrics.measure("stt"):
+                return await asyncio.to_thread(
+                    lambda: audio_data.map(self.stt.run).value_or("").strip()
+                )
+
+    async def prompt_stage(self):
+        while True:
+            async with self.take(self.transcripts) as (session, trace, task):
+                try:
+                    prompt = await task
+                except Exception as e:
+                    logger.error(e)
+                    prompt = ""
+                logger.info(t("prompt: {{prompt}}", prompt=prompt))
+                if stats := self.stt.stats():
+                    logger.info(t("stt: {{stats}}", stats=str(stats)))
+                if prompt:
+                    await self.prompts.put((session, trace, prompt))
+                else:
+                    tracing.end(trace)
+
+    async def ai_stage(self):
+        # 컨텍스트 순서를 지키기 위해 AI 단계는 하나의 태스크에서 순차 처리
+        while True:
+            async with self.take(self.prompts) as (session, trace, prompt):
+                call = is_ai_call(prompt)
+                if not is_successful(call):
+                    tracing.end(trace)
+                    continue
+                with tracing.use(trace), session.metrics.measure("ai"):
+                    if session.speculator:
+                        response = await asyncio.to_thread(
+                            session.speculator.run, call.unwrap()
+                        )
+                    else:
+                        response = await session.ai.arun(call.unwrap())
+                if stats := session.ai.stats():
+                    logger.info(t("response cache: {{stats}}", stats=str(stats)))
+                logger.debug(f"{response=}")
+                if not is_successful(response):
+                    logger.error(response.failure())
+                    tracing.end(trace)
+                    continue
+                text = response.unwrap()
+                logger.info(t("{{response}}", response=text))
+                self.spawn(adiscord_webhook(prompt, text))
+                await self.responses.put((session, trace, text))
+
+    async def g2p_stage(self):
+        while True:
+            async with self.take(self.responses) as (session, trace, response):
+                with tracing.use(trace), session.metrics.measure("g2p"):
+                    speech = await asyncio.to_thread(self.g2p, response)
+                await self.speeches.put((session, trace, speech))
+
+    async def tts_stage(self):
+        while True:
+            async with self.take(self.speeches) as (session, trace, speech):
+                with tracing.use(trace), session.metrics.measure("tts"):
+                    result = await self.tts.arun(speech)
+                tracing.end(trace)
+                if not is_successful(result):
+                    logger.error(result.failure())
+                if stats := self.tts.stats():
+                    logger.info(t("tts cache: {{stats}}", stats=str(stats)))
+
+    async def drain(self):
+        """앞 단계부터 차례로 큐가 빌 때까지 기다립니다."""
+        for queue in (
+            self.audios,
+            self.transcripts,
+            self.prompts,
+            self.responses,
+            self.speeches,
+        ):
+            await queue.join()
+
+    async def run(self, p: pyaudio.PyAudio, sessions: list[DeviceSession]):
+        with ExitStack() as stack:
+            recorders = []
+            for session in sessions:
+                stream = stack.enter_context(
+                    audio_stream_loader(p, session.device_index)
+                )
+                session.attach(self.stt, stream)
+                recorders.append(self.record_stage(session, stream))
+            logger.info(t("실시간 음성 입력을 녹음하고 변환합니다."))
+            stages = [
+                asyncio.create_task(stage)
+                for stage in (
+                    self.stt_stage(),
+                    self.prompt_stage(),
+                    self.ai_stage(),
+                    self.g2p_stage(),
+                    self.tts_stage(),
+                )
+            ]
+            try:
+                # 모든 녹음이 끝나면 남은 발화를 마저 처리하고 단계들을 멈춤
+                results = await self.watch(asyncio.gather(*recorders), stages)
+                await self.watch(self.drain(), stages)
+            finally:
+                for stage in stages:
+                    stage.cancel()
+                await asyncio.gather(*stages, return_exceptions=True)
+            # 녹음은 실패했을 때만 끝나므로 그 오류를 호출한 쪽으로 올림
+            raise results[0].failure()
+
+    async def watch(self, awaitable, stages: list[asyncio.Task[None]]):
+        """awaitable을 기다리는 동안 단계가 오류로 멈추면 그 오류를 올립니다."""
+        task = asyncio.ensure_future(awaitable)
+        done, _ = await asyncio.wait(
+            [task, *stages], return_when=asyncio.FIRST_COMPLETED
+        )
+        if task not in done:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            for stage in done:
+                stage.result()
+        return await task
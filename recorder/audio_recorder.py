@@ -1,13 +1,19 @@
-from collections import deque
-from typing import Any
+import queue
+import threading
+import time
+from typing import Any, Optional
 import pyaudio
 import numpy as np
 from returns.maybe import maybe, Maybe
-from returns.result import safe, Result, attempt
+from returns.pipeline import is_successful
+from returns.result import safe, Result
 
-from exceptions import ThresholdExceed
-from recorder.fixed_queue import FixedQueue
+from recorder.calibration import NoiseCalibrator
+from recorder.frame_arena import FrameArena
 from recorder.recorded_file import RecordedFile
+from recorder.resampler import CaptureFrontEnd
+from recorder.ring_buffer import RingBuffer
+from recorder.vad import AudioFrames, VoiceActivityDetector
 
 AudioChunk = np.ndarray[Any, np.dtype[np.int16]]
 
@@ -16,6 +22,15 @@ def get_volume(audio_chunk: np.ndarray):
     return np.max(np.abs(audio_chunk))
 
 
+class RecordingListener:
+    """RecordingSession이 발화 구간을 나누는 동안 프레임을 넘겨받는 리스너"""
+
+    def on_start(self, session: "RecordingSession", frames: AudioFrames): ...
+    def on_frames(self, session: "RecordingSession", frames: AudioFrames): ...
+    def on_drop(self, session: "RecordingSession"): ...
+    def on_end(self, session: "RecordingSession", recorded: RecordedFile): ...
+
+
 class AudioStream:
     CHUNK = 1000
     FORMAT = pyaudio.paInt16
@@ -23,25 +38,85 @@ class AudioStream:
     RATE = 16000  # Whisper는 16kHz 샘플링 레이트 사용
     THRESHOLD = 500  # 소음 임계값
     SILENCE_DURATION = 2  # 소리가 없어진 후 종료까지의 시간 (초)
+    STAND_BY_FRAMES = int(SILENCE_DURATION * RATE / CHUNK)
+    PRE_ROLL_FRAMES = STAND_BY_FRAMES // 2
+    MAX_BLOCK_FRAMES = 64  # VAD에 한 번에 넘길 최대 프레임 수
+    # 발화 버퍼를 처음 잡을 길이 (이후 두 배씩 늘림)
+    INITIAL_ARENA_FRAMES = 5 * RATE // CHUNK
 
-    def __init__(self, p: pyaudio.PyAudio, device_index: int):
+    def __init__(
+        self,
+        p: pyaudio.PyAudio,
+        device_index: int,
+        calibrator: Optional[NoiseCalibrator] = None,
+    ):
         self.p = p
-        self.stream = p.open(
+        self.device_index = device_index
+        self.calibrator = calibrator
+        self.vad = self.create_vad(
+            calibrator.threshold if calibrator else self.THRESHOLD, calibrator
+        )
+        self.pending: AudioFrames = np.empty((0, self.CHUNK), dtype=np.int16)
+        self.listeners: list[RecordingListener] = []
+        self.stream = self.open(device_index)
+
+    @classmethod
+    def create_vad(
+        cls,
+        threshold: float = THRESHOLD,
+        calibrator: Optional[NoiseCalibrator] = None,
+    ) -> VoiceActivityDetector:
+        return VoiceActivityDetector(
+            frame_size=cls.CHUNK,
+            threshold=threshold,
+            hangover_frames=cls.STAND_BY_FRAMES,
+            onset_frames=cls.PRE_ROLL_FRAMES,
+            calibrator=calibrator,
+        )
+
+    def create_front_end(self, device_index: int) -> CaptureFrontEnd:
+        """장치가 16kHz 모노를 지원하지 않으면 기본 레이트/채널로 열고 변환합니다."""
+        self.front_end = CaptureFrontEnd.for_device(
+            self.p, device_index, self.RATE, self.FORMAT
+        )
+        self.captured: np.ndarray = np.empty(0, dtype=np.int16)
+        return self.front_end
+
+    def open(self, device_index: int):
+        front_end = self.create_front_end(device_index)
+        return self.p.open(
             format=self.FORMAT,
-            channels=self.CHANNELS,
-            rate=self.RATE,
+            channels=front_end.channels,
+            rate=front_end.rate,
             input=True,
             input_device_index=device_index,
-            frames_per_buffer=self.CHUNK,
+            frames_per_buffer=front_end.input_frames(self.CHUNK),
         )
-        self.device_index = device_index
 
     def read(self, size: int = CHUNK) -> np.ndarray[Any, np.dtype[np.int16]]:
-        data = self.stream.read(size)
-        audio_chunk = np.frombuffer(data, dtype=np.int16)
+        if self.front_end.passthrough:
+            return np.frombuffer(self.stream.read(size), dtype=np.int16)
+        # 리샘플링 출력 수는 읽은 양과 딱 맞지 않으므로 남은 샘플은 다음 읽기에 씀
+        while len(self.captured) < size:
+            frames = self.front_end.input_frames(size - len(self.captured))
+            data = self.front_end.process(self.stream.read(frames))
+            self.captured = np.concatenate([self.captured, data])
+        audio_chunk, self.captured = self.captured[:size], self.captured[size:]
         return audio_chunk
 
+    def read_frames(self) -> AudioFrames:
+        """(프레임 수, CHUNK) 형태의 블록을 반환합니다."""
+        if len(self.pending):
+            frames, self.pending = self.pending, self.pending[:0]
+            return frames
+        return self.read().reshape(-1, self.CHUNK)
+
+    def unread(self, frames: AudioFrames):
+        self.pending = frames
+
     def stop(self):
+        if self.calibrator:
+            self.calibrator.save()
         self.stream.stop_stream()
         self.stream.close()
 
@@ -55,93 +130,185 @@ class AudioStream:
     def detect_audio(self):
         return RecordingSession(self).record()
 
+    @classmethod
+    def Blocking(
+        cls,
+        p: pyaudio.PyAudio,
+        device_index: int,
+        calibrator: Optional[NoiseCalibrator] = None,
+    ) -> "AudioStream":
+        return AudioStream(p, device_index, calibrator)
+
+    @classmethod
+    def Callback(
+        cls,
+        p: pyaudio.PyAudio,
+        device_index: int,
+        calibrator: Optional[NoiseCalibrator] = None,
+    ) -> "AudioStream":
+        return CallbackAudioStream(p, device_index, calibrator)
+
+
+class CallbackAudioStream(AudioStream):
+    """
+    PyAudio 콜백으로 링 버퍼를 채우고, 별도 스레드에서 발화 구간을 잘라 큐에 넣는 스트림.
+    STT/AI/TTS가 도는 동안에도 녹음과 구간 분리가 계속됩니다.
+    """
+
+    BUFFER_DURATION = 30  # 링 버퍼에 보관할 최대 시간 (초)
+
+    def __init__(
+        self,
+        p: pyaudio.PyAudio,
+        device_index: int,
+        calibrator: Optional[NoiseCalibrator] = None,
+    ):
+        self.buffer = RingBuffer(self.RATE * self.BUFFER_DURATION)
+        self.segments = queue.Queue[Result[RecordedFile, Exception]]()
+        self.input_overflows = 0
+        super().__init__(p, device_index, calibrator)
+        self.segmenter = threading.Thread(target=self.segment_loop, daemon=True)
+        self.segmenter.start()
+
+    def open(self, device_index: int):
+        front_end = self.create_front_end(device_index)
+        return self.p.open(
+            format=self.FORMAT,
+            channels=front_end.channels,
+            rate=front_end.rate,
+            input=True,
+            input_device_index=device_index,
+            frames_per_buffer=front_end.input_frames(self.CHUNK),
+            stream_callback=self.callback,
+        )
+
+    def callback(self, in_data: bytes | None, frame_count: int, time_info, status):
+        if status & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        if in_data:
+            self.buffer.write(self.front_end.process(in_data))
+        return (None, pyaudio.paContinue)
+
+    def read(
+        self, size: int = AudioStream.CHUNK
+    ) -> np.ndarray[Any, np.dtype[np.int16]]:
+        return self.buffer.read(size)
+
+    def read_frames(self) -> AudioFrames:
+        if len(self.pending):
+            return super().read_frames()
+        # 밀린 오디오가 있으면 여러 프레임을 한 블록으로 읽어 VAD에 넘김
+        frames = max(1, min(self.buffer.available // self.CHUNK, self.MAX_BLOCK_FRAMES))
+        return self.read(frames * self.CHUNK).reshape(-1, self.CHUNK)
+
+    def stop(self):
+        self.buffer.close()
+        super().stop()
+
+    def segment_loop(self):
+        while True:
+            result = safe(RecordingSession(self).record)()
+            self.segments.put(result)
+            if not is_successful(result):
+                break
+
+    def detect_audio(self) -> Result[RecordedFile, Exception]:
+        result = self.segments.get()
+        if not is_successful(result):
+            # 구간 분리 스레드가 종료되었으므로 이후 호출도 같은 실패를 받도록 되돌려 둠
+            self.segments.put(result)
+        return result
+
 
 class RecordingSession:
     @property
     def STAND_BY_TIME(self):
-        return self.stream.SILENCE_DURATION * self.stream.RATE / self.stream.CHUNK
+        return self.stream.STAND_BY_FRAMES
 
     def __init__(self, stream: AudioStream):
         self.stream = stream
-        self.THRESHOLD = stream.THRESHOLD
-        self.silent_frames = 0
+        self.vad = stream.vad
         self.is_record_started = False
-        self.main_frames: list[AudioChunk] = []
-        self.pre_frames = deque[AudioChunk]([], maxlen=int(self.STAND_BY_TIME / 2))
-        self.pop_noise_check_queue: FixedQueue[float] = FixedQueue(
-            [], int(self.STAND_BY_TIME / 2)
+        self.arena = FrameArena(
+            stream.CHUNK,
+            stream.PRE_ROLL_FRAMES,
+            initial_frames=stream.PRE_ROLL_FRAMES + stream.INITIAL_ARENA_FRAMES,
         )
+        self.marks: dict[str, float] = {}
 
     def to_recorded_file(self) -> RecordedFile:
-        frames = np.hstack(list(self.pre_frames) + self.main_frames)
         return RecordedFile(
             self.stream.p,
-            ndarray=frames,
+            ndarray=self.arena.view(),
             file_name="recorded.wav",
             rate=self.stream.RATE,
             channels=self.stream.CHANNELS,
+            speech_offset=self.arena.speech_offset,
+            marks=dict(self.marks),
+            device=self.stream.device_index,
         )
 
-    @staticmethod
-    def get_max_volume(audio_chunk: AudioChunk):
-        return np.max(np.abs(audio_chunk))
-
-    def handle_silent(self, audio_chunk: AudioChunk):
-        @attempt
-        def inner(self: RecordingSession):
-            # 현재 청크의 최대 진폭 계산
-            vol: int = self.get_max_volume(audio_chunk)
-            if vol < self.THRESHOLD:
-                self.silent_frames += 1
-                return self
-            self.silent_frames = 0
-            raise ThresholdExceed
-
-        return inner(self)
-
-    @safe
-    def handle_start_recording(self):
-        if self.is_record_started:
-            return self
-        self.is_record_started = True
-        return self
-
-    def handle_frames(self, audio_chunk: AudioChunk):
+    def handle_frames(self, frames: AudioFrames):
         if not self.is_record_started:
-            self.pre_frames.append(audio_chunk)
+            self.arena.push_pre_roll(frames)
         else:
-            self.main_frames.append(audio_chunk)
-
-            self.pop_noise_check_queue.append(self.get_max_volume(audio_chunk))
-        return self
+            self.arena.append(frames)
+            for listener in self.stream.listeners:
+                listener.on_frames(self, frames)
 
-    def handle_pop_noise(self):
-        if self.pop_noise_check_queue.is_full:
-            if np.mean(self.pop_noise_check_queue) <= self.THRESHOLD:
-                self.clear()
-                return True
-        return False
+    def handle_start(self):
+        self.is_record_started = True
+        self.marks["speech_start"] = time.monotonic()
+        pre_frames = self.arena.start()
+        for listener in self.stream.listeners:
+            listener.on_start(self, pre_frames)
 
     def clear(self):
-        self.silent_frames = 0
         self.is_record_started = False
-        self.main_frames.clear()
-        self.pop_noise_check_queue.clear()
+        self.arena.clear()
+        for listener in self.stream.listeners:
+            listener.on_drop(self)
+
+    def handle_block(self, frames: AudioFrames) -> int | None:
+        """
+        VAD 이벤트에 따라 블록을 프리롤/본 녹음으로 나눕니다.
+        발화가 끝났으면 블록에서 사용한 프레임 수를 반환합니다.
+        VAD는 끝난 프레임까지만 처리하므로 나머지는 다음 세션에서 한 번만 처리됩니다.
+        """
+        cursor = 0
+        for event in self.vad.process(frames, stop_at_end=True):
+            if event.kind == "start":
+                self.handle_frames(frames[cursor : event.frame])
+                self.handle_start()
+                cursor = event.frame
+            elif event.kind == "drop":
+                # 팝 노이즈로 판정된 구간은 버림
+                self.clear()
+                cursor = event.frame + 1
+            else:
+                self.handle_frames(frames[cursor : event.frame + 1])
+                return event.frame + 1
+        self.handle_frames(frames[cursor:])
+        return None
 
     def record(self) -> RecordedFile:
         while True:
-            audio_chunk = self.stream.read()
-            self.handle_silent(audio_chunk).lash(
-                RecordingSession.handle_start_recording
-            )
-            # 오디오 청크 어레이에 데이터 추가
-            self.handle_frames(audio_chunk)
-            if not self.is_record_started:
-                continue
-            if self.handle_pop_noise():
-                self.clear()
+            frames = self.stream.read_frames()
+            captured = time.monotonic()
+            used = self.handle_block(frames)
+            if used is None:
                 continue
-            # 소리가 없어진 후 지정된 시간만큼 대기
-            if self.silent_frames > self.STAND_BY_TIME:
-                break
-        return self.to_recorded_file()
+            # 블록의 마지막 프레임이 captured에 들어왔다고 보고 마지막 발화 프레임의 시각을 구함
+            quiet = len(frames) - used + self.vad.hangover_frames
+            self.marks.update(
+                speech_end=captured - quiet * self.stream.CHUNK / self.stream.RATE,
+                capture_end=captured,
+                vad_end=time.monotonic(),
+            )
+            # 다음 발화에 쓰일 나머지 프레임은 스트림에 되돌려 둠
+            self.stream.unread(frames[used:])
+            break
+        recorded = self.to_recorded_file()
+        for listener in self.stream.listeners:
+            listener.on_end(self, recorded)
+        return recorded
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+import numpy as np
+
+logger = logging.getLogger("Secretary")
+
+
+class NoiseProfile(NamedTuple):
+    noise: float  # 최근 프레임 에너지의 percentile
+    threshold: float  # VAD 최소 임계값
+    updated: float  # time.time()
+
+
+class NoiseProfiles:
+    """장치 번호별로 학습한 NoiseProfile을 json 파일에 보관합니다."""
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        self.profiles: dict[str, NoiseProfile] = {}
+        if not os.path.exists(file_name):
+            return
+        try:
+            with open(file_name, encoding="utf-8") as f:
+                self.profiles = {
+                    device: NoiseProfile(**profile)
+                    for device, profile in json.load(f).items()
+                }
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            # 깨진 파일은 무시하고 처음부터 다시 학습
+            logger.warning(f"{file_name}: ignoring noise profiles: {e!r}")
+
+    def get(self, device_index: int) -> Optional[NoiseProfile]:
+        with self.lock:
+            return self.profiles.get(str(device_index))
+
+    def put(self, device_index: int, profile: NoiseProfile):
+        with self.lock:
+            self.profiles[str(device_index)] = profile
+            data = {
+                device: profile._asdict() for device, profile in self.profiles.items()
+            }
+            # 저장 도중 종료되어도 이전 파일이 깨지지 않도록 바꿔치기
+            temp = f"{self.file_name}.tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+            os.replace(temp, self.file_name)
+
+
+class NoiseCalibrator:
+    """
+    최근 window_frames 프레임 에너지의 낮은 percentile을 장치의 노이즈 수준으로 보고
+    그 margin배를 VAD 최소 임계값으로 씁니다. 발화는 전체 시간의 일부이고 중간중간 쉬므로
+    낮은 percentile은 말소리가 섞여도 배경 소음을 따라갑니다.
+    학습한 값은 save_interval초마다 백그라운드 스레드에서 장치 번호별로 저장되어
+    다음 세션이 바로 이어 씁니다.
+    """
+
+    def __init__(
+        self,
+        profiles: NoiseProfiles,
+        device_index: int,
+        default_threshold: float,
+        percentile: float = 20.0,
+        margin: float = 3.0,
+        min_threshold: float = 150.0,
+        max_threshold: float = 3000.0,
+        window_frames: int = 960,
+        min_frames: int = 80,
+        save_interval: float = 30.0,
+    ):
+        self.profiles = profiles
+        self.device_index = device_index
+        self.percentile = percentile
+        self.margin = margin
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.min_frames = min_frames
+        self.save_interval = save_interval
+        self.energies = np.zeros(window_frames, dtype=np.float32)
+        self.position = 0
+        self.count = 0
+        profile = profiles.get(device_index)
+        self.noise: Optional[float] = profile.noise if profile else None
+        self.threshold = profile.threshold if profile else default_threshold
+        self.saved = time.monotonic()
+        self.saver: Optional[threading.Thread] = None
+
+    def observe(self, energy: np.ndarray):
+        size = len(self.energies)
+        energy = energy[-size:]
+        end = self.position + len(energy)
+        first = min(len(energy), size - self.position)
+        self.energies[self.position : self.position + first] = energy[:first]
+        self.energies[: len(energy) - first] = energy[first:]
+        self.position = end % size
+        self.count = min(size, self.count + len(energy))
+
+    def update(self, energy: np.ndarray) -> float:
+        """프레임 에너지를 더하고 갱신된 최소 임계값을 반환합니다."""
+        self.observe(energy)
+        # 저장된 프로필이 있으면 새 기록이 충분히 쌓일 때까지 그 값을 씀
+        if self.count >= self.min_frames:
+            self.noise = float(
+                np.percentile(self.energies[: self.count], self.percentile)
+            )
+            self.threshold = float(
+                np.clip(
+                    self.noise * self.margin, self.min_threshold, self.max_threshold
+                )
+            )
+            if time.monotonic() - self.saved >= self.save_interval:
+                self.save_in_background()
+        return self.threshold
+
+    def save_in_background(self):
+        # 녹음 스레드가 파일 쓰기를 기다리지 않도록 함
+        if self.saver and self.saver.is_alive():
+            return
+        self.saved = time.monotonic()
+        self.saver = threading.Thread(target=self.save, daemon=True)
+        self.saver.start()
+
+    def save(self):
+        if self.noise is None:
+            return
+        self.saved = time.monotonic()
+        self.profiles.put(
+            self.device_index, NoiseProfile(self.noise, self.threshold, time.time())
+        )
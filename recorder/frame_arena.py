@@ -0,0 +1,87 @@
+from typing import Any
+import numpy as np
+
+Frames = np.ndarray[Any, np.dtype[np.int16]]
+
+
+class FrameArena:
+    """
+    발화 하나의 프리롤과 본 녹음 프레임을 담는 미리 잡아 둔 int16 버퍼.
+    앞쪽 pre_roll_frames 칸은 발화 전까지 원형 버퍼로 쓰다가 start()에서 시간 순으로 정렬하고,
+    그 뒤로 본 녹음 프레임을 이어 씁니다. 칸이 모자라면 두 배로 늘립니다.
+    view()는 복사 없이 버퍼를 가리키므로 녹음이 끝난 뒤에는 arena에 더 쓰지 않아야 합니다.
+    """
+
+    def __init__(self, frame_size: int, pre_roll_frames: int, initial_frames: int = 0):
+        self.frame_size = frame_size
+        self.pre_roll_frames = pre_roll_frames
+        capacity = max(initial_frames, pre_roll_frames * 2, 1)
+        self.buffer: Frames = np.empty((capacity, frame_size), dtype=np.int16)
+        # 원형 구간에서 가장 오래된 프레임 위치와 채워진 프레임 수
+        self.pre_start = 0
+        self.pre_count = 0
+        # 본 녹음 프레임 수 (pre_count 뒤에 이어짐)
+        self.length = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self.buffer)
+
+    @property
+    def frames(self) -> int:
+        return self.pre_count + self.length
+
+    @property
+    def speech_offset(self) -> int:
+        """프리롤을 제외한 발화 시작 위치 (샘플)"""
+        return self.pre_count * self.frame_size
+
+    def push_pre_roll(self, frames: Frames):
+        size = self.pre_roll_frames
+        if size == 0 or len(frames) == 0:
+            return
+        if len(frames) >= size:
+            self.buffer[:size] = frames[-size:]
+            self.pre_start, self.pre_count = 0, size
+            return
+        end = (self.pre_start + self.pre_count) % size
+        first = min(len(frames), size - end)
+        self.buffer[end : end + first] = frames[:first]
+        self.buffer[: len(frames) - first] = frames[first:]
+        overflow = max(0, self.pre_count + len(frames) - size)
+        self.pre_start = (self.pre_start + overflow) % size
+        self.pre_count = min(size, self.pre_count + len(frames))
+
+    def start(self) -> Frames:
+        """원형 구간을 시간 순으로 정렬하고 프리롤 프레임의 view를 반환합니다."""
+        if self.pre_start:
+            # 원형 구간이 가득 찬 뒤에만 회전이 필요하며 최대 프리롤 크기만큼만 복사함
+            self.buffer[: self.pre_count] = np.roll(
+                self.buffer[: self.pre_count], -self.pre_start, axis=0
+            )
+            self.pre_start = 0
+        self.length = 0
+        return self.buffer[: self.pre_count]
+
+    def append(self, frames: Frames):
+        end = self.frames + len(frames)
+        if end > self.capacity:
+            self.grow(end)
+        self.buffer[self.frames : end] = frames
+        self.length += len(frames)
+
+    def clear(self):
+        """본 녹음 프레임만 버립니다. 프리롤은 다음 발화를 위해 남겨 둠"""
+        self.length = 0
+
+    def grow(self, frames: int):
+        capacity = self.capacity
+        while capacity < frames:
+            capacity *= 2
+        buffer = np.empty((capacity, self.frame_size), dtype=np.int16)
+        buffer[: self.frames] = self.buffer[: self.frames]
+        self.buffer = buffer
+
+    def view(self) -> Frames:
+        """프리롤과 본 녹음을 이어 붙인 1차원 샘플 view"""
+        return self.buffer[: self.frames].reshape(-1)
@@ -1,9 +1,91 @@
-from io import BytesIO
+from io import SEEK_CUR, SEEK_END, SEEK_SET, BytesIO, RawIOBase
+import struct
+import threading
+from typing import BinaryIO, Optional
 import numpy as np
 import wave
 
 import pyaudio
 
+# 스레드별로 재사용하는 float32 변환 버퍼. 처음부터 Whisper 한 창(30초) 크기로 잡음
+scratch = threading.local()
+MIN_BUFFER_SAMPLES = 30 * 16000
+
+
+def float32_buffer(size: int) -> np.ndarray:
+    buffer: Optional[np.ndarray] = getattr(scratch, "buffer", None)
+    if buffer is None or len(buffer) < size:
+        buffer = scratch.buffer = np.empty(
+            max(size, MIN_BUFFER_SAMPLES), dtype=np.float32
+        )
+    return buffer[:size]
+
+
+def wav_header(samples: int, rate: int, channels: int, sample_width: int = 2) -> bytes:
+    """PCM wav 헤더 (44바이트)"""
+    data_size = samples * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,
+        channels,
+        rate,
+        rate * channels * sample_width,
+        channels * sample_width,
+        sample_width * 8,
+        b"data",
+        data_size,
+    )
+
+
+class WavStream(RawIOBase):
+    """
+    wav 헤더 뒤에 샘플 버퍼를 복사 없이 이어서 읽어 주는 파일 객체.
+    seek/tell을 지원하므로 업로드 라이브러리가 길이를 재거나 재시도할 때 처음부터 다시 읽을 수 있습니다.
+    """
+
+    def __init__(self, name: str, header: bytes, samples: np.ndarray):
+        self.name = name
+        self.parts = [
+            memoryview(header),
+            memoryview(np.ascontiguousarray(samples)).cast("B"),
+        ]
+        self.size = sum(len(part) for part in self.parts)
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = SEEK_SET) -> int:
+        base = {SEEK_SET: 0, SEEK_CUR: self.position, SEEK_END: self.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        target = memoryview(buffer).cast("B")
+        written = 0
+        start = 0
+        for part in self.parts:
+            end = start + len(part)
+            if self.position < end and written < len(target):
+                offset = self.position - start
+                size = min(len(part) - offset, len(target) - written)
+                target[written : written + size] = part[offset : offset + size]
+                written += size
+                self.position += size
+            start = end
+        return written
+
 
 class RecordedFile:
     def __init__(
@@ -13,23 +95,64 @@ class RecordedFile:
         file_name: str,
         rate: int,
         channels: int,
+        speech_offset: int = 0,
+        marks: Optional[dict[str, float]] = None,
+        device: Optional[int] = None,
     ):
         self.p = p
         self.ndarray = ndarray
         self.file_name = file_name
         self.rate = rate
         self.channels = channels
+        # 프리롤을 제외한 발화 시작 위치 (샘플)
+        self.speech_offset = speech_offset
+        # 녹음 단계의 time.monotonic() 시각 (speech_start, speech_end, capture_end, vad_end)
+        self.marks = marks or {}
+        # 녹음한 장치 번호. 장치별 상태(STT 프롬프트 등)를 구분할 때 씀
+        self.device = device
 
-    def translate_16_to_32(self):
-        return self.ndarray.astype(np.float32) / 32768.0
+    def head(self, duration: float, margin: float = 0.25) -> "RecordedFile":
+        """발화 시작 직전 margin 초부터 duration 초 만큼을 잘라냅니다."""
+        start = max(0, self.speech_offset - int(margin * self.rate))
+        end = self.speech_offset + int(duration * self.rate)
+        return RecordedFile(
+            self.p,
+            ndarray=self.ndarray[start:end],
+            file_name=self.file_name,
+            rate=self.rate,
+            channels=self.channels,
+            speech_offset=self.speech_offset - start,
+            device=self.device,
+        )
 
-    def to_file(self):
-        io = BytesIO()
-        io.name = self.file_name
-        with wave.open(io, "wb") as wav_file:
+    def translate_16_to_32(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        out(없으면 스레드별로 재사용하는 버퍼)에 바로 변환합니다.
+        재사용 버퍼는 같은 스레드의 다음 변환 때 덮어써지므로 보관하려면 copy() 해야 합니다.
+        """
+        if out is None:
+            out = float32_buffer(len(self.ndarray))
+        return np.multiply(self.ndarray, 1 / 32768.0, out=out, dtype=np.float32)
+
+    def write_to(self, f: BinaryIO):
+        """wav 헤더를 쓰고 샘플 버퍼를 복사 없이 그대로 f에 씁니다."""
+        with wave.open(f, "wb") as wav_file:
             wav_file.setnchannels(self.channels)
             wav_file.setsampwidth(self.p.get_sample_size(pyaudio.paInt16))
             wav_file.setframerate(self.rate)
-            wav_file.writeframes(self.ndarray.tobytes())
+            wav_file.setnframes(len(self.ndarray) // self.channels)
+            wav_file.writeframesraw(memoryview(np.ascontiguousarray(self.ndarray)))
+
+    def stream(self) -> WavStream:
+        """to_file()과 같은 wav를 메모리에 만들지 않고 녹음 버퍼에서 바로 읽습니다."""
+        header = wav_header(
+            len(self.ndarray) // self.channels, self.rate, self.channels
+        )
+        return WavStream(self.file_name, header, self.ndarray)
+
+    def to_file(self):
+        io = BytesIO()
+        io.name = self.file_name
+        self.write_to(io)
         io.seek(0)
         return io
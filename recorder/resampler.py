@@ -0,0 +1,127 @@
+from math import gcd
+from typing import Any
+import numpy as np
+import pyaudio
+
+Samples = np.ndarray[Any, np.dtype[np.int16]]
+
+
+def lowpass(length: int, cutoff: float, beta: float) -> np.ndarray:
+    """cutoff(샘플링 레이트 대비 비율)에서 자르는 카이저 창 sinc 저역 통과 필터"""
+    n = np.arange(length) - (length - 1) / 2
+    return 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, beta)
+
+
+class PolyphaseResampler:
+    """
+    up/down 배 유리수 비율로 리샘플링하는 다상 FIR 필터.
+    청크 사이에 입력 이력과 출력 위상을 이어 가므로 청크 경계에서 끊김이 생기지 않습니다.
+    """
+
+    def __init__(
+        self,
+        rate_in: int,
+        rate_out: int,
+        taps: int = 64,
+        bandwidth: float = 0.9,
+        beta: float = 8.0,
+    ):
+        divisor = gcd(rate_in, rate_out)
+        self.up = rate_out // divisor
+        self.down = rate_in // divisor
+        self.taps = taps  # 위상 하나(입력 샘플 기준)의 탭 수
+        cutoff = bandwidth * 0.5 / max(self.up, self.down)
+        h = lowpass(self.up * taps, cutoff, beta) * self.up
+        # phases[p, k] = h[p + k * up], 입력 창(오래된 것부터)에 바로 곱하도록 뒤집어 둠
+        self.phases = h.reshape(taps, self.up).T[:, ::-1].astype(np.float32).copy()
+        self.history = np.zeros(taps - 1, dtype=np.float32)
+        # 지금까지 받은 입력 수와 다음에 낼 출력 번호
+        self.consumed = 0
+        self.produced = 0
+
+    def output_size(self, input_size: int) -> int:
+        """input_size개를 더 넣었을 때 나오는 출력 수"""
+        available = self.consumed + input_size
+        return max(0, (available * self.up - 1) // self.down + 1 - self.produced)
+
+    def input_size(self, output_size: int) -> int:
+        """output_size개 이상을 내는 데 필요한 최소 입력 수"""
+        last = (self.produced + output_size - 1) * self.down // self.up
+        return max(0, last + 1 - self.consumed)
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        """float32 모노 입력을 받아 float32 출력을 반환합니다."""
+        window = np.concatenate([self.history, x.astype(np.float32, copy=False)])
+        count = self.output_size(len(x))
+        n = self.produced + np.arange(count)
+        position = n * self.down
+        # 입력 창의 끝(가장 최근 샘플)이 window에서 놓이는 위치
+        base = position // self.up - self.consumed + len(self.history)
+        phase = position % self.up
+        windows = np.lib.stride_tricks.sliding_window_view(window, self.taps)
+        y = np.einsum(
+            "nk,nk->n",
+            windows[base - self.taps + 1],
+            self.phases[phase],
+            optimize=False,
+        )
+        self.consumed += len(x)
+        self.produced += count
+        self.history = window[len(window) - len(self.history) :]
+        return y
+
+
+class CaptureFrontEnd:
+    """
+    장치가 지원하는 레이트/채널로 받은 int16 입력을 모노로 합치고 target_rate로 리샘플링합니다.
+    장치가 target_rate 모노를 바로 지원하면 변환 없이 그대로 넘깁니다.
+    """
+
+    def __init__(self, rate: int, channels: int, target_rate: int):
+        self.rate = rate
+        self.channels = channels
+        self.target_rate = target_rate
+        self.resampler = (
+            PolyphaseResampler(rate, target_rate) if rate != target_rate else None
+        )
+
+    @property
+    def passthrough(self) -> bool:
+        return self.resampler is None and self.channels == 1
+
+    @classmethod
+    def for_device(
+        cls, p: pyaudio.PyAudio, device_index: int, target_rate: int, format: int
+    ) -> "CaptureFrontEnd":
+        try:
+            p.is_format_supported(
+                target_rate,
+                input_device=device_index,
+                input_channels=1,
+                input_format=format,
+            )
+            return cls(target_rate, 1, target_rate)
+        except ValueError:
+            pass
+        info = p.get_device_info_by_index(device_index)
+        rate = int(info["defaultSampleRate"])
+        channels = max(1, int(info["maxInputChannels"]))
+        return cls(rate, channels, target_rate)
+
+    def input_frames(self, output_size: int) -> int:
+        """output_size개를 얻기 위해 장치에서 읽어야 하는 프레임 수"""
+        if self.resampler is None:
+            return output_size
+        return self.resampler.input_size(output_size)
+
+    def process(self, data: bytes) -> Samples:
+        samples = np.frombuffer(data, dtype=np.int16)
+        if self.passthrough:
+            return samples
+        if self.channels > 1:
+            mono = samples.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        else:
+            mono = samples.astype(np.float32)
+        if self.resampler:
+            mono = self.resampler.process(mono)
+        return np.clip(np.rint(mono), -32768, 32767).astype(np.int16)
@@ -0,0 +1,81 @@
+import threading
+from typing import Any, Optional
+import numpy as np
+
+from exceptions import StreamClosedError
+
+
+class RingBuffer:
+    """
+    콜백 스레드가 쓰고 녹음 세션이 읽는 고정 크기 링 버퍼.
+    읽는 쪽이 밀리면 가장 오래된 샘플부터 덮어쓰고 overflows에 기록합니다.
+    """
+
+    def __init__(self, capacity: int, dtype: Any = np.int16):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        # 누적 쓰기/읽기 위치 (샘플 단위, 단조 증가)
+        self.write_pos = 0
+        self.read_pos = 0
+        self.overflows = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    @property
+    def available(self):
+        return self.write_pos - self.read_pos
+
+    def write(self, data: np.ndarray):
+        with self.condition:
+            size = len(data)
+            if size > self.capacity:
+                # 버퍼보다 큰 입력은 앞부분을 버린 것으로 취급
+                self.write_pos += size - self.capacity
+                data = data[-self.capacity :]
+                size = self.capacity
+            overflow = self.available + size - self.capacity
+            if overflow > 0:
+                self.read_pos += overflow
+                self.overflows += overflow
+            start = self.write_pos % self.capacity
+            first = min(size, self.capacity - start)
+            self.buffer[start : start + first] = data[:first]
+            self.buffer[: size - first] = data[first:]
+            self.write_pos += size
+            self.condition.notify_all()
+
+    def read(self, size: int, timeout: Optional[float] = None) -> np.ndarray:
+        """size 샘플이 쌓일 때까지 기다렸다가 복사본을 반환합니다."""
+        with self.condition:
+            ready = self.condition.wait_for(
+                lambda: self.available >= size or self.closed, timeout
+            )
+            if not ready:
+                raise TimeoutError
+            if self.available < size:
+                raise StreamClosedError
+            return self._consume(size)
+
+    def read_available(self, min_size: int, max_size: int) -> np.ndarray:
+        """최소 min_size 샘플을 기다린 뒤, max_size 이하로 쌓인 만큼 한 번에 반환합니다."""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.available >= min_size or self.closed
+            )
+            if self.available < min_size:
+                raise StreamClosedError
+            return self._consume(min(self.available, max_size))
+
+    def _consume(self, size: int) -> np.ndarray:
+        start = self.read_pos % self.capacity
+        first = min(size, self.capacity - start)
+        out = np.empty(size, dtype=self.buffer.dtype)
+        out[:first] = self.buffer[start : start + first]
+        out[first:] = self.buffer[: size - first]
+        self.read_pos += size
+        return out
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
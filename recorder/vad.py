@@ -0,0 +1,264 @@
+import sys
+import time
+import wave
+from typing import Any, Literal, NamedTuple, Optional
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from recorder.calibration import NoiseCalibrator
+
+AudioFrames = np.ndarray[Any, np.dtype[np.int16]]
+
+
+class VADEvent(NamedTuple):
+    kind: Literal["start", "end", "drop"]
+    frame: int  # 블록 안에서의 프레임 인덱스
+
+
+class Segment(NamedTuple):
+    start: int  # 샘플 인덱스 (프리롤 포함)
+    end: int
+
+
+def frame_energy(frames: AudioFrames, mode: Literal["peak", "rms"] = "peak"):
+    """(프레임 수, 프레임 크기) 배열의 프레임별 피크 또는 RMS"""
+    if mode == "rms":
+        x = frames.astype(np.float32)
+        return np.sqrt(np.mean(x * x, axis=1))
+    return np.max(np.abs(frames.astype(np.int32)), axis=1).astype(np.float32)
+
+
+def exponential_smooth(values: np.ndarray, alpha: float, initial: float):
+    """
+    y[n] = alpha * y[n-1] + (1 - alpha) * x[n] 을 루프 없이 계산합니다.
+    alpha^-n 이 넘치지 않도록 일정 길이씩 나눠 누적합으로 풉니다.
+    """
+    out = np.empty(len(values), dtype=np.float64)
+    if not len(values):
+        return out
+    step = max(1, int(24 / -np.log(alpha))) if 0 < alpha < 1 else len(values)
+    y0 = float(initial)
+    for begin in range(0, len(values), step):
+        x = values[begin : begin + step].astype(np.float64)
+        n = np.arange(len(x))
+        decay = alpha ** (n + 1)
+        out[begin : begin + len(x)] = decay * y0 + (1 - alpha) * alpha**n * np.cumsum(
+            x * alpha ** (-n)
+        )
+        y0 = out[begin + len(x) - 1]
+    return out
+
+
+class VoiceActivityDetector:
+    """
+    프레임 블록 단위로 동작하는 에너지 기반 음성 구간 검출기.
+
+    프레임 에너지 -> 구간 최솟값 + 지수 평활로 노이즈 플로어 추정 ->
+    시작/종료 임계값(히스테리시스) 마스크를 한 번에 계산하고,
+    상태 전이가 일어나는 지점에서만 파이썬 코드가 돕니다.
+    calibrator가 있으면 최소 임계값(threshold)을 장치의 소음 수준에 맞춰 계속 바꿉니다.
+    """
+
+    def __init__(
+        self,
+        frame_size: int,
+        threshold: float,
+        hangover_frames: int,
+        onset_frames: int,
+        mode: Literal["peak", "rms"] = "peak",
+        floor_window: int = 80,
+        floor_alpha: float = 0.95,
+        start_ratio: float = 3.0,
+        stop_ratio: float = 2.0,
+        release: float = 0.8,
+        calibrator: Optional[NoiseCalibrator] = None,
+    ):
+        if onset_frames >= hangover_frames:
+            raise ValueError("onset_frames must be smaller than hangover_frames")
+        self.frame_size = frame_size
+        self.threshold = threshold
+        self.hangover_frames = hangover_frames
+        self.onset_frames = onset_frames
+        self.mode: Literal["peak", "rms"] = mode
+        self.floor_window = floor_window
+        self.floor_alpha = floor_alpha
+        self.start_ratio = start_ratio
+        self.stop_ratio = stop_ratio
+        self.release = release
+        self.calibrator = calibrator
+        self.reset()
+
+    def reset(self):
+        self.active = False
+        self.quiet_run = 0
+        self.onset_sum = 0.0
+        self.onset_count = 0
+        self.floor: float | None = None
+        self.history = np.empty(0, dtype=np.float32)
+
+    def to_frames(self, samples: np.ndarray) -> AudioFrames:
+        usable = len(samples) // self.frame_size * self.frame_size
+        return samples[:usable].reshape(-1, self.frame_size)
+
+    def noise_floor(self, energy: np.ndarray) -> np.ndarray:
+        # 최근 floor_window 프레임의 최솟값을 지수 평활. 상태는 commit()에서 갱신
+        extended = np.concatenate([self.history, energy])
+        if len(extended) < self.floor_window:
+            minimum = np.minimum.accumulate(extended)[-len(energy) :]
+        else:
+            padded = np.concatenate(
+                [np.full(self.floor_window - 1, extended[0]), extended]
+            )
+            minimum = sliding_window_view(padded, self.floor_window).min(axis=1)
+            minimum = minimum[-len(energy) :]
+        initial = minimum[0] if self.floor is None else self.floor
+        return exponential_smooth(minimum, self.floor_alpha, initial)
+
+    def commit(self, energy: np.ndarray, floor: np.ndarray):
+        """실제로 소비한 앞쪽 프레임(energy)까지만 노이즈 플로어 상태에 반영합니다."""
+        if not len(energy):
+            return
+        extended = np.concatenate([self.history, energy])
+        self.history = extended[-(self.floor_window - 1) :]
+        self.floor = float(floor[len(energy) - 1])
+        if self.calibrator:
+            self.calibrator.update(energy)
+
+    def thresholds(self, floor: np.ndarray):
+        start = np.maximum(self.threshold, floor * self.start_ratio)
+        stop = np.maximum(self.threshold * self.release, floor * self.stop_ratio)
+        return start, stop
+
+    def process(self, frames: AudioFrames, stop_at_end: bool = False) -> list[VADEvent]:
+        """
+        stop_at_end이면 첫 "end" 이벤트에서 멈추고 그 프레임까지만 상태에 반영합니다.
+        나머지 프레임은 호출한 쪽이 다음 process()에 다시 넘겨야 합니다.
+        """
+        if not len(frames):
+            return []
+        energy = frame_energy(frames, self.mode)
+        if self.calibrator:
+            # 블록 안에서는 이전 블록까지 학습한 임계값을 씀
+            self.threshold = self.calibrator.threshold
+        floor = self.noise_floor(energy)
+        start, stop = self.thresholds(floor)
+        events = self.decide(energy, energy >= start, energy >= stop, stop_at_end)
+        used = len(energy)
+        if stop_at_end and events and events[-1].kind == "end":
+            used = events[-1].frame + 1
+        self.commit(energy[:used], floor)
+        return events
+
+    def decide(
+        self,
+        energy: np.ndarray,
+        start_mask: np.ndarray,
+        keep_mask: np.ndarray,
+        stop_at_end: bool = False,
+    ) -> list[VADEvent]:
+        events: list[VADEvent] = []
+        i, n = 0, len(energy)
+        while i < n:
+            if not self.active:
+                hits = np.flatnonzero(start_mask[i:])
+                if not len(hits):
+                    break
+                i += int(hits[0])
+                self.active = True
+                self.quiet_run = 0
+                self.onset_sum = 0.0
+                self.onset_count = 0
+                events.append(VADEvent("start", i))
+            # 시작 직후 onset_frames 동안의 평균 에너지가 낮으면 팝 노이즈로 보고 버림
+            if self.onset_count < self.onset_frames:
+                window = energy[i : i + self.onset_frames - self.onset_count]
+                self.onset_sum += float(window.sum())
+                self.onset_count += len(window)
+                if (
+                    self.onset_count == self.onset_frames
+                    and self.onset_sum / self.onset_frames <= self.threshold
+                ):
+                    end = i + len(window) - 1
+                    events.append(VADEvent("drop", end))
+                    self.active = False
+                    i = end + 1
+                    continue
+            stop = self.find_stop(keep_mask[i:])
+            if stop is None:
+                break
+            events.append(VADEvent("end", i + stop))
+            self.active = False
+            if stop_at_end:
+                break
+            i += stop + 1
+        return events
+
+    def find_stop(self, keep_mask: np.ndarray) -> int | None:
+        # 연속된 조용한 프레임 수가 hangover_frames에 도달하는 첫 위치
+        index = np.arange(len(keep_mask))
+        last_loud = np.maximum.accumulate(np.where(keep_mask, index, -1))
+        run = index - last_loud
+        run[last_loud == -1] += self.quiet_run
+        hits = np.flatnonzero(run >= self.hangover_frames)
+        if len(hits):
+            self.quiet_run = 0
+            return int(hits[0])
+        if len(run):
+            self.quiet_run = int(run[-1])
+        return None
+
+    def segments(
+        self, samples: np.ndarray, pre_roll_frames: int = 0, block_frames: int = 1024
+    ) -> list[Segment]:
+        """녹음된 샘플 전체를 블록 단위로 흘려 보내며 발화 구간을 찾습니다."""
+        result: list[Segment] = []
+        frames = self.to_frames(samples)
+        start: int | None = None
+        for offset in range(0, len(frames), block_frames):
+            for event in self.process(frames[offset : offset + block_frames]):
+                frame = offset + event.frame
+                if event.kind == "start":
+                    start = max(0, frame - pre_roll_frames)
+                elif event.kind == "end" and start is not None:
+                    result.append(
+                        Segment(start * self.frame_size, (frame + 1) * self.frame_size)
+                    )
+                    start = None
+                else:
+                    start = None
+        return result
+
+
+def read_wav(file_name: str) -> tuple[np.ndarray, int]:
+    """16bit wav 파일을 모노 int16 배열로 읽습니다."""
+    with wave.open(file_name, "rb") as wav_file:
+        channels = wav_file.getnchannels()
+        rate = wav_file.getframerate()
+        data = np.frombuffer(wav_file.readframes(wav_file.getnframes()), np.int16)
+    if channels > 1:
+        data = data.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return data, rate
+
+
+def replay(file_name: str, vad: VoiceActivityDetector, pre_roll_frames: int = 0):
+    """wav 파일을 실시간보다 빠르게 재생하며 구간을 분리합니다. (구간, 배속) 반환"""
+    samples, rate = read_wav(file_name)
+    began = time.perf_counter()
+    segments = vad.segments(samples, pre_roll_frames)
+    elapsed = time.perf_counter() - began
+    return segments, (len(samples) / rate) / max(elapsed, 1e-9)
+
+
+if __name__ == "__main__":
+    # python -m recorder.vad recorded.wav [threshold]
+    from recorder.audio_recorder import AudioStream
+
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else AudioStream.THRESHOLD
+    vad = AudioStream.create_vad(threshold)
+    for file_name in sys.argv[1:2]:
+        found, speed = replay(file_name, vad, AudioStream.PRE_ROLL_FRAMES)
+        for segment in found:
+            print(
+                f"{segment.start / AudioStream.RATE:8.2f}s - {segment.end / AudioStream.RATE:8.2f}s"
+            )
+        print(f"{len(found)} segments, x{speed:.0f} realtime")
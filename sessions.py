@@ -0,0 +1,75 @@
+from collections import deque
+from contextlib import contextmanager
+import queue
+import time
+from typing import Optional
+import numpy as np
+from returns.pipeline import is_successful
+from returns.result import Result
+
+from ai.ai import AI
+from ai.speculation import SpeculativeAI
+from converters.stt import STT
+from recorder.audio_recorder import AudioStream
+from recorder.recorded_file import RecordedFile
+import tracing
+
+
+class LatencyMetrics:
+    """단계별 소요 시간을 최근 max_len개까지 기록합니다."""
+
+    def __init__(self, max_len: int = 100):
+        self.max_len = max_len
+        self.samples: dict[str, deque[float]] = {}
+
+    def record(self, stage: str, seconds: float):
+        self.samples.setdefault(stage, deque([], maxlen=self.max_len)).append(seconds)
+
+    @contextmanager
+    def measure(self, stage: str):
+        started = time.perf_counter()
+        try:
+            # 턴 트레이스가 있으면 같은 이름의 구간으로도 남김
+            with tracing.span(stage):
+                yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        return {
+            stage: dict(
+                count=len(values),
+                mean=float(np.mean(values)),
+                p95=float(np.percentile(values, 95)),
+            )
+            for stage, values in self.samples.items()
+            if values
+        }
+
+
+class DeviceSession:
+    """입력 장치 하나에 대한 대화 컨텍스트와 지연 시간 기록"""
+
+    def __init__(
+        self, device_index: int, ai: AI, speculator: Optional[SpeculativeAI] = None
+    ):
+        self.device_index = device_index
+        self.ai = ai
+        self.speculator = speculator
+        self.metrics = LatencyMetrics()
+
+    def attach(self, stt: STT, stream: AudioStream):
+        stt.attach(stream)
+        if self.speculator:
+            stt.on_partial(self.speculator.listener(stream))
+
+    def listen(
+        self,
+        stream: AudioStream,
+        segments: "queue.Queue[tuple[DeviceSession, Result[RecordedFile, Exception]]]",
+    ):
+        while True:
+            result = stream.detect_audio()
+            segments.put((self, result))
+            if not is_successful(result):
+                break
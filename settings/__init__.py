@@ -113,7 +113,8 @@ class SettingBase:
         if origin_type is list:
             item_type = to_type.__args__[0]
             if isinstance(value, list):
-                return [cls._convert_value(v.strip(), item_type) for v in value]
+                # json 배열은 항목이 이미 int 등일 수 있으므로 그대로 변환
+                return [cls._convert_value(v, item_type) for v in value]
             return [cls._convert_value(v.strip(), item_type) for v in value.split(",")]
 
         # Literal 처리
@@ -121,6 +122,10 @@ class SettingBase:
             item_type = to_type.__args__[0].__class__
             return cls._convert_value(value, item_type)
 
+        # settings.json에서 읽은 값은 이미 해당 타입일 수 있음 (true, 1.5 등)
+        if isinstance(to_type, type) and isinstance(value, to_type):
+            return value
+
         # 기본 타입 변환
         if to_type == int:
             return int(value)
@@ -156,12 +161,72 @@ class Setting(SettingBase, SettingLoader):
     SECRETARY_NAMES: list[str]
     DISCORD_WEBHOOK_URL: str
     RECORD_DEVICE: int
+    RECORD_DEVICES: Optional[list[int]] = None  # 여러 장치를 동시에 들을 때 사용
     CHAT_LIMIT_PER_SESSION: int = 3
     CHAT_GPT_MODEL_NAME: str = "gpt-3.5-turbo"
+    CONTEXT_STORE: Literal["jsonl", "json"] = "jsonl"
+    CONTEXT_TOKEN_BUDGET: int = (
+        0  # 0보다 크면 이 토큰 수 안에서 대화를 채우고 나머지는 요약
+    )
+    RESPONSE_CACHE: bool = False
+    RESPONSE_CACHE_THRESHOLD: Optional[float] = (
+        None  # 임베딩 코사인 유사도 기준, 없으면 임베딩별 기본값
+    )
+    RESPONSE_CACHE_TTL: int = 3600  # 초
+    RESPONSE_CACHE_SIZE: int = 256
+    RESPONSE_CACHE_EMBEDDING: str = "hashing"  # 또는 sentence-transformers 모델 이름
+    FUNCTION_FILTER: bool = False  # 프롬프트의 키워드와 관련된 함수만 보냄
+    CHAT_STREAMING: bool = False  # 응답을 문장 단위로 받아 바로 tts로 재생
     WHISPER_MODEL_NAME: str = "medium"
     WHISPER_DEVICE: Optional[str] = None
-    STT: Literal["local", "remote"] = "local"
+    STT: Literal["local", "remote", "pool", "faster"] = "local"
+    # STT가 faster일 때 faster-whisper(CTranslate2) 설정
+    FASTER_WHISPER_COMPUTE_TYPE: str = "int8"
+    FASTER_WHISPER_BEAM_SIZE: int = 1  # openai-whisper 기본값과 같은 greedy 디코딩
+    FASTER_WHISPER_THREADS: int = 0  # 0이면 런타임 기본값
+    STT_PROMPT_HISTORY: int = 2  # 최근 전사 몇 개를 local STT의 initial_prompt로 쓸지
+    STT_PROMPT_TERMS: Optional[list[str]] = None  # 호출어와 함께 프롬프트에 넣을 용어
+    # flac/opus는 soundfile 필요
+    REMOTE_STT_FORMAT: Literal["wav", "flac", "opus"] = "wav"
+    # 재시도를 포함해 한 발화 전사에 쓸 최대 시간 (초)
+    REMOTE_STT_DEADLINE: float = 20.0
+    REMOTE_STT_RETRIES: int = 3
+    REMOTE_STT_CONCURRENCY: int = 2  # 동시에 진행할 업로드 수
+    # 지정하면 STT가 늦거나 실패할 때 이 백엔드로 헤지 요청을 보냄
+    STT_HEDGE: Optional[Literal["local", "remote", "pool", "faster"]] = None
+    STT_HEDGE_PERCENTILE: float = 95.0  # primary 응답 시간의 이 백분위를 넘기면 헤지
+    STT_HEDGE_INITIAL_DELAY: float = 3.0  # 기록이 충분히 쌓이기 전의 헤지 기준 (초)
+    STT_HEDGE_MIN_DELAY: float = 0.5
     TTS: Literal["xtts", "gtts"] = "xtts"
+    TTS_CACHE: bool = True
+    TTS_CACHE_DIR: str = "tts_cache"
+    TTS_CACHE_MEMORY_MB: int = 32
+    TTS_CACHE_DISK_MB: int = 512
+    CAPTURE_MODE: Literal["callback", "blocking"] = "callback"
+    PIPELINE: Literal["sync", "async"] = "sync"
+    STT_STREAMING: bool = False
+    STT_STREAMING_WINDOW: float = 6.0  # 이 길이를 넘으면 부분 전사 결과를 확정 (초)
+    STT_STREAMING_STEP: float = 1.0  # 부분 전사 간격 (초)
+    SPECULATIVE_AI: bool = False  # STT_STREAMING일 때 부분 전사로 AI 요청을 미리 보냄
+    SPECULATION_STABILITY: int = 2  # 부분 전사가 이 횟수만큼 연속 같으면 요청 시작
+    SPECULATION_SIMILARITY: float = (
+        0.9  # 최종 전사와 이 이상 비슷하면 미리 받은 응답 사용
+    )
+    WHISPER_WORKERS: int = 2  # STT가 pool일 때 워커 프로세스 수
+    WHISPER_BATCH_SIZE: int = 4
+    WHISPER_POOL_TIMEOUT: float = 60.0  # 워커 전사 결과를 기다리는 최대 시간 (초)
+    NOISE_CALIBRATION: bool = False  # 장치별 소음 수준을 학습해 VAD 임계값을 조정
+    NOISE_PROFILE_FILE: str = "noise_profiles.json"
+    NOISE_PERCENTILE: float = 20.0  # 최근 프레임 에너지의 이 백분위를 소음 수준으로 봄
+    NOISE_MARGIN: float = 3.0  # 소음 수준의 이 배수를 최소 임계값으로 씀
+    NOISE_MIN_THRESHOLD: float = 150.0
+    NOISE_MAX_THRESHOLD: float = 3000.0
+    WAKE_WORD_FILTER: bool = False
+    WAKE_WORD_MODEL_NAME: str = "tiny"
+    WAKE_WORD_WINDOW: float = 1.5  # 호출어를 찾을 발화 앞부분 길이 (초)
+    TRACING: bool = False  # 발화별 단계 구간을 기록
+    TRACE_FILE: str = "traces.jsonl"  # 비우면 파일로 남기지 않음
+    METRICS_PORT: int = 0  # 0보다 크면 127.0.0.1:PORT/metrics 로 Prometheus 지표 제공
 
 
 load_dotenv()
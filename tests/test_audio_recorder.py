@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pyaudio")
+
+from recorder.audio_recorder import AudioStream, RecordingSession
+
+CHUNK = AudioStream.CHUNK
+
+
+class BlockStream(AudioStream):
+    """장치 대신 미리 정한 블록을 차례로 돌려주는 스트림"""
+
+    def __init__(self, blocks):
+        self.blocks = list(blocks)
+        super().__init__(None, -1)
+
+    def open(self, device_index):
+        return None
+
+    def read_frames(self):
+        if len(self.pending):
+            return super().read_frames()
+        return self.blocks.pop(0)
+
+
+def tone(frames: int, amplitude: int = 8000) -> np.ndarray:
+    samples = amplitude * np.sin(np.arange(frames * CHUNK) * 0.3)
+    return samples.reshape(frames, CHUNK).astype(np.int16)
+
+
+def quiet(frames: int) -> np.ndarray:
+    return np.zeros((frames, CHUNK), dtype=np.int16)
+
+
+def test_second_utterance_starting_in_same_block():
+    # 첫 발화가 끝난 블록에서 두 번째 발화가 시작되고 다음 블록에서 끝남
+    signal = np.concatenate([quiet(20), tone(30), quiet(40), tone(30), quiet(40)])
+    stream = BlockStream([signal[:64], signal[64:128], signal[128:]])
+    for _ in range(2):
+        recorded = RecordingSession(stream).record()
+        speech = (len(recorded.ndarray) - recorded.speech_offset) // CHUNK
+        assert speech >= 30
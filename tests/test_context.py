@@ -0,0 +1,75 @@
+import json
+
+from ai.context import (
+    Assistant,
+    BudgetedContextLoader,
+    InmemoryContextLoader,
+    JsonlContextLoader,
+    TokenCounter,
+    User,
+)
+
+
+def test_migrate_legacy_context(tmp_path):
+    legacy = tmp_path / "context.json"
+    legacy.write_text(json.dumps([User(content="안녕")]), encoding="utf-8")
+
+    loader = JsonlContextLoader(
+        str(tmp_path / "context.jsonl"), legacy_file_name=str(legacy)
+    )
+
+    assert loader.get_context() == [User(content="안녕")]
+
+
+def test_migrate_truncated_legacy_context(tmp_path):
+    legacy = tmp_path / "context.json"
+    legacy.write_text('[{"role": "user", "content": "안', encoding="utf-8")
+
+    loader = JsonlContextLoader(
+        str(tmp_path / "context.jsonl"), legacy_file_name=str(legacy)
+    )
+
+    assert loader.get_context() == []
+    assert not legacy.exists()
+    assert (tmp_path / "context.json.broken").exists()
+
+
+def budgeted(tmp_path, budget: int, messages) -> BudgetedContextLoader:
+    store = InmemoryContextLoader(10)
+    store.save_contexts(messages)
+    return BudgetedContextLoader(
+        store,
+        budget=budget,
+        summarizer=lambda summary, messages: summary,
+        counter=TokenCounter("gpt-3.5-turbo"),
+        summary_file=str(tmp_path / "context.summary.json"),
+    )
+
+
+def test_broken_summary_file(tmp_path):
+    (tmp_path / "context.summary.json").write_text('{"summary": "', encoding="utf-8")
+    messages = [User(content="안녕"), Assistant(content="네")]
+
+    loader = budgeted(tmp_path, 1000, messages)
+
+    assert loader.summary == ""
+    assert loader.get_context() == messages
+
+
+def test_summary_is_capped_and_last_exchange_kept(tmp_path):
+    summary = "요약" * 1000
+    (tmp_path / "context.summary.json").write_text(
+        json.dumps(dict(summary=summary, saved=4, summarized=0)), encoding="utf-8"
+    )
+    messages = [
+        User(content="첫 질문"),
+        Assistant(content="첫 대답"),
+        User(content="긴 질문" * 100),
+        Assistant(content="긴 대답" * 100),
+    ]
+
+    loader = budgeted(tmp_path, 200, messages)
+    context = loader.get_context()
+
+    assert loader.counter.count_text(loader.summary) <= loader.summary_budget
+    assert context[-2:] == messages[-2:]
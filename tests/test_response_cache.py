@@ -0,0 +1,33 @@
+from ai.response_cache import HashingEmbedder, ResponseCache
+
+
+def make_cache() -> ResponseCache:
+    embedder = HashingEmbedder()
+    return ResponseCache(embedder, dim=embedder.dim)
+
+
+def test_paraphrase_hit():
+    cache = make_cache()
+    cache.put("오늘 날씨 어때", "맑아요")
+    cache.put("내일 서울 날씨 알려줘", "비가 와요")
+
+    assert cache.get("오늘 날씨는 어때?") == "맑아요"
+    assert cache.get("내일 서울 날씨 좀 알려줘") == "비가 와요"
+    assert cache.semantic_hits == 2
+
+
+def test_unrelated_miss():
+    cache = make_cache()
+    cache.put("오늘 날씨 어때", "맑아요")
+
+    assert cache.get("지금 몇 시야") is None
+    assert cache.get("내일 날씨 어때") is None
+    assert cache.misses == 2
+
+
+def test_scope():
+    cache = make_cache()
+    cache.put("오늘 날씨 어때", "맑아요", scope="0")
+
+    assert cache.get("오늘 날씨 어때", scope="1") is None
+    assert cache.get("오늘 날씨 어때", scope="0") == "맑아요"
@@ -0,0 +1,52 @@
+import json
+from typing import Optional
+
+import pytest
+
+
+@pytest.fixture
+def setting_base(tmp_path, monkeypatch):
+    # settings 패키지는 import 할 때 현재 디렉터리의 settings.json을 읽음
+    (tmp_path / "settings.json").write_text(
+        json.dumps(
+            {
+                "OPEN_AI_KEY": "test",
+                "SECRETARY_NAMES": ["비서"],
+                "DISCORD_WEBHOOK_URL": "test",
+                "RECORD_DEVICE": 0,
+            }
+        ),
+        encoding="utf-8",
+    )
+    monkeypatch.chdir(tmp_path)
+    from settings import SettingBase
+
+    return SettingBase
+
+
+def test_json_bool(setting_base):
+    class Sample(setting_base):
+        STT_STREAMING: bool = False
+        TRACING: bool = True
+
+    Sample.load(lambda: json.loads('{"STT_STREAMING": true, "TRACING": false}'))
+    assert Sample.STT_STREAMING is True
+    assert Sample.TRACING is False
+
+
+def test_env_bool_string(setting_base):
+    class Sample(setting_base):
+        STT_STREAMING: bool = False
+
+    Sample.load(lambda: {"STT_STREAMING": "true"})
+    assert Sample.STT_STREAMING is True
+
+
+def test_json_list(setting_base):
+    class Sample(setting_base):
+        RECORD_DEVICES: Optional[list[int]] = None
+
+    Sample.load(lambda: json.loads('{"RECORD_DEVICES": [1, 2]}'))
+    assert Sample.RECORD_DEVICES == [1, 2]
+    Sample.load(lambda: {"RECORD_DEVICES": "1, 2"})
+    assert Sample.RECORD_DEVICES == [1, 2]
@@ -0,0 +1,251 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+from typing import Any, NamedTuple, Optional
+import uuid
+
+# 초 단위 히스토그램 경계
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+
+class Span(NamedTuple):
+    name: str
+    start: float  # time.monotonic()
+    end: float
+    attrs: dict[str, Any]
+
+
+class Trace:
+    """
+    한 발화(턴)의 단계별 구간 기록. end()가 불린 뒤 hold()로 잡아 둔 작업(재생 등)이
+    모두 release() 되면 Tracer에 기록됩니다.
+    """
+
+    def __init__(self, tracer: "Tracer", device: Optional[int]):
+        self.tracer = tracer
+        self.device = device
+        self.id = uuid.uuid4().hex[:12]
+        self.spans: list[Span] = []
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.ended = False
+
+    def add(self, name: str, start: float, end: float, **attrs: Any):
+        with self.lock:
+            self.spans.append(Span(name, start, end, attrs))
+
+    def hold(self):
+        with self.lock:
+            self.pending += 1
+
+    def release(self):
+        with self.lock:
+            self.pending -= 1
+            done = self.ended and self.pending == 0
+        if done:
+            self.tracer.record(self)
+
+    def end(self):
+        with self.lock:
+            self.ended = True
+            done = self.pending == 0
+        if done:
+            self.tracer.record(self)
+
+    def to_dict(self) -> dict[str, Any]:
+        origin = min((span.start for span in self.spans), default=0.0)
+        return dict(
+            trace=self.id,
+            device=self.device,
+            spans=[
+                dict(
+                    name=span.name,
+                    start=round(span.start - origin, 6),
+                    duration=round(span.end - span.start, 6),
+                    **span.attrs,
+                )
+                for span in sorted(self.spans, key=lambda span: span.start)
+            ],
+        )
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def lines(self, name: str, labels: str) -> list[str]:
+        lines = [
+            f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+            for bound, count in zip(self.buckets, self.counts)
+        ]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Tracer:
+    """
+    턴이 끝날 때마다 구간을 단계별 히스토그램에 더하고 trace_file에 JSONL로 남깁니다.
+    serve(port)를 부르면 /metrics 에서 Prometheus 텍스트 형식으로 내보냅니다.
+    """
+
+    metric_name = "secretary_stage_seconds"
+
+    def __init__(
+        self, trace_file: Optional[str], buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.trace_file = trace_file
+        self.buckets = buckets
+        self.histograms: dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def start(self, device: Optional[int] = None) -> Trace:
+        return Trace(self, device)
+
+    def record(self, trace: Trace):
+        # 발화 길이(capture)는 빼고, 녹음이 끝난 뒤부터 마지막 단계까지를 턴 지연으로 봄
+        spans = [span for span in trace.spans if span.name != "capture"]
+        if not spans:
+            return
+        total = max(span.end for span in spans) - min(span.start for span in spans)
+        with self.lock:
+            for span in trace.spans:
+                self.observe(span.name, span.end - span.start)
+            self.observe("turn", total)
+            if self.trace_file:
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def prometheus(self) -> str:
+        lines = [
+            f"# HELP {self.metric_name} Time spent in each stage of a turn.",
+            f"# TYPE {self.metric_name} histogram",
+        ]
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                lines.extend(histogram.lines(self.metric_name, f'stage="{stage}"'))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+current_trace = ContextVar[Optional[Trace]]("current_trace", default=None)
+
+
+@contextmanager
+def use(trace: Optional[Trace]):
+    """다른 태스크/스레드에서 넘겨받은 트레이스를 현재 컨텍스트에 설정합니다."""
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs: Any):
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.monotonic(), **attrs)
+
+
+def add(name: str, start: float, end: float, **attrs: Any):
+    if trace := current_trace.get():
+        trace.add(name, start, end, **attrs)
+
+
+def hold() -> Optional[Trace]:
+    """비동기로 이어지는 작업이 끝날 때까지 현재 트레이스가 기록되지 않도록 잡아 둡니다."""
+    trace = current_trace.get()
+    if trace:
+        trace.hold()
+    return trace
+
+
+def release(trace: Optional[Trace]):
+    if trace:
+        trace.release()
+
+
+def begin(
+    tracer: Optional[Tracer],
+    device: Optional[int],
+    marks: Optional[dict[str, float]] = None,
+) -> Optional[Trace]:
+    """새 트레이스를 만들고 녹음 쪽에서 남긴 시각(RecordedFile.marks)을 구간으로 채웁니다."""
+    if tracer is None:
+        return None
+    trace = tracer.start(device)
+    marks = marks or {}
+    if "speech_start" in marks and "capture_end" in marks:
+        trace.add("capture", marks["speech_start"], marks["capture_end"])
+    # 말이 끝난 뒤 VAD가 끝을 판정하기까지 (hangover 대기 포함)
+    if "speech_end" in marks and "vad_end" in marks:
+        trace.add("vad", marks["speech_end"], marks["vad_end"])
+    return trace
+
+
+def end(trace: Optional[Trace]):
+    if trace:
+        trace.end()
+
+
+@contextmanager
+def turn(
+    tracer: Optional[Tracer],
+    device: Optional[int],
+    marks: Optional[dict[str, float]] = None,
+):
+    """한 턴 동안 현재 컨텍스트에 새 트레이스를 설정합니다."""
+    trace = begin(tracer, device, marks)
+    try:
+        with use(trace):
+            yield trace
+    finally:
+        end(trace)
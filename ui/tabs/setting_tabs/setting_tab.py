@@ -61,7 +61,7 @@ class SettingTab(QWidget):
 
         # STT
         self.stt_combobox = self.create_combobox_row(
-            "STT:", ["local", "remote"], Setting.STT, main_layout
+            "STT:", ["local", "remote", "pool", "faster"], Setting.STT, main_layout
         )
 
         # TTS
@@ -1,4 +1,6 @@
+import asyncio
 from functools import reduce
+import re
 from typing import Callable, Generic, Iterable, TypeVar
 import pyaudio
 import requests
@@ -43,6 +45,30 @@ def is_ai_call(prompt: str):
     raise Exception
 
 
+class SentenceSplitter:
+    """스트리밍으로 들어오는 텍스트를 완성된 문장 단위로 잘라냅니다."""
+
+    # 문장 부호 뒤에 공백이 와야 문장 끝으로 봄 (3.5 같은 숫자는 자르지 않음)
+    pattern = re.compile(r"[.!?。！？…]+(?=\s)|\n")
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        self.buffer += text
+        sentences = []
+        while match := self.pattern.search(self.buffer):
+            sentence = self.buffer[: match.end()].strip()
+            self.buffer = self.buffer[match.end() :]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self) -> list[str]:
+        sentence, self.buffer = self.buffer.strip(), ""
+        return [sentence] if sentence else []
+
+
 def discord_webhook(text: str):
     @threaded
     def inner(content: str):
@@ -58,6 +84,19 @@ def discord_webhook(text: str):
     return inner
 
 
+async def adiscord_webhook(text: str, content: str):
+    from client_loaders import async_http_loader
+
+    if not Setting.DISCORD_WEBHOOK_URL:
+        return content
+    await async_http_loader(asyncio.get_running_loop()).post(
+        Setting.DISCORD_WEBHOOK_URL,
+        json=dict(content=text + "\n" + content),
+        headers={"Content-Type": "application/json"},
+    )
+    return content
+
+
 @threaded
 def play_error_sound(p: pyaudio.PyAudio):
     stream = p.open(format=pyaudio.paFloat32, channels=2, rate=44100, output=True)